@@ -0,0 +1,234 @@
+# ml_api/annotations.py - Inspection annotations stored as data and rendered on demand
+
+"""
+Every inspection used to draw its boxes and the business overlay on a copy
+of the frame and write a full-resolution JPEG, which the storage service
+then copied again - for images that are rarely looked at. An annotation is
+now a small JSON record next to the results:
+
+    {image_id, source_path, frame_shape, class_names, detections, decision, created}
+
+(plus annotated_path when the JPEG was rendered eagerly).
+
+render_annotation() draws it on the source frame (optionally at a thumbnail
+size) exactly like the eager JPEG; AnnotationStore keeps the records and a
+bounded LRU of rendered JPEGs for the annotated-image endpoint
+(/api/ml/annotated/<image_id>/?size=<px>).
+
+ANNOTATION_MODE = 'eager' keeps writing the JPEG on every part.
+"""
+
+import os
+import re
+import glob
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import cv2
+
+from .detections import CLASS_PRESENT, Detections
+from .image_writer import get_image_writer
+
+logger = logging.getLogger(__name__)
+
+# BGR colours: box, label background
+PRESENT_COLORS = ((0, 255, 0), (0, 100, 0))
+MISSING_COLORS = ((0, 0, 255), (0, 0, 100))
+
+RECORD_SUFFIX = re.compile(r'\d{8}_\d{6}_annotation\.json')
+
+
+def build_annotation(image_id, detections, decision, frame_shape, class_names, source_path=None):
+    """JSON-ready annotation record of one inspection"""
+    return {
+        'image_id': image_id,
+        'source_path': source_path,
+        'frame_shape': list(frame_shape[:2]),
+        'class_names': list(class_names),
+        'detections': Detections.coerce(detections).to_dicts(class_names),
+        'decision': {key: decision[key] for key in
+                     ('status', 'action', 'scenario', 'box_color', 'present_count', 'missing_count')},
+        'created': datetime.now().isoformat()
+    }
+
+
+def draw_business_overlay(image, decision, scale=1.0):
+    """Status / action / scenario / nut-count panel in the top-left corner"""
+    box_color, bg_color = PRESENT_COLORS if decision['box_color'] == 'GREEN' else MISSING_COLORS
+    texts = [
+        f"STATUS: {decision['status']}",
+        f"ACTION: {decision['action']}",
+        f"SCENARIO: {decision['scenario']}",
+        f"NUTS: {decision['present_count']} PRESENT, {decision['missing_count']} MISSING"
+    ]
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = 0.7 * scale
+    thickness = max(int(round(2 * scale)), 1)
+
+    max_width = 0
+    total_height = 20 * scale
+    for text in texts:
+        (text_width, text_height), _ = cv2.getTextSize(text, font, font_scale, thickness)
+        max_width = max(max_width, text_width)
+        total_height += text_height + 8 * scale
+
+    margin = int(round(10 * scale))
+    corner = (margin + int(round(max_width + 20 * scale)), margin + int(round(total_height + 10 * scale)))
+    cv2.rectangle(image, (margin, margin), corner, bg_color, -1)
+    cv2.rectangle(image, (margin, margin), corner, box_color, max(int(round(3 * scale)), 1))
+
+    y_offset = 35 * scale
+    for text in texts:
+        cv2.putText(image, text, (int(round(20 * scale)), int(round(y_offset))), font, font_scale,
+                    (255, 255, 255), thickness)
+        y_offset += 30 * scale
+
+
+def render_annotation(image, annotation, max_size=None):
+    """
+    Annotated copy of ``image`` (the frame the annotation was made on)
+
+    With ``max_size`` the frame is downscaled to that longest side first and
+    boxes, lines and text are scaled with it.
+    """
+    scale = 1.0
+    if max_size and max(image.shape[:2]) > max_size:
+        scale = max_size / max(image.shape[:2])
+        annotated = cv2.resize(image, (max(int(image.shape[1] * scale), 1), max(int(image.shape[0] * scale), 1)),
+                               interpolation=cv2.INTER_AREA)
+    else:
+        annotated = image.copy()
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = 0.6 * scale
+    thickness = max(int(round(2 * scale)), 1)
+    for detection in annotation['detections']:
+        x1, y1, x2, y2 = (int(value * scale) for value in detection['bbox'])
+        box_color, bg_color = PRESENT_COLORS if detection['class_id'] == CLASS_PRESENT else MISSING_COLORS
+
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), box_color, max(int(round(4 * scale)), 1))
+
+        # Class label on a background in the box colour
+        label = detection['class_name']
+        (text_width, text_height), _ = cv2.getTextSize(label, font, font_scale, thickness)
+        cv2.rectangle(annotated, (x1, y1 - text_height - int(round(10 * scale))), (x1 + text_width, y1), bg_color, -1)
+        cv2.putText(annotated, label, (x1, y1 - int(round(5 * scale))), font, font_scale, (255, 255, 255), thickness)
+
+    draw_business_overlay(annotated, annotation['decision'], scale)
+    return annotated
+
+
+class AnnotationStore:
+    """Annotation records on disk plus a bounded, thread-safe LRU of rendered JPEGs"""
+
+    def __init__(self, directory, cache_entries=64, jpeg_quality=90):
+        self.directory = directory
+        self.cache_entries = max(1, int(cache_entries))
+        self.jpeg_quality = jpeg_quality
+        self._renders = OrderedDict()  # (record path, max_size) -> JPEG bytes
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.hits = 0
+
+    def save(self, annotation):
+        """Write the record as {image_id}_{timestamp}_annotation.json; returns its path (None on error)"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            path = os.path.join(self.directory, f"{annotation['image_id']}_{timestamp}_annotation.json")
+            temp_path = f'{path}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(annotation, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Error saving annotation for {annotation['image_id']}: {e}")
+            return None
+        # A re-inspection under the same id and second replaces the record: drop its renders
+        with self._lock:
+            for key in [key for key in self._renders if key[0] == path]:
+                del self._renders[key]
+        return path
+
+    def latest(self, image_id):
+        """Path of the newest annotation record of ``image_id`` or None"""
+        pattern = os.path.join(self.directory, f'{glob.escape(image_id)}_*_annotation.json')
+        # Only this id's records, not those of ids it is a prefix of ('A1' vs 'A1_B')
+        paths = [path for path in glob.glob(pattern)
+                 if RECORD_SUFFIX.fullmatch(os.path.basename(path)[len(image_id) + 1:])]
+        return max(paths, key=os.path.getmtime) if paths else None
+
+    def source_pending(self, image_id):
+        """True while the source frame of the newest annotation of ``image_id`` is still being written"""
+        path = self.latest(image_id)
+        if path is None:
+            return False
+        try:
+            with open(path) as f:
+                source_path = json.load(f).get('source_path')
+        except (OSError, ValueError):
+            return False
+        return source_path is not None and get_image_writer().pending(source_path)
+
+    def render_jpeg(self, image_id, max_size=None):
+        """JPEG bytes of the newest annotation of ``image_id`` (rendered once per size), or None"""
+        path = self.latest(image_id)
+        if path is None:
+            return None
+        key = (path, max_size)
+        with self._lock:
+            jpeg = self._renders.get(key)
+            if jpeg is not None:
+                self._renders.move_to_end(key)
+                self.hits += 1
+                return jpeg
+
+        try:
+            with open(path) as f:
+                annotation = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read annotation {path}: {e}")
+            return None
+        source_path = annotation.get('source_path')
+        image = cv2.imread(source_path) if source_path else None
+        if image is not None:
+            rendered = render_annotation(image, annotation, max_size)
+        else:
+            # Eagerly rendered parts (no source file): serve that JPEG (once written), only resized
+            annotated_path = annotation.get('annotated_path')
+            rendered = cv2.imread(annotated_path) if get_image_writer().wait(annotated_path) else None
+            if rendered is None:
+                logger.error(f"Source image for annotation {path} not available: {source_path}")
+                return None
+            if max_size and max(rendered.shape[:2]) > max_size:
+                scale = max_size / max(rendered.shape[:2])
+                rendered = cv2.resize(rendered, (max(int(rendered.shape[1] * scale), 1),
+                                                 max(int(rendered.shape[0] * scale), 1)),
+                                      interpolation=cv2.INTER_AREA)
+
+        ok, encoded = cv2.imencode('.jpg', rendered, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            logger.error(f"Could not encode annotated image for {image_id}")
+            return None
+        jpeg = encoded.tobytes()
+        with self._lock:
+            self.renders += 1
+            self._renders[key] = jpeg
+            self._renders.move_to_end(key)
+            while len(self._renders) > self.cache_entries:
+                self._renders.popitem(last=False)
+        return jpeg
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'cached_renders': len(self._renders),
+                'cache_entries': self.cache_entries,
+                'cached_bytes': sum(len(jpeg) for jpeg in self._renders.values()),
+                'renders': self.renders,
+                'hits': self.hits
+            }
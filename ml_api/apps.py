@@ -1,6 +1,39 @@
+import os
+import sys
+import logging
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Processes that serve inspections; management commands and tests never preload
+SERVER_COMMANDS = ('runserver', 'gunicorn', 'uvicorn', 'daphne', 'waitress', 'hypercorn')
+
+
+def _is_server_process():
+    argv = ' '.join(os.path.basename(arg) for arg in sys.argv[:2])
+    if 'runserver' in argv:
+        # With the autoreloader only the inner (serving) process preloads
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+    return any(command in argv for command in SERVER_COMMANDS)
 
 
 class MlApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ml_api'
+
+    def ready(self):
+        engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+        if not engine_config.get('PRELOAD_ON_STARTUP', True) or not _is_server_process():
+            return
+        if engine_config.get('DAEMON_ENABLED', False):
+            return  # The inference daemon owns the model; web workers only hold a client
+
+        def preload():
+            from .services import enhanced_nut_detection_service
+            enhanced_nut_detection_service.preload(warmup=engine_config.get('WARMUP_ENABLED', True))
+
+        # Load and warm up in the background so the server starts accepting requests immediately
+        threading.Thread(target=preload, name='nut-model-preload', daemon=True).start()
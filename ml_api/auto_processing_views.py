@@ -26,7 +26,7 @@ from .models import (
 )
 
 # Import your enhanced service
-from .services import enhanced_nut_detection_service
+from .services import get_detection_service
 
 logger = logging.getLogger(__name__)
 
@@ -48,7 +48,7 @@ class AutoProcessingWorkflowView(View):
         ).order_by('-created_at')[:10]
         
         # Get processing statistics
-        stats = enhanced_nut_detection_service.get_statistics()
+        stats = get_detection_service().get_statistics()
         
         # Get pending queue count
         pending_count = ProcessingQueue.objects.filter(status='queued').count()
@@ -235,26 +235,22 @@ def capture_and_auto_process(request):
                 'error': 'Failed to capture image from camera'
             }, status=500)
         
-        # Save captured frame
+        # Encode the captured frame in memory (no temporary file round trip)
         import cv2
-        import tempfile
         
-        # Create temporary file
-        temp_file = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
-        cv2.imwrite(temp_file.name, frame)
-        temp_file.close()
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        if not ok:
+            return JsonResponse({
+                'success': False,
+                'error': 'Failed to encode captured image'
+            }, status=500)
         
         # Save to inspection record
-        with open(temp_file.name, 'rb') as f:
-            file_content = ContentFile(f.read())
-            inspection.image_file.save(
-                f'{inspection.image_id}_captured.jpg',
-                file_content,
-                save=True
-            )
-        
-        # Clean up temp file
-        os.unlink(temp_file.name)
+        inspection.image_file.save(
+            f'{inspection.image_id}_captured.jpg',
+            ContentFile(encoded.tobytes()),
+            save=True
+        )
         
         # Update source type
         inspection.source_type = 'camera_capture'
@@ -313,7 +309,7 @@ def process_inspection_background(inspection_id):
         image_path = inspection.image_file.path
         
         # Process with enhanced ML service
-        results = enhanced_nut_detection_service.process_image_with_id(
+        results = get_detection_service().process_image_with_id(
             image_path=image_path,
             image_id=inspection.image_id,
             user_id=inspection.user.id
@@ -487,7 +483,7 @@ def get_processing_statistics(request):
     """
     try:
         # Get ML service statistics
-        ml_stats = enhanced_nut_detection_service.get_statistics()
+        ml_stats = get_detection_service().get_statistics()
         
         # Get database statistics
         total_inspections = InspectionRecord.objects.filter(user=request.user).count()
@@ -0,0 +1,72 @@
+# ml_api/cascade_policy.py - When the remaining detection passes can no longer change the decision
+
+"""
+The full-frame cascade (primary, enhancement, multi-scale, fallback,
+ultra-low / crop verifier) used to escalate whenever fewer than four
+positions were filled. For NG parts that is wasted work: one confident
+MISSING nut already makes the part NG (RED) whatever the other positions
+turn out to be, because later passes only add detections at other positions.
+
+Stopping on a confident MISSING nut is opt-in (EARLY_TERMINATION): such a
+part has unfilled positions, so it is reported as NUTS_MISSING instead of
+the INCOMPLETE_DETECTION the full cascade would give it.
+
+Under load (ml_api.load_monitor) the policy also carries the degraded
+profile's allowed passes; every other pass is skipped with reason
+'degraded_profile'.
+
+CascadePolicy.stop_reason() is asked before every pass; a non-None reason
+skips the pass and is counted per reason and pass in the service statistics
+(stats['early_termination'][reason][pass]) and kept on the policy
+(policy.skipped), so an inspection knows whether the degraded profile
+actually dropped a pass or every pass it needed still ran.
+"""
+
+from .detections import CLASS_MISSING
+
+ALL_POSITIONS_FOUND = 'all_positions_found'
+CONFIDENT_MISSING = 'confident_missing'
+DEGRADED_PROFILE = 'degraded_profile'
+
+
+class CascadePolicy:
+    """Stop rules for one inspection, built from the service config snapshot"""
+
+    def __init__(self, expected_nuts=4, early_termination=True, missing_confidence=0.5, allowed_passes=None):
+        self.expected_nuts = expected_nuts
+        self.early_termination = early_termination
+        self.missing_confidence = missing_confidence
+        self.allowed_passes = None if allowed_passes is None else frozenset(allowed_passes)
+        self.skipped = {}  # reason -> [pass names], filled by the service as passes are skipped
+
+    @classmethod
+    def from_config(cls, config, degraded=False):
+        return cls(
+            expected_nuts=config['expected_nuts'],
+            early_termination=config['early_termination'],
+            missing_confidence=config['early_stop_missing_confidence'],
+            allowed_passes=config['qos_degraded_passes'] if degraded else None
+        )
+
+    @property
+    def degraded_skips(self):
+        """Passes the degraded profile skipped (empty when the inspection was complete)"""
+        return self.skipped.get(DEGRADED_PROFILE, [])
+
+    def stop_reason(self, detections, pass_name=None):
+        """Why ``pass_name`` should be skipped (the decision is settled, or the profile excludes it), or None"""
+        # Every position is filled: the decision is made (the cascade's original rule)
+        if len(detections) >= self.expected_nuts:
+            return ALL_POSITIONS_FOUND
+        if self.early_termination:
+            # A confident MISSING nut stays in the final ranking (later passes only fill other
+            # positions), so the part is NG whatever they find
+            missing = detections.class_ids == CLASS_MISSING
+            if missing.any() and detections.confidences[missing].max() >= self.missing_confidence:
+                return CONFIDENT_MISSING
+        if self.allowed_passes is not None and pass_name is not None:
+            # Per-size passes ('multi_scale_800') belong to the 'multi_scale' stage
+            stage = 'multi_scale' if pass_name.startswith('multi_scale') else pass_name
+            if stage not in self.allowed_passes:
+                return DEGRADED_PROFILE
+        return None
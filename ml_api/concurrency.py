@@ -0,0 +1,76 @@
+# ml_api/concurrency.py - Lock-free statistics for the shared detection service
+
+import threading
+
+
+class ThreadLocalCounters:
+    """
+    Counters that each thread increments in its own dict; merged on read
+
+    Writers never take a lock, so concurrent inspections cannot lose updates
+    (``stats[key] += 1`` on a shared dict can). Keys are strings, or tuples
+    for nested counters: ('multi_scale_stats', '480', 'runs') is reported as
+    stats['multi_scale_stats']['480']['runs'].
+
+    The trigger path starts a new thread per part, so counts of finished
+    threads are folded into a single 'retired' dict instead of being kept
+    per thread.
+    """
+
+    RETIRE_THRESHOLD = 32  # Fold finished threads once this many are registered
+
+    def __init__(self, template=None):
+        self._template = dict(template or {})
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._registered = []  # (thread, counts) for every thread that has counted something
+        self._retired = {}
+
+    def _counts(self):
+        counts = getattr(self._local, 'counts', None)
+        if counts is None:
+            counts = self._local.counts = {}
+            with self._lock:
+                self._registered.append((threading.current_thread(), counts))
+                if len(self._registered) > self.RETIRE_THRESHOLD:
+                    self._retire_finished()
+        return counts
+
+    def _retire_finished(self):
+        """Fold the counts of finished threads into the retired totals (lock held)"""
+        alive = []
+        for thread, counts in self._registered:
+            if thread.is_alive():
+                alive.append((thread, counts))
+            else:
+                for key, value in counts.copy().items():
+                    self._retired[key] = self._retired.get(key, 0) + value
+        self._registered = alive
+
+    def add(self, key, amount=1):
+        counts = self._counts()
+        counts[key] = counts.get(key, 0) + amount
+
+    def totals(self):
+        """Flat merged totals (tuple keys kept as tuples)"""
+        with self._lock:
+            self._retire_finished()
+            merged = dict(self._retired)
+            for _, counts in self._registered:
+                # dict.copy() is atomic under the GIL, so the owner thread can keep counting
+                for key, value in counts.copy().items():
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def snapshot(self):
+        """Merged totals in the template's shape, tuple keys expanded into nested dicts"""
+        stats = {key: (dict(value) if isinstance(value, dict) else value) for key, value in self._template.items()}
+        for key, value in self.totals().items():
+            if isinstance(key, tuple):
+                node = stats
+                for part in key[:-1]:
+                    node = node.setdefault(part, {})
+                node[key[-1]] = node.get(key[-1], 0) + value
+            else:
+                stats[key] = stats.get(key, 0) + value
+        return stats
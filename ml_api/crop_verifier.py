@@ -0,0 +1,161 @@
+# ml_api/crop_verifier.py - Second-stage PRESENT/MISSING classifier for single nut crops
+
+"""
+When the detector leaves positions unfilled, the pipeline used to re-run it
+over the whole frame at confidence 0.1 and 0.05. Those passes are slow and
+mostly add noise boxes. A CropVerifier classifies only the candidate crops
+instead: the low-confidence boxes the detector already produced, plus the
+registered fixture regions (ml_api.fixture_layout) where no nut was found.
+
+The model is a logistic regression over HOG + coarse intensity features of a
+32x32 grayscale crop, so one crop costs microseconds. Train it on stored
+inspections with
+
+    python manage.py train_crop_verifier
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CROP_SIZE = 32
+CELL_SIZE = 8
+ORIENTATION_BINS = 9
+CONTEXT = 0.15  # Crop padding per side, fraction of the box size (keeps the nut rim in view)
+
+_CELLS = CROP_SIZE // CELL_SIZE
+FEATURE_SIZE = (_CELLS - 1) ** 2 * 4 * ORIENTATION_BINS + 64
+
+
+def _hog(crop):
+    """
+    HOG of a CROP_SIZE grayscale crop: unsigned gradients, 8x8 cells, L2-normalised 2x2 blocks
+
+    Written out in NumPy because cv2.HOGDescriptor is not part of every
+    OpenCV build.
+    """
+    crop = crop.astype(np.float32)
+    magnitude, angle = cv2.cartToPolar(cv2.Sobel(crop, cv2.CV_32F, 1, 0, ksize=1),
+                                       cv2.Sobel(crop, cv2.CV_32F, 0, 1, ksize=1))
+    bins = ((angle % np.pi) / np.pi * ORIENTATION_BINS).astype(np.int64) % ORIENTATION_BINS
+    cell_index = (np.arange(CROP_SIZE) // CELL_SIZE)
+    flat_index = (cell_index[:, None] * _CELLS + cell_index[None, :]) * ORIENTATION_BINS + bins
+    histogram = np.bincount(flat_index.ravel(), weights=magnitude.ravel(),
+                            minlength=_CELLS * _CELLS * ORIENTATION_BINS).reshape(_CELLS, _CELLS, ORIENTATION_BINS)
+    blocks = np.stack([histogram[:-1, :-1], histogram[:-1, 1:], histogram[1:, :-1], histogram[1:, 1:]], axis=2)
+    blocks = blocks.reshape(_CELLS - 1, _CELLS - 1, -1)
+    blocks /= np.sqrt((blocks ** 2).sum(axis=2, keepdims=True)) + 1e-6
+    return blocks.ravel()
+
+
+def crop_features(image, boxes, context=CONTEXT):
+    """Feature matrix (one row per box) for the padded crops of a BGR or grayscale frame"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape[:2]
+
+    features = []
+    for x1, y1, x2, y2 in boxes.tolist():
+        pad_x, pad_y = (x2 - x1) * context, (y2 - y1) * context
+        left, top = max(int(x1 - pad_x), 0), max(int(y1 - pad_y), 0)
+        right, bottom = min(int(np.ceil(x2 + pad_x)), width), min(int(np.ceil(y2 + pad_y)), height)
+        if right - left < 2 or bottom - top < 2:
+            crop = np.zeros((CROP_SIZE, CROP_SIZE), dtype=np.uint8)
+        else:
+            crop = cv2.resize(gray[top:bottom, left:right], (CROP_SIZE, CROP_SIZE), interpolation=cv2.INTER_AREA)
+
+        hog = _hog(crop)
+        # Contrast-normalised 8x8 thumbnail: HOG alone ignores whether the centre is dark (empty hole) or bright
+        thumbnail = cv2.resize(crop, (8, 8), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+        thumbnail = (thumbnail - thumbnail.mean()) / (thumbnail.std() + 1e-6)
+        features.append(np.concatenate([hog, thumbnail]))
+
+    if not features:
+        return np.zeros((0, FEATURE_SIZE), dtype=np.float32)
+    return np.asarray(features, dtype=np.float32)
+
+
+class CropVerifier:
+    """Logistic regression giving P(PRESENT) for nut crops"""
+
+    def __init__(self, weights, bias, mean, std, metadata=None):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.metadata = dict(metadata or {})
+
+    @classmethod
+    def train(cls, features, labels, epochs=500, learning_rate=0.1, l2=1e-3):
+        """
+        Fit on feature rows with labels 1 = PRESENT, 0 = MISSING
+
+        Full-batch gradient descent with balanced class weights, so a set
+        dominated by OK parts still learns the MISSING class.
+        """
+        features = np.asarray(features, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.float64)
+        if len(np.unique(labels)) < 2:
+            raise ValueError("Training needs both PRESENT and MISSING crops")
+
+        mean = features.mean(axis=0)
+        std = features.std(axis=0) + 1e-6
+        x = (features - mean) / std
+        positives = labels.sum()
+        sample_weights = np.where(labels == 1, len(labels) / (2 * positives), len(labels) / (2 * (len(labels) - positives)))
+
+        weights = np.zeros(x.shape[1])
+        bias = 0.0
+        for _ in range(epochs):
+            probabilities = 1 / (1 + np.exp(-(x @ weights + bias)))
+            error = (probabilities - labels) * sample_weights / len(labels)
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum()
+
+        return cls(weights, bias, mean, std, {
+            'trained_at': datetime.now().isoformat(),
+            'samples': int(len(labels)),
+            'present_samples': int(positives),
+            'epochs': epochs
+        })
+
+    def probabilities(self, features):
+        """P(PRESENT) per feature row"""
+        features = np.asarray(features, dtype=np.float32)
+        if not len(features):
+            return np.zeros(0, dtype=np.float32)
+        logits = ((features - self.mean) / self.std) @ self.weights + self.bias
+        return (1 / (1 + np.exp(-np.clip(logits, -50, 50)))).astype(np.float32)
+
+    def predict(self, image, boxes):
+        """P(PRESENT) for each box of a frame"""
+        return self.probabilities(crop_features(image, boxes))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(f, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                     metadata=json.dumps(self.metadata))
+
+    @classmethod
+    def load(cls, path):
+        """Load a trained verifier; None if there is none (the ultra-low passes are used instead)"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                verifier = cls(data['weights'], data['bias'], data['mean'], data['std'],
+                               json.loads(str(data['metadata'])))
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Invalid crop verifier {path}: {e}")
+            return None
+        if verifier.weights.shape != (FEATURE_SIZE,):
+            logger.error(f"Crop verifier {path} does not match the current feature layout")
+            return None
+        return verifier
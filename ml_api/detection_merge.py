@@ -0,0 +1,191 @@
+# ml_api/detection_merge.py - Vectorized merging of detection candidates
+
+"""
+NumPy merge engine for nut detection candidates.
+
+All functions work on (N, 4) arrays of [x1, y1, x2, y2] boxes. The IoU of a
+whole candidate set is computed in one vectorized operation; only the greedy
+keep/suppress decision walks the (small) candidate list.
+
+- greedy_nms: same result as sorting by confidence and keeping every box that
+  does not overlap an already kept box (FlexibleNutDetectionService's
+  _filter_and_rank_detections behaviour)
+- select_non_overlapping: same result as appending candidates one by one when
+  they do not overlap the existing detections (the former per-candidate overlap loop)
+- weighted_box_fusion / fuse_into_existing: optional mode that averages the
+  coordinates of overlapping boxes instead of discarding them
+"""
+
+import numpy as np
+
+
+def as_boxes(boxes):
+    """Convert a list of [x1, y1, x2, y2] boxes (or an array) to an (N, 4) float64 array"""
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def box_iou_matrix(boxes_a, boxes_b):
+    """
+    Pairwise Intersection over Union between two sets of boxes
+
+    Returns an (N, M) array. Non-overlapping pairs and zero-area unions give 0.0,
+    matching the former per-pair IoU of FlexibleNutDetectionService.
+    """
+    boxes_a = as_boxes(boxes_a)
+    boxes_b = as_boxes(boxes_b)
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float64)
+
+    # Contiguous coordinate columns make the outer products much cheaper than strided broadcasting
+    ax1, ay1, ax2, ay2 = np.ascontiguousarray(boxes_a.T)
+    bx1, by1, bx2, by2 = np.ascontiguousarray(boxes_b.T)
+
+    inter_w = np.minimum.outer(ax2, bx2)
+    inter_w -= np.maximum.outer(ax1, bx1)
+    np.clip(inter_w, 0, None, out=inter_w)
+    inter_h = np.minimum.outer(ay2, by2)
+    inter_h -= np.maximum.outer(ay1, by1)
+    np.clip(inter_h, 0, None, out=inter_h)
+    intersection = inter_w
+    intersection *= inter_h
+
+    union = np.add.outer((ax2 - ax1) * (ay2 - ay1), (bx2 - bx1) * (by2 - by1))
+    union -= intersection
+
+    iou = np.zeros_like(intersection)
+    np.divide(intersection, union, out=iou, where=(intersection > 0) & (union > 0))
+    return iou
+
+
+def greedy_nms(boxes, scores, iou_threshold, max_keep=None):
+    """
+    Greedy non-maximum suppression
+
+    Boxes are visited in descending score order (ties keep input order) and a box
+    is kept unless its IoU with an already kept box is above ``iou_threshold``.
+    Returns the kept indices into the input, highest score first.
+    """
+    boxes = as_boxes(boxes)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    order = np.argsort(-scores, kind='stable')
+    overlaps = box_iou_matrix(boxes, boxes) > iou_threshold
+
+    keep = []
+    remaining = order
+    while remaining.size:
+        best = remaining[0]
+        keep.append(best)
+        if max_keep is not None and len(keep) >= max_keep:
+            break
+        # Only kept boxes suppress others
+        rest = remaining[1:]
+        remaining = rest[~overlaps[best, rest]]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def select_non_overlapping(candidate_boxes, existing_boxes, iou_threshold):
+    """
+    Decide which candidates to append to an existing detection list
+
+    Candidates are considered in input order; each one is accepted unless it
+    overlaps (IoU above ``iou_threshold``) an existing box or a candidate
+    accepted before it. Returns a boolean mask over the candidates.
+    """
+    candidate_boxes = as_boxes(candidate_boxes)
+    existing_boxes = as_boxes(existing_boxes)
+    accepted = np.ones(len(candidate_boxes), dtype=bool)
+    if len(candidate_boxes) == 0:
+        return accepted
+
+    if len(existing_boxes):
+        accepted &= ~(box_iou_matrix(candidate_boxes, existing_boxes) > iou_threshold).any(axis=1)
+
+    # Walk the surviving candidates in order; each accepted one removes the later ones it overlaps
+    overlaps = box_iou_matrix(candidate_boxes, candidate_boxes) > iou_threshold
+    pending = np.flatnonzero(accepted)
+    accepted[:] = False
+    while pending.size:
+        current = pending[0]
+        accepted[current] = True
+        rest = pending[1:]
+        pending = rest[~overlaps[current, rest]]
+
+    return accepted
+
+
+def weighted_box_fusion(boxes, scores, iou_threshold):
+    """
+    Weighted box fusion of one candidate set
+
+    Boxes are clustered greedily in descending score order against the running
+    fused box of each cluster; each cluster's box is the score-weighted mean of
+    its members. Returns (fused_boxes, cluster_scores, representatives) where
+    cluster_scores is the best member score and representatives the index of
+    that member, all ordered by cluster score (highest first).
+    """
+    boxes = as_boxes(boxes)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if len(boxes) == 0:
+        return np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    order = np.argsort(-scores, kind='stable')
+    fused_boxes = np.zeros((len(boxes), 4), dtype=np.float64)
+    weight_totals = np.zeros(len(boxes), dtype=np.float64)
+    representatives = []
+
+    for index in order:
+        clusters = len(representatives)
+        if clusters:
+            ious = box_iou_matrix(boxes[index], fused_boxes[:clusters])[0]
+            best = int(np.argmax(ious))
+            if ious[best] > iou_threshold:
+                total = weight_totals[best] + scores[index]
+                if total > 0:
+                    fused_boxes[best] = (fused_boxes[best] * weight_totals[best] + boxes[index] * scores[index]) / total
+                weight_totals[best] = total
+                continue
+        fused_boxes[clusters] = boxes[index]
+        weight_totals[clusters] = scores[index]
+        representatives.append(index)
+
+    fused_boxes = fused_boxes[:len(representatives)]
+    representatives = np.asarray(representatives, dtype=np.int64)
+    # Clusters are created in descending score order, so they are already ranked
+    return fused_boxes, scores[representatives], representatives
+
+
+def fuse_into_existing(existing_boxes, existing_weights, candidate_boxes, candidate_scores, iou_threshold):
+    """
+    Weighted-box-fusion counterpart of select_non_overlapping
+
+    Each candidate (in input order) that overlaps an existing or previously
+    accepted box is averaged into the best-matching one, weighted by score;
+    the others are appended. Returns (boxes, weights, assignment) where
+    assignment[i] is the row candidate i was fused into, or -1 if it was appended
+    (appended candidates occupy the rows after the existing ones, in order).
+    """
+    boxes = [box for box in as_boxes(existing_boxes)]
+    weights = [float(w) for w in np.asarray(existing_weights, dtype=np.float64).reshape(-1)]
+    candidate_boxes = as_boxes(candidate_boxes)
+    candidate_scores = np.asarray(candidate_scores, dtype=np.float64).reshape(-1)
+    assignment = np.full(len(candidate_boxes), -1, dtype=np.int64)
+
+    for i, (box, score) in enumerate(zip(candidate_boxes, candidate_scores)):
+        if boxes:
+            ious = box_iou_matrix(box, np.asarray(boxes))[0]
+            best = int(np.argmax(ious))
+            if ious[best] > iou_threshold:
+                total = weights[best] + score
+                if total > 0:
+                    boxes[best] = (boxes[best] * weights[best] + box * score) / total
+                weights[best] = total
+                assignment[i] = best
+                continue
+        boxes.append(box.copy())
+        weights.append(float(score))
+
+    return as_boxes(boxes), np.asarray(weights, dtype=np.float64), assignment
@@ -0,0 +1,154 @@
+# ml_api/detections.py - Columnar detection container used by the nut detection pipeline
+
+import numpy as np
+
+CLASS_MISSING = 0
+CLASS_PRESENT = 1
+DEFAULT_CLASS_NAMES = ['MISSING', 'PRESENT']
+
+
+class Detections:
+    """
+    Compact, NumPy-backed set of detections
+
+    - boxes:       (N, 4) float32 [x1, y1, x2, y2] in original-image coordinates
+    - confidences: (N,) float32
+    - class_ids:   (N,) int64 (MISSING=0, PRESENT=1)
+    - methods:     (N,) object array with the pass that produced each box
+    - weights:     optional (N,) float64 accumulated fusion weights ('wbf' merge mode)
+
+    Results are filled with one bulk tensor-to-NumPy conversion per model result;
+    per-box dicts are only built at the JSON boundary by to_dicts().
+    """
+
+    __slots__ = ('boxes', 'confidences', 'class_ids', 'methods', 'weights')
+
+    def __init__(self, boxes=None, confidences=None, class_ids=None, methods=None, weights=None):
+        self.boxes = np.asarray(boxes if boxes is not None else [], dtype=np.float32).reshape(-1, 4)
+        count = len(self.boxes)
+        self.confidences = np.asarray(confidences if confidences is not None else [], dtype=np.float32).reshape(count)
+        self.class_ids = np.asarray(class_ids if class_ids is not None else [], dtype=np.int64).reshape(count)
+        if methods is None or isinstance(methods, str):
+            methods = [methods or 'unknown'] * count
+        self.methods = np.asarray(methods, dtype=object).reshape(count)
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64).reshape(count)
+
+    @classmethod
+    def empty(cls):
+        return cls()
+
+    @classmethod
+    def from_ultralytics(cls, result, method='unknown', valid_classes=(CLASS_MISSING, CLASS_PRESENT)):
+        """Build from one Ultralytics Results object with a single bulk conversion"""
+        boxes = getattr(result, 'boxes', None)
+        if boxes is None or len(boxes) == 0:
+            return cls.empty()
+
+        data = boxes.data
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        data = np.asarray(data, dtype=np.float32)
+        data = data.reshape(-1, data.shape[-1])
+
+        # Ultralytics rows are [x1, y1, x2, y2, (track_id,) conf, cls]
+        detections = cls(data[:, :4], data[:, -2], data[:, -1].astype(np.int64), method)
+        return detections.filter(np.isin(detections.class_ids, valid_classes))
+
+    @classmethod
+    def from_dicts(cls, detections):
+        """Build from the legacy list-of-dicts format ({'class_id', 'confidence', 'bbox', ...})"""
+        if not detections:
+            return cls.empty()
+        return cls(
+            [d['bbox'] for d in detections],
+            [d['confidence'] for d in detections],
+            [d['class_id'] for d in detections],
+            [d.get('detection_method', 'unknown') for d in detections],
+        )
+
+    @classmethod
+    def coerce(cls, detections):
+        """Accept either a Detections instance or the legacy list of dicts"""
+        if isinstance(detections, cls):
+            return detections
+        return cls.from_dicts(detections)
+
+    @classmethod
+    def concat(cls, parts):
+        parts = [p for p in parts if p is not None and len(p)]
+        if not parts:
+            return cls.empty()
+        weights = None
+        if any(p.weights is not None for p in parts):
+            weights = np.concatenate([p.fusion_weights() for p in parts])
+        return cls(
+            np.concatenate([p.boxes for p in parts]),
+            np.concatenate([p.confidences for p in parts]),
+            np.concatenate([p.class_ids for p in parts]),
+            np.concatenate([p.methods for p in parts]),
+            weights,
+        )
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __getitem__(self, index):
+        """Index with a slice, an index array or a boolean mask; always returns Detections"""
+        if isinstance(index, (int, np.integer)):
+            index = [index]
+        return Detections(
+            self.boxes[index],
+            self.confidences[index],
+            self.class_ids[index],
+            self.methods[index],
+            None if self.weights is None else self.weights[index],
+        )
+
+    def filter(self, mask):
+        return self[np.asarray(mask, dtype=bool)]
+
+    def with_method(self, method):
+        return Detections(self.boxes, self.confidences, self.class_ids, method, self.weights)
+
+    def fusion_weights(self):
+        """Accumulated fusion weights (defaults to the confidences)"""
+        if self.weights is None:
+            return self.confidences.astype(np.float64)
+        return self.weights
+
+    def sorted_by_confidence(self):
+        """Highest confidence first; ties keep their current order"""
+        return self[np.argsort(-self.confidences, kind='stable')]
+
+    def count(self, class_id):
+        return int(np.count_nonzero(self.class_ids == class_id))
+
+    def centers(self):
+        return np.stack([(self.boxes[:, 0] + self.boxes[:, 2]) / 2,
+                         (self.boxes[:, 1] + self.boxes[:, 3]) / 2], axis=1)
+
+    def sizes(self):
+        return np.stack([self.boxes[:, 2] - self.boxes[:, 0],
+                         self.boxes[:, 3] - self.boxes[:, 1]], axis=1)
+
+    def position_order(self):
+        """Indices sorting the detections top-left to bottom-right (by y1, then x1)"""
+        return np.lexsort((self.boxes[:, 0], self.boxes[:, 1]))
+
+    def to_dicts(self, class_names=DEFAULT_CLASS_NAMES, include_method=False):
+        """Materialize JSON-ready dicts (plain Python numbers)"""
+        boxes = self.boxes.tolist()
+        confidences = self.confidences.tolist()
+        class_ids = self.class_ids.tolist()
+        results = []
+        for i in range(len(boxes)):
+            detection = {
+                'class_id': class_ids[i],
+                'class_name': class_names[class_ids[i]],
+                'confidence': confidences[i],
+                'bbox': boxes[i]
+            }
+            if include_method:
+                detection['detection_method'] = self.methods[i]
+            results.append(detection)
+        return results
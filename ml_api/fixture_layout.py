@@ -0,0 +1,121 @@
+# ml_api/fixture_layout.py - Registered fixture layout: where the four nuts sit in the frame
+
+"""
+Parts sit in a fixed fixture, so each nut lands in nearly the same pixel
+region every time. A FixtureLayout stores those regions (nut1..nut4, ordered
+top-left to bottom-right like _prepare_nut_results) for a reference frame
+size. It is registered once with
+
+    python manage.py register_fixture_layout --image <reference image>
+
+and used by FlexibleNutDetectionService for ROI inference (only padded crops
+around the regions are sent to the model) and for stable nut position
+assignment.
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ASPECT_TOLERANCE = 0.02  # Frames whose aspect ratio differs more than this do not use the layout
+
+
+class FixtureLayout:
+    """Nut regions ([x1, y1, x2, y2] per nut, in nut1..nutN order) for a registered frame size"""
+
+    def __init__(self, regions, frame_shape, reference_image=None, created=None):
+        self.regions = np.asarray(regions, dtype=np.float64).reshape(-1, 4)
+        self.frame_shape = tuple(int(v) for v in frame_shape[:2])  # (height, width)
+        self.reference_image = reference_image
+        self.created = created or datetime.now().isoformat()
+
+    def __len__(self):
+        return len(self.regions)
+
+    @classmethod
+    def from_boxes(cls, boxes, frame_shape, reference_image=None):
+        """Order boxes top-left to bottom-right (by y1, then x1) as nut1..nutN"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        order = np.lexsort((boxes[:, 0], boxes[:, 1]))
+        return cls(boxes[order], frame_shape, reference_image)
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved layout; None if there is none (ROI mode then stays off)"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            return cls(data['regions'], data['frame_shape'], data.get('reference_image'), data.get('created'))
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Invalid fixture layout {path}: {e}")
+            return None
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'regions': self.regions.round(1).tolist(),
+                'frame_shape': list(self.frame_shape),
+                'reference_image': self.reference_image,
+                'created': self.created
+            }, f, indent=2)
+
+    def regions_for(self, frame_shape):
+        """Regions scaled to ``frame_shape``; None if its aspect ratio does not match the registration"""
+        height, width = frame_shape[:2]
+        ref_height, ref_width = self.frame_shape
+        if abs((width / height) / (ref_width / ref_height) - 1) > ASPECT_TOLERANCE:
+            return None
+        scale = np.array([width / ref_width, height / ref_height] * 2)
+        return self.regions * scale
+
+    def crop_windows(self, frame_shape, margin):
+        """
+        Integer crop windows around each region, padded by ``margin`` x region size per side
+
+        Returns an (N, 4) int array clipped to the frame, or None if the frame
+        does not match the layout.
+        """
+        regions = self.regions_for(frame_shape)
+        if regions is None:
+            return None
+        sizes = regions[:, 2:] - regions[:, :2]
+        windows = np.concatenate([regions[:, :2] - sizes * margin, regions[:, 2:] + sizes * margin], axis=1)
+        height, width = frame_shape[:2]
+        windows[:, [0, 2]] = np.clip(windows[:, [0, 2]], 0, width)
+        windows[:, [1, 3]] = np.clip(windows[:, [1, 3]], 0, height)
+        return np.round(windows).astype(np.int64)
+
+    def assign(self, boxes, frame_shape, margin=0.25):
+        """
+        Region index for each box (nearest region centre containing the box centre), -1 if none
+
+        Regions are grown by ``margin`` x region size per side so a part that
+        sits slightly off its registered position still matches. Returns None
+        if the frame does not match the layout.
+        """
+        regions = self.regions_for(frame_shape)
+        if regions is None:
+            return None
+        sizes = regions[:, 2:] - regions[:, :2]
+        regions = np.concatenate([regions[:, :2] - sizes * margin, regions[:, 2:] + sizes * margin], axis=1)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if not len(boxes):
+            return np.zeros(0, dtype=np.int64)
+
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        region_centers = (regions[:, :2] + regions[:, 2:]) / 2
+        inside = ((centers[:, None, :] >= regions[None, :, :2]) &
+                  (centers[:, None, :] <= regions[None, :, 2:])).all(axis=2)
+        distances = np.linalg.norm(centers[:, None, :] - region_centers[None, :, :], axis=2)
+        distances[~inside] = np.inf
+        assignment = distances.argmin(axis=1)
+        assignment[~inside.any(axis=1)] = -1
+        return assignment
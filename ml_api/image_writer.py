@@ -0,0 +1,225 @@
+# ml_api/image_writer.py - Background image encoding and writing off the inspection path
+
+"""
+cv2.imwrite used to run synchronously wherever a frame was saved - the
+trigger handler even wrote the frame before inference could start, only so
+the file could be read back. ImageWriter encodes and writes on a small
+thread pool instead:
+
+    handle = get_image_writer().submit(frame, path, 'original')
+    ...                        # inference runs on ``frame`` meanwhile
+    handle.result()            # final path, once the file is on disk
+
+- Each artifact ('original', 'capture', 'result') has its own format:
+  JPEG with a quality, lossless PNG, or WebP (quality > 100 = lossless).
+  The extension of ``path`` is replaced by the format's, so callers use
+  handle.path.
+- At most ``max_queue`` images are pending; submit() blocks beyond that, so
+  a slow disk throttles the producers instead of growing memory.
+- Files are written to a temporary name and renamed, so readers never see a
+  partial image; wait(path) blocks until a pending write of ``path`` is done.
+
+The frame is referenced, not copied: callers must not modify it afterwards.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'jpeg': '.jpg',
+    'png': '.png',
+    'webp': '.webp',
+}
+
+DEFAULT_ARTIFACT_FORMATS = {
+    'original': {'format': 'jpeg', 'quality': 95},   # Trigger / camera frames (inspection input)
+    'capture': {'format': 'jpeg', 'quality': 95},    # Manual captures
+    'result': {'format': 'jpeg', 'quality': 95},     # Annotated result images
+}
+
+
+def encode_params(spec):
+    """(extension, cv2.imencode params) of an artifact format spec"""
+    image_format = spec.get('format', 'jpeg')
+    if image_format not in FORMATS:
+        raise ValueError(f"Unknown image format '{image_format}' (expected one of {sorted(FORMATS)})")
+    if image_format == 'jpeg':
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(spec.get('quality', 95))]
+    elif image_format == 'png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(spec.get('compression', 1))]
+    else:
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(spec.get('quality', 101))]
+    return FORMATS[image_format], params
+
+
+class WriteHandle:
+    """Pending write: ``path`` is known at once, result() waits for the file (raises on failure)"""
+
+    __slots__ = ('path', 'artifact', '_future')
+
+    def __init__(self, path, artifact, future):
+        self.path = path
+        self.artifact = artifact
+        self._future = future
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+
+class ImageWriter:
+    """Bounded pool that encodes and writes images in the background"""
+
+    def __init__(self, workers=2, max_queue=32, artifact_formats=None, window=200):
+        self.formats = {artifact: encode_params(spec) for artifact, spec in
+                        {**DEFAULT_ARTIFACT_FORMATS, **(artifact_formats or {})}.items()}
+        self.max_queue = max(1, int(max_queue))
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='image-writer')
+        self._lock = threading.Lock()
+        self._pending = {}  # path -> (submit number, future)
+        self._encode_times = deque(maxlen=window)
+        self._write_times = deque(maxlen=window)
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.bytes_written = 0
+        self.blocked = 0  # submit() calls that waited for a free queue slot
+
+    def path_for(self, path, artifact='original'):
+        """``path`` with the extension of the artifact's format"""
+        extension, _ = self.formats[artifact]
+        return os.path.splitext(path)[0] + extension
+
+    def submit(self, image, path, artifact='original'):
+        """Queue ``image`` for writing to path_for(path, artifact); returns a WriteHandle"""
+        if artifact not in self.formats:
+            raise ValueError(f"Unknown artifact '{artifact}' (expected one of {sorted(self.formats)})")
+        path = self.path_for(path, artifact)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.blocked += 1
+            self._slots.acquire()
+        with self._lock:
+            self.submitted += 1
+            try:
+                future = self._executor.submit(self._write, image, path, artifact, self.submitted)
+            except RuntimeError:
+                self._slots.release()
+                raise
+            self._pending[path] = (self.submitted, future)
+        return WriteHandle(path, artifact, future)
+
+    def write(self, image, path, artifact='original', timeout=None):
+        """Synchronous write through the pool (same formats and metrics); returns the final path"""
+        return self.submit(image, path, artifact).result(timeout)
+
+    def pending(self, path):
+        """True while a write of ``path`` is queued or running"""
+        with self._lock:
+            _, future = self._pending.get(path, (None, None))
+        return future is not None and not future.done()
+
+    def wait(self, path, timeout=None):
+        """Block until a pending write of ``path`` has finished (no-op if none); True if the file exists"""
+        with self._lock:
+            _, future = self._pending.get(path, (None, None))
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass  # Logged by _write
+        return path is not None and os.path.exists(path)
+
+    def flush(self, timeout=None):
+        """Wait for every write submitted so far"""
+        with self._lock:
+            futures = [future for _, future in self._pending.values()]
+        for future in futures:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+
+    def _write(self, image, path, artifact, number):
+        extension, params = self.formats[artifact]
+        try:
+            started_at = time.perf_counter()
+            ok, encoded = cv2.imencode(extension, image, params)
+            if not ok:
+                raise OSError(f"could not encode {extension}")
+            encoded_at = time.perf_counter()
+
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            temp_path = f'{path}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(encoded.tobytes())
+            os.replace(temp_path, path)
+
+            with self._lock:
+                self._encode_times.append(encoded_at - started_at)
+                self._write_times.append(time.perf_counter() - encoded_at)
+                self.written += 1
+                self.bytes_written += encoded.size
+            return path
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Error writing {artifact} image {path}: {e}")
+            raise
+        finally:
+            # Before the future completes, so a caller that waited on it sees the queue without this write
+            self._slots.release()
+            with self._lock:
+                if self._pending.get(path, (None,))[0] == number:
+                    del self._pending[path]
+
+    def metrics(self):
+        with self._lock:
+            encode_ms = np.asarray(self._encode_times) * 1000
+            write_ms = np.asarray(self._write_times) * 1000
+            return {
+                'queue_depth': len(self._pending),
+                'max_queue': self.max_queue,
+                'submitted': self.submitted,
+                'written': self.written,
+                'failed': self.failed,
+                'blocked_submits': self.blocked,
+                'bytes_written': self.bytes_written,
+                'encode_ms_p50': round(float(np.percentile(encode_ms, 50)), 2) if len(encode_ms) else None,
+                'encode_ms_p95': round(float(np.percentile(encode_ms, 95)), 2) if len(encode_ms) else None,
+                'write_ms_p50': round(float(np.percentile(write_ms, 50)), 2) if len(write_ms) else None,
+                'formats': {artifact: extension for artifact, (extension, _) in self.formats.items()}
+            }
+
+
+_image_writer = None
+_image_writer_lock = threading.Lock()
+
+
+def get_image_writer():
+    """Process-wide ImageWriter configured from NUT_DETECTION_CONFIG (IMAGE_WRITER_* / IMAGE_FORMATS)"""
+    global _image_writer
+    if _image_writer is None:
+        with _image_writer_lock:
+            if _image_writer is None:
+                from django.conf import settings
+
+                engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+                _image_writer = ImageWriter(
+                    workers=engine_config.get('IMAGE_WRITER_WORKERS', 2),
+                    max_queue=engine_config.get('IMAGE_WRITER_QUEUE', 32),
+                    artifact_formats=engine_config.get('IMAGE_FORMATS')
+                )
+    return _image_writer
@@ -0,0 +1,308 @@
+# ml_api/inference_daemon.py - Standalone inference server and the client used by Django workers
+
+"""
+One process owns the model; web workers send it decoded frames.
+
+    python manage.py run_inference_daemon
+
+listens on a Unix-domain socket (NUT_DETECTION_CONFIG['DAEMON_SOCKET']) or,
+where AF_UNIX is unavailable (Windows), on a localhost TCP port. Each request
+is one framed message:
+
+    !II header_length payload_length | JSON header | raw frame bytes
+
+The header carries the operation, image id/name and the frame's shape and
+dtype; the payload is the BGR frame buffer itself, so nothing is re-encoded.
+The reply is a JSON message with the same framing and an empty payload.
+
+Web workers use get_detection_service() (ml_api.services) which returns a
+RemoteNutDetectionService when DAEMON_ENABLED is set.
+"""
+
+import os
+import json
+import time
+import socket
+import struct
+import logging
+import threading
+import socketserver
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEADER_FORMAT = '!II'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+DEFAULT_SOCKET_PATH = '/tmp/nut_inference.sock'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+UNIX_SOCKETS_AVAILABLE = hasattr(socket, 'AF_UNIX') and hasattr(socketserver, 'UnixStreamServer')
+
+
+def daemon_address(engine_config):
+    """Unix socket path, or (host, port) where AF_UNIX is not available"""
+    if UNIX_SOCKETS_AVAILABLE and not engine_config.get('DAEMON_USE_TCP', False):
+        return engine_config.get('DAEMON_SOCKET', DEFAULT_SOCKET_PATH)
+    return (engine_config.get('DAEMON_HOST', DEFAULT_HOST), engine_config.get('DAEMON_PORT', DEFAULT_PORT))
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        chunk = sock.recv_into(view[received:], size - received)
+        if chunk == 0:
+            raise ConnectionError("Connection closed mid-message")
+        received += chunk
+    return buffer
+
+
+def send_message(sock, header, payload=b''):
+    header_bytes = json.dumps(header, default=str).encode('utf-8')
+    sock.sendall(struct.pack(HEADER_FORMAT, len(header_bytes), len(payload)) + header_bytes)
+    if len(payload):
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    header_size, payload_size = struct.unpack(HEADER_FORMAT, _recv_exact(sock, HEADER_SIZE))
+    header = json.loads(bytes(_recv_exact(sock, header_size)).decode('utf-8'))
+    payload = _recv_exact(sock, payload_size) if payload_size else b''
+    return header, payload
+
+
+class _InferenceRequestHandler(socketserver.BaseRequestHandler):
+    """Serves requests on one connection until the client closes it"""
+
+    def handle(self):
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except (ConnectionError, struct.error):
+                return
+            try:
+                response = self.server.daemon.dispatch(header, payload)
+            except Exception as e:
+                logger.error(f"Inference daemon request failed: {e}")
+                response = {'success': False, 'error': f'Inference daemon error: {str(e)}'}
+            send_message(self.request, response)
+
+
+class InferenceDaemon:
+    """Owns the detection service and serves process_frame / health / update_config / statistics requests"""
+
+    def __init__(self, service, address):
+        self.service = service
+        self.address = address
+        self.started_at = None
+        self.requests_served = 0
+        self._counter_lock = threading.Lock()
+        self.server = None
+
+    def dispatch(self, header, payload):
+        operation = header.get('op')
+        with self._counter_lock:
+            self.requests_served += 1
+
+        if operation == 'process_frame':
+            frame = np.frombuffer(payload, dtype=header['dtype']).reshape(header['shape'])
+            result = self.service.process_frame(
+                frame,
+                header['image_id'],
+                user_id=header.get('user_id'),
+                image_name=header.get('image_name'),
+                source_path=header.get('source_path'),
+                live=header.get('live', False)
+            )
+            # The web process reads the annotated image right after the reply: finish the background write
+            from .image_writer import get_image_writer
+            get_image_writer().wait(result.get('annotated_image_path'))
+            return result
+        if operation == 'update_config':
+            # Confidence changes made from the web apply to the process that serves inspections
+            self.service.update_confidence_levels(**header.get('levels', {}))
+            return {'success': True, 'confidence_settings': self.service.get_confidence_settings()}
+        if operation == 'statistics':
+            return {'success': True, 'statistics': self.service.get_statistics()}
+        if operation == 'health':
+            health = self.service.is_healthy()
+            health['daemon'] = {
+                'address': str(self.address),
+                'pid': os.getpid(),
+                'started_at': self.started_at,
+                'requests_served': self.requests_served
+            }
+            return health
+        return {'success': False, 'error': f'Unknown operation: {operation}'}
+
+    def serve_forever(self):
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.unlink(self.address)  # Stale socket from a previous run
+            server_class = socketserver.ThreadingUnixStreamServer
+        else:
+            server_class = socketserver.ThreadingTCPServer
+            server_class.allow_reuse_address = True
+
+        self.server = server_class(self.address, _InferenceRequestHandler)
+        self.server.daemon_threads = True
+        self.server.daemon = self
+        self.started_at = datetime.now().isoformat()
+        logger.info(f"Inference daemon listening on {self.address}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.unlink(self.address)
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+class InferenceClient:
+    """Low-level client: one connection per call, so it is safe to share between threads"""
+
+    def __init__(self, address, timeout=30.0):
+        self.address = address
+        self.timeout = timeout
+
+    def _connect(self):
+        family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.address)
+        return sock
+
+    def request(self, header, payload=b''):
+        with self._connect() as sock:
+            send_message(sock, header, payload)
+            response, _ = recv_message(sock)
+        return response
+
+    def process_frame(self, frame, image_id, user_id=None, image_name=None, source_path=None, live=False):
+        frame = np.ascontiguousarray(frame)
+        header = {
+            'op': 'process_frame',
+            'image_id': image_id,
+            'user_id': user_id,
+            'image_name': image_name,
+            'source_path': source_path,
+            'live': live,
+            'shape': list(frame.shape),
+            'dtype': frame.dtype.str
+        }
+        return self.request(header, memoryview(frame).cast('B'))
+
+    def health(self):
+        return self.request({'op': 'health'})
+
+    def update_config(self, levels):
+        return self.request({'op': 'update_config', 'levels': levels})
+
+    def statistics(self):
+        return self.request({'op': 'statistics'})
+
+
+class RemoteNutDetectionService:
+    """
+    Drop-in for FlexibleNutDetectionService.process_frame / process_image_with_id / is_healthy /
+    update_confidence_levels / get_statistics
+
+    Frames are sent to the inference daemon. If nothing listens at its
+    address and ``fallback`` is given, the call runs on that local service
+    instead; timeouts and broken connections return a failure result.
+    """
+
+    def __init__(self, client, fallback=None, annotations=None):
+        self.client = client
+        self.fallback = fallback
+        # The daemon writes its annotation records to the shared directory; they are rendered here
+        self.annotations = annotations
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return getattr(self.client, method)(*args, **kwargs)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            # Nothing listens at the address: the frame never reached the daemon
+            if self.fallback is None:
+                logger.error(f"Inference daemon unreachable at {self.client.address}: {e}")
+                return self._failure(f'Inference daemon unreachable: {str(e)}')
+            logger.error(f"Inference daemon unreachable at {self.client.address} ({e}), processing locally")
+            return None
+        except (OSError, ConnectionError, ValueError) as e:
+            # Read timeouts and dropped connections: the daemon may still be inspecting the frame,
+            # so it is not run a second time locally
+            logger.error(f"Inference daemon request to {self.client.address} failed: {e}")
+            return self._failure(f'Inference daemon request failed: {str(e)}')
+
+    @staticmethod
+    def _failure(error):
+        return {
+            'success': False,
+            'error': error,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def process_frame(self, frame, image_id, user_id=None, image_name=None, start_time=None, source_path=None,
+                      live=False):
+        start = time.perf_counter()
+        result = self._call('process_frame', frame, image_id, user_id=user_id, image_name=image_name,
+                            source_path=source_path, live=live)
+        if result is None:
+            return self.fallback.process_frame(frame, image_id, user_id=user_id, image_name=image_name,
+                                               start_time=start_time, source_path=source_path, live=live)
+        result['daemon_round_trip'] = round(time.perf_counter() - start, 4)
+        return result
+
+    def process_image_with_id(self, image_path, image_id, user_id=None, ephemeral_source=False):
+        import cv2
+
+        if not os.path.exists(image_path):
+            return {
+                'success': False,
+                'error': f'Image file not found: {image_path}',
+                'timestamp': datetime.now().isoformat()
+            }
+        image = cv2.imread(image_path)
+        if image is None:
+            return {
+                'success': False,
+                'error': 'Could not load image file',
+                'timestamp': datetime.now().isoformat()
+            }
+        return self.process_frame(image, image_id, user_id=user_id, image_name=os.path.basename(image_path),
+                                  source_path=None if ephemeral_source else image_path)
+
+    def render_annotated_image(self, image_id, max_size=None):
+        """JPEG bytes of the newest inspection of ``image_id`` with its annotations, or None"""
+        return self.annotations.render_jpeg(image_id, max_size) if self.annotations is not None else None
+
+    def update_confidence_levels(self, primary=None, fallback=None, minimum=None, ultra_low=None):
+        """Apply confidence levels in the daemon, and in the local fallback so both inspect alike"""
+        levels = {'primary': primary, 'fallback': fallback, 'minimum': minimum,
+                  'ultra_low': list(ultra_low) if ultra_low is not None else None}
+        if self.fallback is not None:
+            self.fallback.update_confidence_levels(**levels)
+        result = self._call('update_config', levels)
+        if result is not None and not result.get('success', False):
+            raise RuntimeError(f"Confidence levels not applied in the inference daemon: {result.get('error')}")
+
+    def get_statistics(self):
+        result = self._call('statistics')
+        if result is None:
+            return self.fallback.get_statistics()
+        if not result.get('success', False):
+            return {'error': result.get('error')}
+        return result['statistics']
+
+    def is_healthy(self):
+        health = self._call('health')
+        if health is None:
+            health = self.fallback.is_healthy()
+            health['daemon'] = None
+        return health
@@ -0,0 +1,535 @@
+# ml_api/inference_engines.py - Pluggable inference backends for the nut detector
+
+"""
+Inference engines used by FlexibleNutDetectionService.
+
+Every engine exposes the same call:
+
+    engine.predict(images, conf=..., iou=..., max_det=..., imgsz=...) -> [Detections, ...]
+
+with one Detections per input frame (BGR uint8, as delivered by OpenCV and the
+camera) and boxes in original-image coordinates.
+
+- 'pytorch':     Ultralytics YOLO on the .pt weights (original behaviour)
+- 'pytorch_lean': the same .pt network called directly - letterbox into a
+                 preallocated buffer, forward pass, NumPy decode and NMS -
+                 without the Ultralytics predictor's per-call overhead
+- 'onnxruntime': ONNX Runtime CPU session on a model exported from the .pt
+- 'openvino':    OpenVINO CPU runtime on a model exported from the .pt
+- 'stub':        no model: deterministic synthetic nuts with configurable
+                 latency, so the pipeline around the detector can be
+                 benchmarked anywhere (python manage.py benchmark_pipeline)
+
+The exported artifacts are written once, next to NUT_DETECTION_MODEL_PATH, and
+re-exported only when the .pt file is newer. Runtime packages are imported
+lazily, so only the selected backend is ever loaded.
+
+An INT8 ONNX model produced by the quantize_nut_model command is used by the
+'onnxruntime' engine only when its report (written next to it) shows enough
+OK/NG decision agreement with the FP32 model - see approved_int8_model().
+"""
+
+import os
+import json
+import time
+import zlib
+import random
+import logging
+import threading
+from contextlib import nullcontext
+
+import cv2
+import numpy as np
+
+from .detections import CLASS_MISSING, CLASS_PRESENT, Detections
+from .detection_merge import greedy_nms
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENGINE = 'pytorch'
+DEFAULT_IMGSZ = 640
+LETTERBOX_COLOR = (114, 114, 114)
+MAX_CLASS_OFFSET = 7680  # Per-class box offset for batched class-aware NMS (same as Ultralytics)
+MAX_NMS_CANDIDATES = 30000
+
+
+def letterbox_geometry(image_shape, new_shape=DEFAULT_IMGSZ, stride=32, auto=True):
+    """
+    Letterbox layout used by the Ultralytics predictor
+
+    With ``auto`` the padding is reduced to the smallest stride multiple
+    (rectangular inference, used for dynamic-shape models).
+    Returns ((resized_width, resized_height), (padded_height, padded_width), gain, (pad_left, pad_top)).
+    """
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+    height, width = image_shape[:2]
+
+    gain = min(new_shape[0] / height, new_shape[1] / width)
+    new_unpad = (int(round(width * gain)), int(round(height * gain)))
+    dw, dh = new_shape[1] - new_unpad[0], new_shape[0] - new_unpad[1]
+    if auto:
+        dw, dh = np.mod(dw, stride), np.mod(dh, stride)
+    dw /= 2
+    dh /= 2
+
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    padded_shape = (new_unpad[1] + top + bottom, new_unpad[0] + left + right)
+    return new_unpad, padded_shape, gain, (left, top)
+
+
+def letterbox_into(image, canvas, new_unpad, pad):
+    """Resize ``image`` straight into a preallocated (padded_height, padded_width, 3) uint8 canvas"""
+    left, top = pad
+    canvas.fill(LETTERBOX_COLOR[0])
+    target = canvas[top:top + new_unpad[1], left:left + new_unpad[0]]
+    if image.shape[1::-1] != new_unpad:
+        cv2.resize(image, new_unpad, dst=target, interpolation=cv2.INTER_LINEAR)
+    else:
+        target[...] = image
+    return canvas
+
+
+def letterbox(image, new_shape=DEFAULT_IMGSZ, stride=32, auto=True):
+    """
+    Resize and pad a frame the way the Ultralytics predictor does
+
+    Returns (padded image, gain, (pad_left, pad_top)).
+    """
+    new_unpad, padded_shape, gain, pad = letterbox_geometry(image.shape, new_shape, stride, auto)
+    canvas = np.empty(padded_shape + (3,), dtype=np.uint8)
+    return letterbox_into(image, canvas, new_unpad, pad), gain, pad
+
+
+def scale_boxes_to_original(boxes, gain, pad, original_shape):
+    """Map letterboxed xyxy boxes back to the original frame (in place) and clip them"""
+    boxes[:, [0, 2]] -= pad[0]
+    boxes[:, [1, 3]] -= pad[1]
+    boxes /= gain
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, original_shape[1])
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, original_shape[0])
+    return boxes
+
+
+def decode_yolo_output(prediction, conf, iou, max_det=300):
+    """
+    Decode one raw YOLOv8 output (4 + num_classes, anchors) into xyxy boxes
+
+    Same steps as Ultralytics non_max_suppression (single label per box,
+    class-aware NMS). Returns (boxes, confidences, class_ids) in letterbox
+    coordinates, highest confidence first.
+    """
+    prediction = np.asarray(prediction, dtype=np.float32)
+    class_scores = prediction[4:]
+    class_ids = class_scores.argmax(axis=0)
+    confidences = class_scores[class_ids, np.arange(class_scores.shape[1])]
+
+    candidates = np.flatnonzero(confidences > conf)
+    if candidates.size == 0:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64)
+
+    candidates = candidates[np.argsort(-confidences[candidates], kind='stable')[:MAX_NMS_CANDIDATES]]
+    xywh = prediction[:4, candidates].T
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    confidences = confidences[candidates]
+    class_ids = class_ids[candidates].astype(np.int64)
+
+    # Offset boxes by class so one NMS pass never suppresses across classes
+    keep = greedy_nms(boxes + (class_ids * MAX_CLASS_OFFSET)[:, None], confidences, iou, max_keep=max_det)
+    return boxes[keep], confidences[keep], class_ids[keep]
+
+
+def exported_model_path(model_path, engine_format):
+    """Path of the exported artifact Ultralytics writes next to the .pt file"""
+    stem, _ = os.path.splitext(model_path)
+    if engine_format == 'onnx':
+        return f"{stem}.onnx"
+    if engine_format == 'openvino':
+        return f"{stem}_openvino_model"
+    raise ValueError(f"Unknown export format: {engine_format}")
+
+
+def quantized_model_path(model_path):
+    """Path of the INT8 ONNX model written by the quantize_nut_model command"""
+    stem, _ = os.path.splitext(model_path)
+    return f"{stem}.int8.onnx"
+
+
+def quantization_report_path(model_path):
+    """Path of the accuracy/latency report stored next to the INT8 model"""
+    stem, _ = os.path.splitext(model_path)
+    return f"{stem}.int8.json"
+
+
+def approved_int8_model(model_path, min_decision_agreement, max_false_ok=0):
+    """
+    Return the INT8 model path if its quantization report passes the gate, else None
+
+    The gate needs a report newer than the .pt weights with OK/NG decision
+    agreement of at least ``min_decision_agreement`` and no more than
+    ``max_false_ok`` parts the INT8 model passed but the FP32 model rejected.
+    """
+    int8_path = quantized_model_path(model_path)
+    report_path = quantization_report_path(model_path)
+    if not os.path.exists(int8_path) or not os.path.exists(report_path):
+        return None
+
+    try:
+        with open(report_path, 'r') as f:
+            report = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Unreadable quantization report {report_path}: {e}")
+        return None
+
+    if os.path.getmtime(int8_path) < os.path.getmtime(model_path):
+        logger.warning(f"INT8 model is older than {model_path}, re-run quantize_nut_model")
+        return None
+    if report.get('decision_agreement', 0.0) < min_decision_agreement:
+        logger.warning(f"INT8 model rejected: decision agreement {report.get('decision_agreement')} "
+                       f"< {min_decision_agreement}")
+        return None
+    if report.get('false_ok', max_false_ok + 1) > max_false_ok:
+        logger.warning(f"INT8 model rejected: {report.get('false_ok')} false OK decisions")
+        return None
+    return int8_path
+
+
+def export_model(model_path, engine_format, imgsz=DEFAULT_IMGSZ, force=False):
+    """
+    Export the .pt model once and cache the artifact next to it
+
+    The artifact is reused until the .pt file is modified. Export needs
+    ultralytics (and torch); loading the exported model afterwards does not.
+    """
+    artifact = exported_model_path(model_path, engine_format)
+    if not force and os.path.exists(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(model_path):
+        return artifact
+
+    from ultralytics import YOLO
+
+    logger.info(f"Exporting {model_path} to {engine_format} (one-time step)...")
+    start_time = time.time()
+    exported = YOLO(model_path).export(format=engine_format, imgsz=imgsz, dynamic=True)
+    exported = str(exported) if exported else artifact
+    if os.path.abspath(exported) != os.path.abspath(artifact) and os.path.exists(exported):
+        os.replace(exported, artifact)
+    logger.info(f"Exported model cached at {artifact} ({time.time() - start_time:.1f}s)")
+    return artifact
+
+
+class InferenceEngine:
+    """Base class: one predict() call runs a batch of frames"""
+
+    name = 'base'
+
+    def __init__(self, model_path, threads=None, imgsz=DEFAULT_IMGSZ, artifact=None):
+        self.model_path = model_path
+        self.threads = threads
+        self.imgsz = imgsz
+        self.artifact_path = artifact or model_path
+        self.load_time = 0.0
+
+    def load(self):
+        start_time = time.time()
+        self._load()
+        self.load_time = time.time() - start_time
+        logger.info(f"Inference engine '{self.name}' loaded in {self.load_time:.2f}s: {self.artifact_path}")
+        return self
+
+    def _load(self):
+        raise NotImplementedError
+
+    def predict(self, images, conf=0.25, iou=0.45, max_det=300, imgsz=None, method='unknown'):
+        raise NotImplementedError
+
+    def session(self):
+        """Context for one inspection's predict calls (used by the micro-batcher)"""
+        return nullcontext(self)
+
+    def describe(self):
+        return {
+            'engine': self.name,
+            'artifact': self.artifact_path,
+            'load_time': round(self.load_time, 3),
+            'threads': self.threads
+        }
+
+
+class UltralyticsEngine(InferenceEngine):
+    """PyTorch backend through the Ultralytics YOLO predictor"""
+
+    name = 'pytorch'
+
+    def _load(self):
+        from ultralytics import YOLO
+        self.model = YOLO(self.model_path)
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+
+    def predict(self, images, conf=0.25, iou=0.45, max_det=300, imgsz=None, method='unknown'):
+        if not images:
+            return []
+        kwargs = {'conf': conf, 'iou': iou, 'max_det': max_det}
+        if imgsz is not None:
+            kwargs['imgsz'] = imgsz
+        source = images if len(images) > 1 else images[0]
+        results = self.model.predict(source, verbose=False, **kwargs)
+        return [Detections.from_ultralytics(result, method) for result in results]
+
+
+class DirectYoloEngine(InferenceEngine):
+    """
+    Runs the YOLOv8 network directly on decoded frames
+
+    Frames are letterboxed like the Ultralytics predictor straight into
+    preallocated per-thread input buffers (reused while the input shape is
+    unchanged), batched, and decoded with NumPy NMS. Subclasses only run the
+    forward pass.
+    """
+
+    stride = 32
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._buffers = threading.local()
+
+    def _forward(self, batch):
+        """Run the network on an (N, 3, H, W) float32 batch; returns (N, 4 + classes, anchors)"""
+        raise NotImplementedError
+
+    def _input_buffers(self, batch_size, padded_shape):
+        """Per-thread uint8 letterbox canvas and float32 network input for one input shape"""
+        buffers = getattr(self._buffers, 'inputs', None)
+        if buffers is None:
+            buffers = self._buffers.inputs = {}
+        key = (batch_size,) + padded_shape
+        if key not in buffers:
+            buffers[key] = (np.empty(padded_shape + (3,), dtype=np.uint8),
+                            np.empty((batch_size, 3) + padded_shape, dtype=np.float32))
+        return buffers[key]
+
+    def predict(self, images, conf=0.25, iou=0.45, max_det=300, imgsz=None, method='unknown'):
+        if not images:
+            return []
+        size = imgsz or self.imgsz
+        # Rectangular letterboxing only when every frame has the same shape (as Ultralytics does)
+        same_shapes = len({image.shape for image in images}) == 1
+        geometries = [letterbox_geometry(image.shape, size, self.stride, auto=same_shapes) for image in images]
+
+        canvas, batch = self._input_buffers(len(images), geometries[0][1])
+        for i, (image, (new_unpad, _, _, pad)) in enumerate(zip(images, geometries)):
+            letterbox_into(image, canvas, new_unpad, pad)
+            # BGR->RGB, HWC->CHW and scaling in one pass into the network input
+            np.divide(canvas[..., ::-1].transpose(2, 0, 1), 255.0, out=batch[i])
+        outputs = self._forward(batch)
+
+        results = []
+        for output, image, (_, _, gain, pad) in zip(outputs, images, geometries):
+            boxes, confidences, class_ids = decode_yolo_output(output, conf, iou, max_det)
+            scale_boxes_to_original(boxes, gain, pad, image.shape)
+            detections = Detections(boxes, confidences, class_ids, method)
+            results.append(detections.filter(np.isin(detections.class_ids, (CLASS_MISSING, CLASS_PRESENT))))
+        return results
+
+
+class LeanTorchEngine(DirectYoloEngine):
+    """PyTorch backend calling the fused .pt network directly (no Ultralytics predictor)"""
+
+    name = 'pytorch_lean'
+
+    def _load(self):
+        import torch
+        from ultralytics import YOLO
+
+        self.torch = torch
+        if self.threads:
+            torch.set_num_threads(self.threads)
+
+        yolo = YOLO(self.model_path)
+        # Same default input size as the predictor (the training imgsz stored in the checkpoint)
+        imgsz = yolo.overrides.get('imgsz') if isinstance(getattr(yolo, 'overrides', None), dict) else None
+        if isinstance(imgsz, int):
+            self.imgsz = imgsz
+
+        self.model = yolo.model.fuse(verbose=False).eval().float()
+        for parameter in self.model.parameters():
+            parameter.requires_grad_(False)
+        self.stride = int(max(self.model.stride))
+
+    def _forward(self, batch):
+        with self.torch.inference_mode():
+            output = self.model(self.torch.from_numpy(batch))
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        return output.numpy()
+
+
+class ExportedYoloEngine(DirectYoloEngine):
+    """Direct engine on a model exported from the .pt file (dynamic input shape)"""
+
+    export_format = None
+
+    def _load(self):
+        # An explicit artifact (e.g. the INT8 model) skips the export step
+        if self.artifact_path == self.model_path:
+            self.artifact_path = export_model(self.model_path, self.export_format, imgsz=self.imgsz)
+        self._load_runtime()
+
+    def _load_runtime(self):
+        raise NotImplementedError
+
+
+class OnnxRuntimeEngine(ExportedYoloEngine):
+    """ONNX Runtime CPU backend"""
+
+    name = 'onnxruntime'
+    export_format = 'onnx'
+
+    def _load_runtime(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self.ort_session = ort.InferenceSession(self.artifact_path, sess_options=options,
+                                                providers=['CPUExecutionProvider'])
+        self.input_name = self.ort_session.get_inputs()[0].name
+
+    def _forward(self, batch):
+        return self.ort_session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoEngine(ExportedYoloEngine):
+    """OpenVINO CPU backend"""
+
+    name = 'openvino'
+    export_format = 'openvino'
+
+    def _load_runtime(self):
+        import openvino as ov
+
+        core = ov.Core()
+        model_xml = next(
+            os.path.join(self.artifact_path, f) for f in os.listdir(self.artifact_path) if f.endswith('.xml'))
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if self.threads:
+            config['INFERENCE_NUM_THREADS'] = self.threads
+        self.compiled_model = core.compile_model(core.read_model(model_xml), 'CPU', config)
+        self.output = self.compiled_model.output(0)
+
+    def _forward(self, batch):
+        return self.compiled_model(batch)[self.output]
+
+
+# Nut centres of the stub engine (and the synthetic benchmark frames), fractions of the frame size
+STUB_NUT_POSITIONS = ((0.3, 0.3), (0.7, 0.3), (0.3, 0.7), (0.7, 0.7))
+STUB_NUT_SIZE = 0.12  # Box side, fraction of the shorter frame side
+
+
+class StubEngine(InferenceEngine):
+    """
+    Deterministic stand-in for the detector: no model file, no runtime
+
+    Every frame gets a box around each STUB_NUT_POSITIONS position plus
+    ``clutter`` low-confidence boxes elsewhere. Confidences and MISSING /
+    PRESENT classes are drawn from a seed derived from the frame's pixels,
+    so the same frame always gives the same boxes while enhancement variants
+    and other frames differ - enough for the cascade to escalate like it
+    does on real parts. The usual conf / max_det filtering applies.
+
+    Each call sleeps call_ms + image_ms per frame (scaled by the input area
+    relative to 640 px with ``scale_with_size``), +/- ``jitter`` (fraction),
+    which releases the GIL like a real forward pass.
+    """
+
+    name = 'stub'
+
+    def __init__(self, model_path=None, threads=None, imgsz=DEFAULT_IMGSZ, artifact=None, call_ms=2.0,
+                 image_ms=15.0, scale_with_size=True, jitter=0.0, missing_rate=0.1,
+                 confidence_range=(0.15, 0.95), clutter=2, seed=0):
+        super().__init__(model_path, threads=threads, imgsz=imgsz, artifact=artifact or 'stub')
+        self.call_ms = call_ms
+        self.image_ms = image_ms
+        self.scale_with_size = scale_with_size
+        self.jitter = jitter
+        self.missing_rate = missing_rate
+        self.confidence_range = tuple(confidence_range)
+        self.clutter = clutter
+        self.seed = seed
+        self._timing_random = random.Random(seed)
+
+    def _load(self):
+        pass
+
+    def _detections(self, image, conf, max_det):
+        # Seeded by a pixel sample: identical frames, identical boxes
+        sample = np.ascontiguousarray(image[::16, ::16])
+        rng = np.random.default_rng([self.seed, zlib.crc32(memoryview(sample).cast('B'))])
+        height, width = image.shape[:2]
+        half_side = STUB_NUT_SIZE * min(height, width) / 2
+
+        count = len(STUB_NUT_POSITIONS) + self.clutter
+        centers = np.concatenate([
+            np.asarray(STUB_NUT_POSITIONS, dtype=np.float64),
+            rng.uniform(0.05, 0.95, size=(self.clutter, 2))
+        ]) * (width, height)
+        centers += rng.normal(0, half_side * 0.05, size=(count, 2))
+        boxes = np.concatenate([centers - half_side, centers + half_side], axis=1)
+        boxes = np.clip(boxes, 0, (width, height, width, height))
+
+        low, high = self.confidence_range
+        confidences = np.concatenate([
+            rng.uniform(low, high, size=len(STUB_NUT_POSITIONS)),
+            rng.uniform(0.01, low, size=self.clutter)
+        ])
+        class_ids = np.where(rng.random(count) < self.missing_rate, CLASS_MISSING, CLASS_PRESENT)
+
+        keep = np.flatnonzero(confidences >= conf)
+        keep = keep[np.argsort(-confidences[keep], kind='stable')][:max_det]
+        return boxes[keep], confidences[keep], class_ids[keep]
+
+    def predict(self, images, conf=0.25, iou=0.45, max_det=300, imgsz=None, method='unknown'):
+        if not images:
+            return []
+        area = ((imgsz or self.imgsz) / DEFAULT_IMGSZ) ** 2 if self.scale_with_size else 1.0
+        delay = (self.call_ms + self.image_ms * area * len(images)) / 1000
+        if self.jitter:
+            delay *= 1 + self._timing_random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(delay, 0.0))
+        return [Detections(*self._detections(image, conf, max_det), method) for image in images]
+
+    def describe(self):
+        return {
+            **super().describe(),
+            'call_ms': self.call_ms,
+            'image_ms': self.image_ms,
+            'scale_with_size': self.scale_with_size,
+            'jitter': self.jitter,
+            'missing_rate': self.missing_rate,
+            'confidence_range': list(self.confidence_range),
+            'clutter': self.clutter,
+            'seed': self.seed
+        }
+
+
+ENGINES = {
+    UltralyticsEngine.name: UltralyticsEngine,
+    LeanTorchEngine.name: LeanTorchEngine,
+    OnnxRuntimeEngine.name: OnnxRuntimeEngine,
+    OpenVinoEngine.name: OpenVinoEngine,
+    StubEngine.name: StubEngine,
+}
+
+
+def create_engine(name, model_path, threads=None, imgsz=DEFAULT_IMGSZ, artifact=None):
+    """Build and load the named engine ('pytorch', 'pytorch_lean', 'onnxruntime', 'openvino' or 'stub')"""
+    try:
+        engine_class = ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown inference engine '{name}' (choose from: {', '.join(ENGINES)})")
+    return engine_class(model_path, threads=threads, imgsz=imgsz, artifact=artifact).load()
@@ -0,0 +1,108 @@
+# ml_api/load_monitor.py - Load-aware quality-of-service switch for the detection service
+
+"""
+When triggers arrive faster than parts can be inspected, every part still
+paid for the full cascade and the backlog grew without bound. LoadMonitor
+watches the inspections in flight and the recent per-part latency against
+the line's takt time:
+
+    pressure = in_flight x average latency / takt_time
+
+i.e. how many takt periods the current backlog needs. Above
+``enter_pressure`` (or with more than ``max_backlog`` parts in flight) new
+parts get the degraded profile; below ``exit_pressure`` the full profile
+returns. The gap between the two keeps the mode from flapping.
+
+Parts inspected with the degraded profile are never dropped: the result is
+returned as usual. When the profile actually skipped a cascade pass the part
+is flagged for re-inspection and appended to a JSONL re-inspection log.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FULL = 'full'
+DEGRADED = 'degraded'
+
+
+class LoadMonitor:
+    """Chooses the cascade profile for each new inspection from backlog and latency"""
+
+    def __init__(self, takt_time, enter_pressure=1.0, exit_pressure=0.7, max_backlog=None,
+                 window=20, reinspection_log=None):
+        self.takt_time = takt_time
+        self.enter_pressure = enter_pressure
+        self.exit_pressure = exit_pressure
+        self.max_backlog = max_backlog
+        self.reinspection_log = reinspection_log
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._degraded = False
+        self.switches = 0
+        self.degraded_parts = 0
+
+    def _pressure(self):
+        """Backlog in takt periods (lock held)"""
+        if not self._latencies:
+            return 0.0
+        return self._in_flight * (sum(self._latencies) / len(self._latencies)) / self.takt_time
+
+    def begin(self):
+        """Register a new inspection; returns a token for finish() with the profile to use"""
+        with self._lock:
+            self._in_flight += 1
+            pressure = self._pressure()
+            overloaded = self.max_backlog is not None and self._in_flight > self.max_backlog
+            if not self._degraded and (pressure > self.enter_pressure or overloaded):
+                self._degraded = True
+                self.switches += 1
+                logger.warning(f"QoS: switching to the degraded profile "
+                               f"(pressure {pressure:.2f}, {self._in_flight} parts in flight)")
+            elif self._degraded and pressure < self.exit_pressure and not overloaded:
+                self._degraded = False
+                self.switches += 1
+                logger.info(f"QoS: back to the full profile (pressure {pressure:.2f})")
+            profile = DEGRADED if self._degraded else FULL
+            if profile == DEGRADED:
+                self.degraded_parts += 1
+        return time.perf_counter(), profile
+
+    def finish(self, token):
+        started_at, _ = token
+        with self._lock:
+            self._in_flight -= 1
+            self._latencies.append(time.perf_counter() - started_at)
+
+    def record_reinspection(self, entry):
+        """Append a degraded-profile part to the re-inspection log (one JSON object per line)"""
+        if not self.reinspection_log:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.reinspection_log) or '.', exist_ok=True)
+            with self._lock, open(self.reinspection_log, 'a') as f:
+                f.write(json.dumps(entry, default=str) + '\n')
+        except OSError as e:
+            logger.error(f"Could not record re-inspection for {entry.get('image_id')}: {e}")
+
+    def metrics(self):
+        with self._lock:
+            latencies = np.asarray(self._latencies)
+            return {
+                'profile': DEGRADED if self._degraded else FULL,
+                'takt_time': self.takt_time,
+                'in_flight': self._in_flight,
+                'pressure': round(self._pressure(), 3),
+                'average_latency': round(float(latencies.mean()), 4) if len(latencies) else None,
+                'switches': self.switches,
+                'degraded_parts': self.degraded_parts,
+                'reinspection_log': self.reinspection_log
+            }
@@ -17,7 +17,7 @@ from PIL import Image
 import uuid
 
 from .models import InspectionRecord, NutResult, CameraCaptureSession, ProcessingJob
-from .services import enhanced_nut_detection_service
+from .services import get_detection_service
 
 logger = logging.getLogger(__name__)
 
@@ -100,7 +100,7 @@ class SingleImageProcessingView(View):
         temp_file.close()
         
         # Step 3: Auto Process with YOLOv8
-        result = self._auto_process_image(temp_file.name, image_id, uploaded_file.name)
+        result = self._auto_process_image(temp_file.name, image_id, uploaded_file.name, ephemeral_source=True)
         
         # Step 4: Auto Save Results
         if result['success']:
@@ -152,17 +152,18 @@ class SingleImageProcessingView(View):
         
         return JsonResponse(result)
     
-    def _auto_process_image(self, image_path, image_id, filename):
+    def _auto_process_image(self, image_path, image_id, filename, ephemeral_source=False):
         """
         Step 3: Auto Process with YOLOv8 Model
         """
         logger.info(f"Auto-processing image: {image_id}")
         
         # Use your enhanced detection service
-        result = enhanced_nut_detection_service.process_image_with_id(
+        result = get_detection_service().process_image_with_id(
             image_path=image_path,
             image_id=image_id,
-            user_id=None
+            user_id=None,
+            ephemeral_source=ephemeral_source  # Temporary uploads are deleted after saving
         )
         
         if not result['success']:
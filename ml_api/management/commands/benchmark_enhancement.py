@@ -0,0 +1,86 @@
+# ml_api/management/commands/benchmark_enhancement.py - Time and memory of the enhancement variants
+
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_api.enhancement import EnhancementEngine
+
+
+def _legacy_variants(image):
+    """The previous implementation: float64 brightness, a new CLAHE per call, fresh arrays for every variant"""
+    variants = {'original': image.copy()}
+    brightness = np.mean(image)
+    if brightness < 100 or brightness > 140:
+        variants['brightness'] = np.clip(image * (120 / max(brightness, 1)), 0, 255).astype(np.uint8)
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+    lab[:, :, 0] = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(lab[:, :, 0])
+    variants['clahe'] = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+    variants['sharpened'] = cv2.filter2D(image, -1, np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]]))
+    variants['combined'] = cv2.addWeighted(variants.get('brightness', image), 0.7, variants['clahe'], 0.3, 0)
+    return variants
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the enhancement variants: latency and peak allocation per frame of the previous '
+            'implementation, the EnhancementEngine on the full frame and on the inference-size copy')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='Frame to enhance (default: synthetic dark 1440x1080 frame)')
+        parser.add_argument('--repeat', type=int, default=30, help='Timed calls per implementation')
+        parser.add_argument('--max-size', type=int,
+                            help='Inference-size copy (default: ENHANCEMENT_MAX_SIZE, else 640)')
+
+    def _measure(self, build, frame, repeat):
+        build(frame)  # Warm-up: thread pool, buffers and CLAHE instances
+        samples = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            build(frame)
+            samples.append(time.perf_counter() - start_time)
+        # Peak Python/NumPy allocation of one call (OpenCV outputs are NumPy arrays, so they are traced)
+        tracemalloc.start()
+        build(frame)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        samples = np.asarray(samples) * 1000
+        return float(np.percentile(samples, 50)), float(np.percentile(samples, 95)), peak / 2**20
+
+    def handle(self, *args, **options):
+        if options['image']:
+            frame = cv2.imread(options['image'])
+            if frame is None:
+                raise CommandError(f"Cannot read image: {options['image']}")
+        else:
+            # Dark enough that the brightness variant is built
+            frame = np.random.default_rng(0).integers(0, 160, size=(1080, 1440, 3), dtype=np.uint8)
+        engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+        max_size = options['max_size'] or engine_config.get('ENHANCEMENT_MAX_SIZE') or 640
+
+        enhancer = EnhancementEngine()
+
+        def engine_inference_size(image):
+            working_image, _ = enhancer.working_copy(image, max_size)
+            return enhancer.variants(working_image)
+
+        # The full-frame engine must reproduce the previous variants
+        legacy = _legacy_variants(frame)
+        current = enhancer.variants(frame)
+        max_difference = max(int(np.abs(legacy[name].astype(np.int16) - current[name]).max())
+                             for name in current)
+
+        self.stdout.write(f"Frame {frame.shape[1]}x{frame.shape[0]}, {options['repeat']} calls each; "
+                          f"max pixel difference engine vs previous (full frame): {max_difference}")
+        self.stdout.write(f"{'implementation':<28} | {'p50 ms':>8} {'p95 ms':>8} | {'peak MiB':>9}")
+        rows = [
+            ('previous (full frame)', _legacy_variants),
+            ('engine (full frame)', enhancer.variants),
+            (f'engine ({max_size} px copy)', engine_inference_size),
+        ]
+        for label, build in rows:
+            p50, p95, peak = self._measure(build, frame, options['repeat'])
+            self.stdout.write(f"{label:<28} | {p50:>8.2f} {p95:>8.2f} | {peak:>9.2f}")
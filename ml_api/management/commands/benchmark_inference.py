@@ -0,0 +1,86 @@
+# ml_api/management/commands/benchmark_inference.py - Per-call latency of the inference engines
+
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_api.detection_merge import box_iou_matrix
+from ml_api.inference_engines import DEFAULT_IMGSZ, ENGINES, create_engine
+
+
+def _percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return float(np.percentile(samples, 50)), float(np.percentile(samples, 95))
+
+
+class Command(BaseCommand):
+    help = ('Benchmark inference engines on one frame: per-call latency, fixed per-call overhead '
+            '(tiny input) and detection agreement with the first engine')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='Frame to run (default: synthetic 1440x1080 frame)')
+        parser.add_argument('--engines', nargs='+', default=['pytorch', 'pytorch_lean'],
+                            choices=sorted(ENGINES), help='Engines to compare; the first one is the reference')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed calls per measurement')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--conf', type=float, default=0.25)
+        parser.add_argument('--iou', type=float, default=0.45)
+
+    def _time(self, engine, frame, repeat, warmup, **kwargs):
+        for _ in range(warmup):
+            engine.predict([frame], **kwargs)
+        samples = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            engine.predict([frame], **kwargs)
+            samples.append(time.perf_counter() - start_time)
+        return _percentiles(samples)
+
+    def handle(self, *args, **options):
+        if options['image']:
+            frame = cv2.imread(options['image'])
+            if frame is None:
+                raise CommandError(f"Cannot read image: {options['image']}")
+        else:
+            frame = np.random.default_rng(0).integers(0, 255, size=(1080, 1440, 3), dtype=np.uint8)
+        # The network cost of a 64 px input is negligible, so its latency is the fixed per-call overhead
+        tiny_frame = cv2.resize(frame, (64, 48))
+
+        engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+        predict_kwargs = {'conf': options['conf'], 'iou': options['iou']}
+
+        reference = None
+        self.stdout.write(f"{'engine':<14} | {'p50 ms':>8} {'p95 ms':>8} | {'overhead p50':>12} | "
+                          f"{'detections':>10} {'matched':>8} {'max |dconf|':>11}")
+        for name in options['engines']:
+            engine = create_engine(name, settings.NUT_DETECTION_MODEL_PATH,
+                                   threads=engine_config.get('ENGINE_THREADS'),
+                                   imgsz=engine_config.get('EXPORT_IMGSZ', DEFAULT_IMGSZ))
+
+            p50, p95 = self._time(engine, frame, options['repeat'], options['warmup'], **predict_kwargs)
+            overhead, _ = self._time(engine, tiny_frame, options['repeat'], options['warmup'],
+                                     imgsz=64, **predict_kwargs)
+
+            detections = engine.predict([frame], **predict_kwargs)[0]
+            if reference is None:
+                reference = detections
+            matched, conf_delta = self._agreement(reference, detections)
+
+            self.stdout.write(f"{name:<14} | {p50:>8.2f} {p95:>8.2f} | {overhead:>12.2f} | "
+                              f"{len(detections):>10} {matched:>8} {conf_delta:>11.4f}")
+
+    def _agreement(self, reference, detections):
+        """Boxes matching a reference box of the same class (IoU >= 0.9) and their worst confidence gap"""
+        if not len(reference) or not len(detections):
+            return 0, 0.0
+        ious = box_iou_matrix(detections.boxes, reference.boxes)
+        ious[detections.class_ids[:, None] != reference.class_ids[None, :]] = 0
+        best = ious.argmax(axis=1)
+        matched = ious[np.arange(len(detections)), best] >= 0.9
+        if not matched.any():
+            return 0, 0.0
+        conf_delta = np.abs(detections.confidences[matched] - reference.confidences[best[matched]]).max()
+        return int(matched.sum()), float(conf_delta)
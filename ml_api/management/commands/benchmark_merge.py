@@ -0,0 +1,85 @@
+# ml_api/management/commands/benchmark_merge.py - Micro-benchmark for the detection merge engine
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ml_api.detection_merge import greedy_nms, select_non_overlapping, weighted_box_fusion
+
+
+def _python_iou(bbox1, bbox2):
+    """Pairwise IoU as computed by the original pure-Python merge loop"""
+    x1_max = max(bbox1[0], bbox2[0])
+    y1_max = max(bbox1[1], bbox2[1])
+    x2_min = min(bbox1[2], bbox2[2])
+    y2_min = min(bbox1[3], bbox2[3])
+    if x2_min <= x1_max or y2_min <= y1_max:
+        return 0.0
+    intersection = (x2_min - x1_max) * (y2_min - y1_max)
+    area1 = (bbox1[2] - bbox1[0]) * (bbox1[3] - bbox1[1])
+    area2 = (bbox2[2] - bbox2[0]) * (bbox2[3] - bbox2[1])
+    union = area1 + area2 - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def _python_rank(boxes, scores, threshold):
+    order = sorted(range(len(boxes)), key=lambda i: scores[i], reverse=True)
+    kept = []
+    for i in order:
+        if not any(_python_iou(boxes[i], boxes[k]) > threshold for k in kept):
+            kept.append(i)
+    return kept[:4]
+
+
+def _python_merge(candidates, existing, threshold):
+    merged = list(existing)
+    for box in candidates:
+        if not any(_python_iou(box, other) > threshold for other in merged):
+            merged.append(box)
+    return merged
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark the vectorized detection merge engine against the pure-Python loops'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boxes', type=int, nargs='+', default=[8, 32, 64, 128],
+                            help='Candidate counts to benchmark')
+        parser.add_argument('--repeat', type=int, default=200, help='Iterations per measurement')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _time(self, func, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / repeat * 1e6  # microseconds per call
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        repeat = options['repeat']
+
+        self.stdout.write(f"{'boxes':>6} | {'rank py':>10} {'rank np':>10} {'wbf np':>10} | "
+                          f"{'merge py':>10} {'merge np':>10}   (us/call)")
+
+        for count in options['boxes']:
+            # Boxes clustered around four nut positions, as produced by the ultra-low passes
+            centers = rng.uniform(100, 900, size=(4, 2))
+            picks = centers[rng.integers(4, size=count)] + rng.normal(0, 20, size=(count, 2))
+            sizes = rng.uniform(40, 120, size=(count, 2))
+            boxes = np.concatenate([picks - sizes / 2, picks + sizes / 2], axis=1)
+            scores = rng.uniform(0.05, 0.95, size=count)
+
+            box_list = boxes.tolist()
+            score_list = scores.tolist()
+            existing = box_list[:4]
+            candidates = box_list[4:]
+
+            rank_py = self._time(lambda: _python_rank(box_list, score_list, 0.5), repeat)
+            rank_np = self._time(lambda: greedy_nms(boxes, scores, 0.5, max_keep=4), repeat)
+            wbf_np = self._time(lambda: weighted_box_fusion(boxes, scores, 0.5), repeat)
+            merge_py = self._time(lambda: _python_merge(candidates, existing, 0.3), repeat)
+            merge_np = self._time(lambda: select_non_overlapping(boxes[4:], boxes[:4], 0.3), repeat)
+
+            self.stdout.write(f"{count:>6} | {rank_py:>10.1f} {rank_np:>10.1f} {wbf_np:>10.1f} | "
+                              f"{merge_py:>10.1f} {merge_np:>10.1f}")
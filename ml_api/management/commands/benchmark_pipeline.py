@@ -0,0 +1,267 @@
+# ml_api/management/commands/benchmark_pipeline.py - Replay a corpus through the detection service
+
+import os
+import glob
+import json
+import shutil
+import tempfile
+import platform
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import MappingProxyType
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_api.annotations import AnnotationStore
+from ml_api.image_writer import get_image_writer
+from ml_api.inference_engines import STUB_NUT_POSITIONS, STUB_NUT_SIZE, StubEngine
+from ml_api.micro_batching import MicroBatchingEngine
+from ml_api.services import FlexibleNutDetectionService
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_frame(index, shape=(1080, 1440), seed=0):
+    """Fixture-like frame: textured plate, four dark nuts at the stub positions, some missing, lighting drift"""
+    rng = np.random.default_rng([seed, index])
+    height, width = shape
+    plate = rng.normal(150, 12, size=(height // 8, width // 8)).astype(np.float32)
+    frame = cv2.resize(plate, (width, height), interpolation=cv2.INTER_LINEAR)
+    radius = int(STUB_NUT_SIZE * min(height, width) / 2)
+    for x, y in STUB_NUT_POSITIONS:
+        if rng.random() < 0.1:
+            continue  # Missing nut: bare hole
+        center = (int(x * width), int(y * height))
+        cv2.circle(frame, center, radius, 60.0, -1)
+        cv2.circle(frame, center, radius // 2, 110.0, -1)
+    frame *= rng.uniform(0.6, 1.3)  # Exposure varies from part to part
+    frame += rng.normal(0, 4, size=frame.shape).astype(np.float32)
+    return cv2.cvtColor(np.clip(frame, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+def _summary(samples):
+    samples = np.asarray(samples) * 1000
+    summary = {f'p{p}': round(float(np.percentile(samples, p)), 3) for p in PERCENTILES}
+    summary.update({'mean': round(float(samples.mean()), 3), 'count': int(len(samples))})
+    return summary
+
+
+def _config_value(text):
+    """--config values are JSON (numbers, booleans, lists, null); anything else is a string"""
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return text
+    return tuple(value) if isinstance(value, list) else value
+
+
+class Command(BaseCommand):
+    help = ('Replay an image corpus (directory or synthetic frames) through FlexibleNutDetectionService '
+            'and report throughput and per-stage p50/p95/p99 latency. The default stub engine needs no '
+            'model file; --compare checks the run against an earlier --output JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help='Directory of images to replay (default: synthetic frames)')
+        parser.add_argument('--synthetic', type=int, default=50, help='Synthetic frames without --corpus')
+        parser.add_argument('--frame-size', default='1440x1080', help='Synthetic frame size WIDTHxHEIGHT')
+        parser.add_argument('--repeat', type=int, default=1, help='Passes over the corpus')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed inspections before the run')
+        parser.add_argument('--concurrency', type=int, default=1, help='Inspections in flight (threads)')
+        parser.add_argument('--engine', choices=['stub', 'model'], default='stub',
+                            help="'stub' (deterministic, no model file) or 'model' (the configured engine)")
+        parser.add_argument('--stub-call-ms', type=float, default=2.0, help='Stub latency per predict call')
+        parser.add_argument('--stub-image-ms', type=float, default=15.0,
+                            help='Stub latency per frame at 640 px (scaled by input area)')
+        parser.add_argument('--stub-jitter', type=float, default=0.0, help='Stub latency jitter (fraction)')
+        parser.add_argument('--stub-missing-rate', type=float, default=0.1, help='Share of nuts the stub calls MISSING')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--config', action='append', default=[], metavar='KEY=VALUE',
+                            help="Service config override, e.g. --config merge_mode=wbf (repeatable)")
+        parser.add_argument('--cache', action='store_true',
+                            help='Keep the result cache (off by default: repeats would be cache hits)')
+        parser.add_argument('--output', help='Write the results as JSON')
+        parser.add_argument('--compare', help='Earlier --output JSON to compare against')
+        parser.add_argument('--max-regression', type=float, default=None,
+                            help='Fail if inspection p95 is this fraction slower than --compare (e.g. 0.1)')
+
+    def handle(self, *args, **options):
+        work_dir = tempfile.mkdtemp(prefix='nut-benchmark-')
+        try:
+            paths = self._corpus(options, work_dir)
+            service = self._service(options, work_dir)
+            report = self._run(service, paths, options)
+        finally:
+            get_image_writer().flush()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        self._print(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            self._compare(report, options)
+
+    def _corpus(self, options, work_dir):
+        """Image paths to replay; synthetic frames are written to ``work_dir`` so they are decoded like uploads"""
+        if options['corpus']:
+            paths = sorted(path for pattern in IMAGE_PATTERNS
+                           for path in glob.glob(os.path.join(options['corpus'], pattern)))
+            if not paths:
+                raise CommandError(f"No images in {options['corpus']}")
+            return paths
+
+        try:
+            width, height = (int(value) for value in options['frame_size'].lower().split('x'))
+        except ValueError:
+            raise CommandError(f"Invalid --frame-size: {options['frame_size']} (expected WIDTHxHEIGHT)")
+        paths = []
+        for index in range(options['synthetic']):
+            path = os.path.join(work_dir, f'synthetic_{index:05d}.jpg')
+            cv2.imwrite(path, synthetic_frame(index, (height, width), options['seed']), [cv2.IMWRITE_JPEG_QUALITY, 95])
+            paths.append(path)
+        return paths
+
+    def _service(self, options, work_dir):
+        """Service instance of its own: stub or configured engine, benchmark annotations, config overrides"""
+        engine = None
+        if options['engine'] == 'stub':
+            engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+            replicas = [
+                StubEngine(call_ms=options['stub_call_ms'], image_ms=options['stub_image_ms'],
+                           jitter=options['stub_jitter'], missing_rate=options['stub_missing_rate'],
+                           seed=options['seed'])
+                for _ in range(max(1, engine_config.get('MODEL_REPLICAS', 1)))
+            ]
+            # Same queueing in front of the stub as in front of a real engine
+            micro_batching = engine_config.get('MICRO_BATCHING', True)
+            engine = MicroBatchingEngine(
+                replicas,
+                max_batch=engine_config.get('BATCH_MAX_SIZE', 8) if micro_batching else 1,
+                max_delay_ms=engine_config.get('BATCH_MAX_DELAY_MS', 5.0) if micro_batching else 0.0
+            )
+
+        service = FlexibleNutDetectionService(engine=engine)
+        if not service.ensure_loaded():
+            raise CommandError(f"Model not loaded: {service.load_error}")
+
+        overrides = {}
+        for item in options['config']:
+            key, separator, value = item.partition('=')
+            if not separator or key not in service.config:
+                raise CommandError(f"Invalid --config {item!r} (keys: {', '.join(sorted(service.config))})")
+            overrides[key] = _config_value(value)
+        service.config = MappingProxyType({**service.config, **overrides})
+        self.overrides = overrides
+
+        service.annotations = AnnotationStore(os.path.join(work_dir, 'annotations'))
+        if not options['cache']:
+            service.result_cache = None
+        return service
+
+    def _run(self, service, paths, options):
+        for index in range(min(options['warmup'], len(paths))):
+            service.process_image_with_id(paths[index], f'warmup_{index:05d}')
+        service.stage_timer.reset()
+
+        jobs = [(repeat, index, path) for repeat in range(options['repeat']) for index, path in enumerate(paths)]
+
+        def inspect(job):
+            repeat, index, path = job
+            started_at = time.perf_counter()
+            result = service.process_image_with_id(path, f'bench_{repeat}_{index:05d}')
+            return job, result, time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as executor:
+            outcomes = list(executor.map(inspect, jobs))
+        wall_seconds = time.perf_counter() - started_at
+
+        stage_samples = {}
+        statuses = Counter()
+        decisions = {}
+        failures = 0
+        for (repeat, index, path), result, seconds in outcomes:
+            stage_samples.setdefault('end_to_end', []).append(seconds)
+            for stage, ms in (result.get('timings') or {}).items():
+                stage_samples.setdefault(stage, []).append(ms / 1000)
+            if not result.get('success'):
+                failures += 1
+                statuses['FAILED' if not result.get('retake') else 'RETAKE'] += 1
+                continue
+            statuses[result['decision']['status']] += 1
+            if repeat == 0:
+                decisions[os.path.basename(path)] = result['decision']['status']
+
+        return {
+            'created': datetime.now().isoformat(),
+            'corpus': options['corpus'] or f"synthetic:{options['synthetic']}@{options['frame_size']}",
+            'frames': len(paths),
+            'repeat': options['repeat'],
+            'concurrency': options['concurrency'],
+            'inspections': len(outcomes),
+            'failures': failures,
+            'wall_seconds': round(wall_seconds, 3),
+            'throughput_per_second': round(len(outcomes) / wall_seconds, 3) if wall_seconds else None,
+            'engine': service.engine.describe(),
+            'config_overrides': {key: list(value) if isinstance(value, tuple) else value
+                                 for key, value in self.overrides.items()},
+            'environment': {'python': platform.python_version(), 'opencv': cv2.__version__,
+                            'numpy': np.__version__, 'cpus': os.cpu_count()},
+            'stages': {stage: _summary(samples) for stage, samples in sorted(stage_samples.items())},
+            'statuses': dict(statuses),
+            'decisions': decisions
+        }
+
+    def _print(self, report):
+        self.stdout.write(f"{report['inspections']} inspections of {report['frames']} frames "
+                          f"({report['corpus']}), concurrency {report['concurrency']}: "
+                          f"{report['throughput_per_second']} parts/s, {report['failures']} failed")
+        self.stdout.write(f"Decisions: {report['statuses']}")
+        self.stdout.write(f"{'stage':<24} | {'count':>6} | {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+        for stage, summary in report['stages'].items():
+            self.stdout.write(f"{stage:<24} | {summary['count']:>6} | {summary['p50']:>9.2f} {summary['p95']:>9.2f} "
+                              f"{summary['p99']:>9.2f} {summary['mean']:>9.2f}")
+
+    def _compare(self, report, options):
+        try:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read --compare file: {e}")
+
+        self.stdout.write(f"Compared with {options['compare']} ({baseline.get('created')}):")
+        # Latencies are only comparable between runs of the same corpus, load and engine timing
+        engine_keys = ('engine', 'call_ms', 'image_ms', 'scale_with_size', 'jitter', 'missing_rate', 'seed')
+        differences = [key for key in ('corpus', 'frames', 'repeat', 'concurrency', 'config_overrides')
+                       if report[key] != baseline.get(key)]
+        differences += [f'engine.{key}' for key in engine_keys
+                        if report['engine'].get(key) != baseline.get('engine', {}).get(key)]
+        if differences:
+            self.stdout.write(self.style.WARNING(f"Runs differ in: {', '.join(differences)}"))
+        self.stdout.write(f"{'stage':<24} | {'p50 ratio':>9} {'p95 ratio':>9}")
+        for stage, summary in report['stages'].items():
+            before = baseline.get('stages', {}).get(stage)
+            if not before or not before['p50'] or not before['p95']:
+                continue
+            self.stdout.write(f"{stage:<24} | {summary['p50'] / before['p50']:>9.2f} "
+                              f"{summary['p95'] / before['p95']:>9.2f}")
+
+        # With the stub engine a changed decision is a cascade / post-processing regression
+        changed = sorted(name for name, status in report['decisions'].items()
+                         if name in baseline.get('decisions', {}) and baseline['decisions'][name] != status)
+        if changed:
+            self.stdout.write(self.style.WARNING(f"{len(changed)} decisions changed: {', '.join(changed[:10])}"))
+
+        if options['max_regression'] is not None:
+            before = baseline.get('stages', {}).get('inspection', {}).get('p95')
+            after = report['stages'].get('inspection', {}).get('p95')
+            if before and after and after > before * (1 + options['max_regression']):
+                raise CommandError(f"Inspection p95 regressed from {before} ms to {after} ms "
+                                   f"(limit +{options['max_regression']:.0%})")
@@ -0,0 +1,80 @@
+# ml_api/management/commands/build_prescreen_templates.py - Nut templates for the classical pre-screen
+
+import os
+import random
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_api.fixture_layout import FixtureLayout
+from ml_api.management.commands.quantize_nut_model import find_inspection_images
+from ml_api.prescreen import NutPrescreen
+
+
+class Command(BaseCommand):
+    help = ('Build the pre-screen templates from stored OK inspections and report template scores '
+            'of held-out OK and NG parts, to choose PRESCREEN_THRESHOLD')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inspections-root', default=os.path.join(settings.MEDIA_ROOT, 'inspections'))
+        parser.add_argument('--output', help='Template file (default: NUT_DETECTION_CONFIG PRESCREEN_PATH)')
+        parser.add_argument('--max-images', type=int, default=200, help='OK images used for the templates')
+        parser.add_argument('--holdout', type=float, default=0.3, help='Fraction of OK images kept for scoring')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+        layout = FixtureLayout.load(engine_config.get('FIXTURE_LAYOUT_PATH'))
+        if layout is None:
+            raise CommandError("No fixture layout; run 'python manage.py register_fixture_layout' first")
+
+        images = find_inspection_images(options['inspections_root'])
+        ok_paths = [path for path, status in images if status == 'OK']
+        ng_paths = [path for path, status in images if status == 'NG']
+        if not ok_paths:
+            raise CommandError(f"No stored OK inspections under {options['inspections_root']}")
+        random.Random(options['seed']).shuffle(ok_paths)
+        holdout_count = int(len(ok_paths) * options['holdout'])
+        holdout_paths, build_paths = ok_paths[:holdout_count], ok_paths[holdout_count:][:options['max_images']]
+
+        try:
+            prescreen = NutPrescreen.build((image for image in map(cv2.imread, build_paths) if image is not None),
+                                           layout)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Templates built from {prescreen.metadata['images']} OK images")
+
+        # The pre-screen passes a part when its weakest region reaches the threshold
+        ok_scores = self._min_scores(prescreen, layout, holdout_paths)
+        ng_scores = self._min_scores(prescreen, layout, ng_paths)
+        for label, scores in (('OK (held out)', ok_scores), ('NG', ng_scores)):
+            if len(scores):
+                self.stdout.write(f"{label:>14}: {len(scores)} parts, weakest-region score "
+                                  f"min {scores.min():.3f} p50 {np.median(scores):.3f} max {scores.max():.3f}")
+        if len(ng_scores):
+            # An NG part above the threshold would be passed without YOLO in 'skip' mode
+            safe_threshold = min(float(ng_scores.max()) + 0.02, 1.0)
+            prescreen.metadata['max_ng_score'] = round(float(ng_scores.max()), 4)
+            prescreen.metadata['suggested_threshold'] = round(safe_threshold, 4)
+            coverage = float((ok_scores >= safe_threshold).mean()) if len(ok_scores) else 0.0
+            self.stdout.write(f"Suggested PRESCREEN_THRESHOLD >= {safe_threshold:.3f} "
+                              f"(passes {coverage:.0%} of held-out OK parts)")
+
+        output = options['output'] or engine_config.get('PRESCREEN_PATH')
+        if not output:
+            raise CommandError("No --output given and PRESCREEN_PATH is not configured")
+        prescreen.save(output)
+        self.stdout.write(self.style.SUCCESS(f"Pre-screen templates saved to {output}"))
+
+    def _min_scores(self, prescreen, layout, paths):
+        scores = []
+        for path in paths:
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            region_scores = prescreen.scores(image, layout)
+            if region_scores is not None:
+                scores.append(float(region_scores.min()))
+        return np.asarray(scores)
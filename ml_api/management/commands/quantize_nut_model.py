@@ -0,0 +1,246 @@
+# ml_api/management/commands/quantize_nut_model.py - INT8 post-training quantization with an accuracy/latency gate
+
+import os
+import glob
+import json
+import time
+import random
+from datetime import datetime
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_api.detection_merge import box_iou_matrix
+from ml_api.detections import CLASS_MISSING, CLASS_PRESENT, DEFAULT_CLASS_NAMES
+from ml_api.inference_engines import (
+    DEFAULT_IMGSZ,
+    OnnxRuntimeEngine,
+    export_model,
+    letterbox,
+    quantization_report_path,
+    quantized_model_path,
+)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def find_inspection_images(inspections_root):
+    """Stored originals: media/inspections/<image_id>/<OK|NG>/original/*"""
+    images = []
+    for status in ('OK', 'NG'):
+        pattern = os.path.join(inspections_root, '*', status, 'original', '*')
+        images.extend((path, status) for path in sorted(glob.glob(pattern))
+                      if path.lower().endswith(IMAGE_EXTENSIONS))
+    return images
+
+
+class _CalibrationReader:
+    """onnxruntime CalibrationDataReader feeding letterboxed inspection images one at a time"""
+
+    def __init__(self, image_paths, input_name, imgsz):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._index = 0
+
+    def get_next(self):
+        while self._index < len(self.image_paths):
+            image = cv2.imread(self.image_paths[self._index])
+            self._index += 1
+            if image is None:
+                continue
+            padded, _, _ = letterbox(image, self.imgsz, auto=False)
+            batch = np.ascontiguousarray(padded[None, ..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+            return {self.input_name: batch}
+        return None
+
+    def rewind(self):
+        self._index = 0
+
+
+def _matched_boxes(reference, candidate, iou_threshold=0.5):
+    """Number of candidate boxes that match a distinct reference box (greedy, by IoU)"""
+    if not len(reference) or not len(candidate):
+        return 0
+    ious = box_iou_matrix(reference, candidate)
+    matched = 0
+    while ious.size and ious.max() >= iou_threshold:
+        i, j = np.unravel_index(np.argmax(ious), ious.shape)
+        ious[i, :] = 0
+        ious[:, j] = 0
+        matched += 1
+    return matched
+
+
+def _latency_summary(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'mean_ms': round(float(latencies.mean()), 2)
+    }
+
+
+class Command(BaseCommand):
+    help = ('Quantize the nut detector to INT8 (ONNX Runtime) using stored inspection images, '
+            'then compare it against the FP32 model and write the gate report')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inspections-dir', default=os.path.join(settings.MEDIA_ROOT, 'inspections'),
+                            help='Root of the stored inspections (<image_id>/<OK|NG>/original/)')
+        parser.add_argument('--calibration-images', type=int, default=100,
+                            help='Number of images used for calibration')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Maximum number of images used for the comparison (default: all)')
+        parser.add_argument('--no-per-channel', dest='per_channel', action='store_false',
+                            help='Quantize weights per tensor instead of per channel')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-quantize', action='store_true',
+                            help='Re-evaluate an existing INT8 model without quantizing again')
+
+    def handle(self, *args, **options):
+        try:
+            from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+        except ImportError:
+            raise CommandError("onnxruntime is required: pip install onnxruntime")
+
+        model_path = settings.NUT_DETECTION_MODEL_PATH
+        engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+        imgsz = engine_config.get('EXPORT_IMGSZ', DEFAULT_IMGSZ)
+        threads = engine_config.get('ENGINE_THREADS')
+        min_agreement = engine_config.get('INT8_MIN_DECISION_AGREEMENT', 0.995)
+        max_false_ok = engine_config.get('INT8_MAX_FALSE_OK', 0)
+
+        images = find_inspection_images(options['inspections_dir'])
+        if not images:
+            raise CommandError(f"No stored inspection images under {options['inspections_dir']}")
+        random.Random(options['seed']).shuffle(images)
+        if options['limit']:
+            images = images[:options['limit']]
+        self.stdout.write(f"Corpus: {len(images)} images "
+                          f"({sum(1 for _, s in images if s == 'OK')} OK / {sum(1 for _, s in images if s == 'NG')} NG)")
+
+        fp32_path = export_model(model_path, 'onnx', imgsz=imgsz)
+        int8_path = quantized_model_path(model_path)
+
+        calibration = [path for path, _ in images[:options['calibration_images']]]
+        if not options['skip_quantize']:
+            self.stdout.write(f"Quantizing {fp32_path} with {len(calibration)} calibration images...")
+            fp32_engine = OnnxRuntimeEngine(model_path, threads=threads, imgsz=imgsz, artifact=fp32_path).load()
+            reader = _CalibrationReader(calibration, fp32_engine.input_name, imgsz)
+            start_time = time.time()
+            quantize_static(
+                fp32_path, int8_path, reader,
+                quant_format=QuantFormat.QDQ,
+                per_channel=options['per_channel'],
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                calibrate_method=CalibrationMethod.MinMax
+            )
+            self.stdout.write(f"INT8 model written to {int8_path} ({time.time() - start_time:.1f}s)")
+        elif not os.path.exists(int8_path):
+            raise CommandError(f"No INT8 model at {int8_path}")
+
+        report = self._compare(model_path, fp32_path, int8_path, images, threads, imgsz)
+        report.update({
+            'created': datetime.now().isoformat(),
+            'model_path': model_path,
+            'fp32_model': fp32_path,
+            'int8_model': int8_path,
+            'calibration_images': len(calibration),
+            'min_decision_agreement': min_agreement,
+            'max_false_ok': max_false_ok,
+        })
+        report['approved'] = report['decision_agreement'] >= min_agreement and report['false_ok'] <= max_false_ok
+
+        report_path = quantization_report_path(model_path)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self._print_report(report)
+        self.stdout.write(f"Report written to {report_path}")
+        if report['approved']:
+            self.stdout.write(self.style.SUCCESS("INT8 model APPROVED - used when NUT_DETECTION_CONFIG['USE_INT8'] is on"))
+        else:
+            self.stdout.write(self.style.WARNING("INT8 model NOT approved - the service keeps the FP32 model"))
+
+    def _compare(self, model_path, fp32_path, int8_path, images, threads, imgsz):
+        """Run the full detection pipeline with both models on every corpus image"""
+        from ml_api.services import FlexibleNutDetectionService
+
+        services = {
+            name: FlexibleNutDetectionService(
+                engine=OnnxRuntimeEngine(model_path, threads=threads, imgsz=imgsz, artifact=path).load())
+            for name, path in (('fp32', fp32_path), ('int8', int8_path))
+        }
+        config = services['fp32'].config
+
+        latencies = {'fp32': [], 'int8': []}
+        class_matched = {CLASS_MISSING: 0, CLASS_PRESENT: 0}
+        class_total = {CLASS_MISSING: 0, CLASS_PRESENT: 0}
+        decisions_agree = false_ok = false_ng = evaluated = 0
+
+        for path, _ in images:
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            evaluated += 1
+
+            final = {}
+            approved = {}
+            for name, service in services.items():
+                # Raw model latency at the primary settings
+                start_time = time.perf_counter()
+                service.engine.predict([frame], conf=config['primary_confidence'],
+                                       iou=config['iou_threshold'], max_det=config['max_detections'])
+                latencies[name].append(time.perf_counter() - start_time)
+
+                final[name] = service._run_detection(frame, os.path.basename(path))
+                decision = service._apply_business_logic(final[name], os.path.basename(path))
+                approved[name] = decision['status'] == 'ALL_NUTS_PRESENT'
+
+            if approved['fp32'] == approved['int8']:
+                decisions_agree += 1
+            elif approved['int8']:
+                false_ok += 1
+            else:
+                false_ng += 1
+
+            for class_id in class_matched:
+                reference = final['fp32'].boxes[final['fp32'].class_ids == class_id]
+                candidate = final['int8'].boxes[final['int8'].class_ids == class_id]
+                class_matched[class_id] += _matched_boxes(reference, candidate)
+                class_total[class_id] += max(len(reference), len(candidate))
+
+        if not evaluated:
+            raise CommandError("None of the corpus images could be read")
+
+        fp32_latency = _latency_summary(latencies['fp32'])
+        int8_latency = _latency_summary(latencies['int8'])
+        return {
+            'images': evaluated,
+            'per_class_agreement': {
+                DEFAULT_CLASS_NAMES[class_id]: round(class_matched[class_id] / class_total[class_id], 4)
+                if class_total[class_id] else 1.0
+                for class_id in class_matched
+            },
+            'decision_agreement': round(decisions_agree / evaluated, 4),
+            'false_ok': false_ok,
+            'false_ng': false_ng,
+            'latency': {'fp32': fp32_latency, 'int8': int8_latency},
+            'speedup_p50': round(fp32_latency['p50_ms'] / max(int8_latency['p50_ms'], 1e-6), 2)
+        }
+
+    def _print_report(self, report):
+        self.stdout.write(f"Images compared:      {report['images']}")
+        for class_name, agreement in report['per_class_agreement'].items():
+            self.stdout.write(f"{class_name + ' agreement:':<22}{agreement:.2%}")
+        self.stdout.write(f"OK/NG agreement:      {report['decision_agreement']:.2%} "
+                          f"(false OK: {report['false_ok']}, false NG: {report['false_ng']})")
+        for name in ('fp32', 'int8'):
+            latency = report['latency'][name]
+            self.stdout.write(f"{name.upper()} latency:         p50 {latency['p50_ms']:.1f} ms, "
+                              f"p95 {latency['p95_ms']:.1f} ms")
+        self.stdout.write(f"Speedup (p50):        {report['speedup_p50']:.2f}x")
@@ -0,0 +1,65 @@
+# ml_api/management/commands/register_fixture_layout.py - Register where the nuts sit in the fixture
+
+import cv2
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_api.fixture_layout import FixtureLayout
+
+
+def _parse_box(value):
+    try:
+        box = [float(v) for v in value.split(',')]
+    except ValueError:
+        box = []
+    if len(box) != 4 or box[2] <= box[0] or box[3] <= box[1]:
+        raise CommandError(f"Invalid box '{value}', expected x1,y1,x2,y2")
+    return box
+
+
+class Command(BaseCommand):
+    help = ('Register the fixture layout (nut1..nut4 regions) used for ROI inference and stable nut '
+            'positions, from a reference image with all nuts present or from explicit boxes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', required=True,
+                            help='Reference frame from the inspection camera, every nut present')
+        parser.add_argument('--boxes', nargs='+', metavar='X1,Y1,X2,Y2',
+                            help='Nut regions in reference-frame pixels (default: detect them in --image)')
+        parser.add_argument('--output', help='Layout file (default: NUT_DETECTION_CONFIG FIXTURE_LAYOUT_PATH)')
+
+    def handle(self, *args, **options):
+        image = cv2.imread(options['image'])
+        if image is None:
+            raise CommandError(f"Cannot read image: {options['image']}")
+
+        from ml_api.services import enhanced_nut_detection_service as service
+        expected_nuts = service.config['expected_nuts']
+
+        if options['boxes']:
+            boxes = [_parse_box(value) for value in options['boxes']]
+        else:
+            if not service.ensure_loaded():
+                raise CommandError(f"Model not loaded: {service.load_error}")
+            # Always the full-frame pipeline: an existing layout must not influence the new one
+            with service.engine.session():
+                detections = service._filter_and_rank_detections(
+                    service._run_full_frame_detection(image, service.config))
+            boxes = detections.boxes.tolist()
+            for box, confidence in zip(boxes, detections.confidences.tolist()):
+                self.stdout.write(f"  detected [{', '.join(f'{v:.0f}' for v in box)}] conf {confidence:.3f}")
+
+        if len(boxes) != expected_nuts:
+            raise CommandError(f"Expected {expected_nuts} nut regions, got {len(boxes)}; "
+                               f"use a frame with every nut clearly present or pass --boxes")
+
+        output = options['output'] or getattr(settings, 'NUT_DETECTION_CONFIG', {}).get('FIXTURE_LAYOUT_PATH')
+        if not output:
+            raise CommandError("No --output given and FIXTURE_LAYOUT_PATH is not configured")
+
+        layout = FixtureLayout.from_boxes(boxes, image.shape, reference_image=options['image'])
+        layout.save(output)
+        for index, region in enumerate(layout.regions.tolist(), 1):
+            self.stdout.write(f"nut{index}: [{', '.join(f'{v:.0f}' for v in region)}]")
+        self.stdout.write(self.style.SUCCESS(
+            f"Fixture layout for {layout.frame_shape[1]}x{layout.frame_shape[0]} frames saved to {output}"))
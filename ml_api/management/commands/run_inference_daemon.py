@@ -0,0 +1,53 @@
+# ml_api/management/commands/run_inference_daemon.py - Standalone process that owns the nut detection model
+
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ml_api.inference_daemon import InferenceDaemon, daemon_address
+
+
+class Command(BaseCommand):
+    help = ('Run the inference daemon: loads the nut detection model once and serves frames '
+            'from all web workers over a Unix socket (localhost TCP on Windows)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', help='Unix socket path (overrides DAEMON_SOCKET)')
+        parser.add_argument('--host', help='TCP host (overrides DAEMON_HOST, implies TCP)')
+        parser.add_argument('--port', type=int, help='TCP port (overrides DAEMON_PORT, implies TCP)')
+        parser.add_argument('--no-warmup', action='store_true', help='Skip the warm-up inferences')
+
+    def handle(self, *args, **options):
+        from ml_api.services import enhanced_nut_detection_service
+
+        engine_config = dict(getattr(settings, 'NUT_DETECTION_CONFIG', {}))
+        if options['socket']:
+            engine_config['DAEMON_SOCKET'] = options['socket']
+        if options['host'] or options['port']:
+            engine_config['DAEMON_USE_TCP'] = True
+            engine_config['DAEMON_HOST'] = options['host'] or engine_config.get('DAEMON_HOST', '127.0.0.1')
+            engine_config['DAEMON_PORT'] = options['port'] or engine_config.get('DAEMON_PORT', 8765)
+        address = daemon_address(engine_config)
+
+        self.stdout.write("Loading nut detection model...")
+        if not enhanced_nut_detection_service.preload(warmup=not options['no_warmup']):
+            self.stderr.write(self.style.ERROR(f"Model failed to load: {enhanced_nut_detection_service.load_error}"))
+            return
+
+        startup = enhanced_nut_detection_service.startup_stats
+        self.stdout.write(self.style.SUCCESS(
+            f"Model ready (load {startup['load_time']}s, warm-up {startup['warmup_time']}s), "
+            f"listening on {address}"))
+
+        daemon = InferenceDaemon(enhanced_nut_detection_service, address)
+
+        def stop(signum, frame):
+            # shutdown() blocks until serve_forever returns, so call it off the main thread
+            threading.Thread(target=daemon.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        daemon.serve_forever()
+        self.stdout.write("Inference daemon stopped")
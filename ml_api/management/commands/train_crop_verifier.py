@@ -0,0 +1,115 @@
+# ml_api/management/commands/train_crop_verifier.py - Train the second-stage PRESENT/MISSING crop verifier
+
+import os
+import random
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_api.crop_verifier import CropVerifier, crop_features
+from ml_api.detections import CLASS_MISSING, CLASS_PRESENT
+from ml_api.management.commands.quantize_nut_model import find_inspection_images
+
+
+class Command(BaseCommand):
+    help = ('Train the crop verifier on stored inspections: confident detections are the labelled crops, '
+            'OK parts also label every registered fixture region PRESENT')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inspections-root', default=os.path.join(settings.MEDIA_ROOT, 'inspections'))
+        parser.add_argument('--output', help='Verifier file (default: NUT_DETECTION_CONFIG CROP_VERIFIER_PATH)')
+        parser.add_argument('--label-confidence', type=float, default=0.5,
+                            help='Detector confidence a box needs to be used as a label')
+        parser.add_argument('--max-images', type=int, default=2000)
+        parser.add_argument('--holdout', type=float, default=0.2, help='Fraction of images kept for evaluation')
+        parser.add_argument('--epochs', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _labelled_crops(self, service, image, status, label_confidence):
+        """(features, labels) for one stored original"""
+        config = service.config
+        detections = service._predict(image, 'verifier_labels', conf=label_confidence,
+                                      iou=config['iou_threshold'], max_det=config['max_detections'])
+        if status == 'OK' and detections.count(CLASS_MISSING):
+            return None  # The operator passed it but the detector sees a missing nut: ambiguous, skip
+        boxes = detections.boxes
+        labels = (detections.class_ids == CLASS_PRESENT).astype(np.float64)
+
+        layout = service.fixture_layout
+        regions = layout.regions_for(image.shape) if layout is not None else None
+        if status == 'OK' and regions is not None:
+            # Every nut of an OK part is present; regions without a confident box add PRESENT crops
+            covered = set(layout.assign(boxes, image.shape).tolist())
+            extra = [index for index in range(len(regions)) if index not in covered]
+            boxes = np.concatenate([boxes, regions[extra]])
+            labels = np.concatenate([labels, np.ones(len(extra))])
+
+        if not len(boxes):
+            return None
+        return crop_features(image, boxes), labels
+
+    def handle(self, *args, **options):
+        from ml_api.services import enhanced_nut_detection_service as service
+
+        images = find_inspection_images(options['inspections_root'])
+        if not images:
+            raise CommandError(f"No stored inspections under {options['inspections_root']}")
+        random.Random(options['seed']).shuffle(images)
+        images = images[:options['max_images']]
+
+        if not service.ensure_loaded():
+            raise CommandError(f"Model not loaded: {service.load_error}")
+
+        # Split by image so crops of one part never end up on both sides
+        holdout_count = int(len(images) * options['holdout'])
+        splits = {'train': ([], []), 'holdout': ([], [])}
+        for index, (path, status) in enumerate(images):
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            crops = self._labelled_crops(service, image, status, options['label_confidence'])
+            if crops is None:
+                continue
+            features, labels = splits['holdout' if index < holdout_count else 'train']
+            features.append(crops[0])
+            labels.append(crops[1])
+
+        train_features, train_labels = splits['train']
+        if not train_features:
+            raise CommandError("No labelled crops found")
+        train_labels = np.concatenate(train_labels)
+        self.stdout.write(f"Training on {len(train_labels)} crops "
+                          f"({int(train_labels.sum())} PRESENT, {int(len(train_labels) - train_labels.sum())} MISSING)")
+        try:
+            verifier = CropVerifier.train(np.concatenate(train_features), train_labels, epochs=options['epochs'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        holdout_features, holdout_labels = splits['holdout']
+        if holdout_features:
+            holdout_labels = np.concatenate(holdout_labels)
+            probabilities = verifier.probabilities(np.concatenate(holdout_features))
+            threshold = service.config['verifier_threshold']
+            sure = np.maximum(probabilities, 1 - probabilities) >= threshold
+            correct = (probabilities >= 0.5) == (holdout_labels == 1)
+            # A MISSING crop accepted as PRESENT would pass a bad part
+            false_present = int(np.count_nonzero(sure & (probabilities >= 0.5) & (holdout_labels == 0)))
+            verifier.metadata['holdout'] = {
+                'crops': int(len(holdout_labels)),
+                'accuracy': round(float(correct.mean()), 4),
+                'coverage': round(float(sure.mean()), 4),
+                'accuracy_when_sure': round(float(correct[sure].mean()), 4) if sure.any() else None,
+                'false_present': false_present
+            }
+            self.stdout.write(f"Holdout: {verifier.metadata['holdout']}")
+            if false_present:
+                self.stdout.write(self.style.WARNING(
+                    f"{false_present} MISSING holdout crops were accepted as PRESENT at threshold {threshold}"))
+
+        output = options['output'] or getattr(settings, 'NUT_DETECTION_CONFIG', {}).get('CROP_VERIFIER_PATH')
+        if not output:
+            raise CommandError("No --output given and CROP_VERIFIER_PATH is not configured")
+        verifier.save(output)
+        self.stdout.write(self.style.SUCCESS(f"Crop verifier saved to {output}"))
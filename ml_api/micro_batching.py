@@ -0,0 +1,189 @@
+# ml_api/micro_batching.py - Dynamic micro-batching in front of an inference engine
+
+"""
+Concurrent inspections (camera triggers, manual captures, uploads) each run
+several model passes. MicroBatchingEngine queues every predict() call and a
+single worker thread runs calls with identical parameters (conf, iou,
+max_det, imgsz) as one batched forward pass, for up to ``max_delay_ms`` or
+``max_batch`` images. Each caller blocks on its own Future.
+
+Inspections register with session(); while no other inspection is in
+flight the worker dispatches immediately, so a lone part never waits for the
+batching window.
+
+The queue is FIFO, so it is also the concurrency control for the model:
+with one engine every forward pass runs on one thread (no CPU
+oversubscription when triggers overlap with manual captures); with a pool
+of N replicas, N workers take batches from the same queue.
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _BatchRequest:
+    __slots__ = ('images', 'key', 'kwargs', 'method', 'future', 'enqueued_at', 'caller')
+
+    def __init__(self, images, kwargs, method):
+        self.images = images
+        self.kwargs = kwargs
+        self.key = tuple(sorted(kwargs.items()))
+        self.method = method
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.caller = threading.get_ident()
+
+
+class MicroBatchingEngine:
+    """Wraps an inference engine (or a pool of replicas); same predict() interface, batched across threads"""
+
+    def __init__(self, engines, max_batch=8, max_delay_ms=5.0, metrics_window=1000):
+        self.replicas = list(engines) if isinstance(engines, (list, tuple)) else [engines]
+        self.engine = self.replicas[0]
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay_ms / 1000.0
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._sessions = 0
+        self._workers = []
+
+        # Metrics (updated by the worker threads under the condition lock)
+        self._batch_sizes = {}
+        self._queue_delays = deque(maxlen=metrics_window)
+        self._batches = 0
+        self._images = 0
+
+    @property
+    def name(self):
+        return self.engine.name
+
+    def __getattr__(self, attribute):
+        # Everything else (model_path, artifact_path, ...) comes from the wrapped engine
+        return getattr(self.engine, attribute)
+
+    @contextmanager
+    def session(self):
+        """Mark one inspection as in flight (used to skip the batching window when alone)"""
+        with self._condition:
+            self._sessions += 1
+        try:
+            yield self
+        finally:
+            with self._condition:
+                self._sessions -= 1
+                self._condition.notify_all()
+
+    def predict(self, images, method='unknown', **kwargs):
+        if not images:
+            return []
+        request = _BatchRequest(list(images), kwargs, method)
+        with self._condition:
+            self._ensure_workers()
+            self._pending.append(request)
+            self._condition.notify_all()
+        return request.future.result()
+
+    def _ensure_workers(self):
+        """One worker thread per replica, started on first use (condition lock held)"""
+        if self._workers:
+            return
+        for index, engine in enumerate(self.replicas):
+            worker = threading.Thread(target=self._run, args=(engine,), name=f'nut-inference-{index}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _collect(self, key):
+        """Pending requests with the given parameters, oldest first, up to max_batch images"""
+        batch = []
+        count = 0
+        for request in self._pending:
+            if request.key != key:
+                continue
+            if batch and count + len(request.images) > self.max_batch:
+                break
+            batch.append(request)
+            count += len(request.images)
+        return batch, count
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                while not self._pending:
+                    self._condition.wait()
+
+                # Re-read the head every time: another replica may have taken it while we waited
+                first = self._pending[0]
+                batch, count = self._collect(first.key)
+                if count >= self.max_batch:
+                    break
+                # Another inspection can only join if more are in flight than are already waiting
+                waiting_callers = len({request.caller for request in self._pending})
+                if 0 < self._sessions <= waiting_callers:
+                    break
+                remaining = first.enqueued_at + self.max_delay - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            for request in batch:
+                self._pending.remove(request)
+            return batch
+
+    def _run(self, engine):
+        while True:
+            batch = self._next_batch()
+            dispatched_at = time.perf_counter()
+            images = [image for request in batch for image in request.images]
+            try:
+                results = engine.predict(images, **batch[0].kwargs)
+            except Exception as e:
+                logger.error(f"Batched inference failed ({len(images)} images): {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            offset = 0
+            for request in batch:
+                request_results = results[offset:offset + len(request.images)]
+                offset += len(request.images)
+                request.future.set_result([result.with_method(request.method) for result in request_results])
+
+            with self._condition:
+                self._batches += 1
+                self._images += len(images)
+                self._batch_sizes[len(images)] = self._batch_sizes.get(len(images), 0) + 1
+                self._queue_delays.extend(dispatched_at - request.enqueued_at for request in batch)
+
+    def metrics(self):
+        """Batch-size distribution and queueing delay (ms) of recent requests"""
+        with self._condition:
+            delays = np.asarray(self._queue_delays) * 1000
+            return {
+                'replicas': len(self.replicas),
+                'max_batch': self.max_batch,
+                'max_delay_ms': self.max_delay * 1000,
+                'batches': self._batches,
+                'images': self._images,
+                'average_batch_size': round(self._images / self._batches, 2) if self._batches else 0,
+                'batch_size_distribution': dict(sorted(self._batch_sizes.items())),
+                'queue_delay_ms': {
+                    'p50': round(float(np.percentile(delays, 50)), 3),
+                    'p95': round(float(np.percentile(delays, 95)), 3),
+                    'max': round(float(delays.max()), 3)
+                } if len(delays) else None,
+                'pending': len(self._pending),
+                'active_inspections': self._sessions
+            }
+
+    def describe(self):
+        description = self.engine.describe()
+        description['micro_batching'] = self.metrics()
+        return description
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_api', '0002_inspectionrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inspectionrecord',
+            name='qos_profile',
+            field=models.CharField(default='full', help_text='Cascade profile used (full / degraded)', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='inspectionrecord',
+            name='reinspection_required',
+            field=models.BooleanField(db_index=True, default=False, help_text='Inspected with a shortened cascade, inspect again'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_api', '0003_inspectionrecord_qos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inspectionrecord',
+            name='quality_scores',
+            field=models.TextField(blank=True, help_text='JSON object of frame quality scores'),
+        ),
+    ]
@@ -125,6 +125,12 @@ class InspectionRecord(models.Model):
     # Additional metadata
     processing_time = models.FloatField(default=0.0, help_text="Processing time in seconds")
     confidence_scores = models.TextField(blank=True, help_text="JSON array of confidence scores")
+    quality_scores = models.TextField(blank=True, help_text="JSON object of frame quality scores")
+    
+    # Load-aware QoS: the degraded profile skipped a cascade pass of this part
+    qos_profile = models.CharField(max_length=20, default='full', help_text="Cascade profile used (full / degraded)")
+    reinspection_required = models.BooleanField(default=False, db_index=True,
+                                                help_text="Inspected with a shortened cascade, inspect again")
     
     # Audit fields
     created_at = models.DateTimeField(auto_now_add=True)
@@ -172,6 +178,19 @@ class InspectionRecord(models.Model):
     def set_confidence_scores_list(self, scores_list):
         """Set confidence scores from a Python list"""
         self.confidence_scores = json.dumps(scores_list)
+    
+    def get_quality_scores(self):
+        """Get the quality gate scores of the frame as a dict"""
+        if self.quality_scores:
+            try:
+                return json.loads(self.quality_scores)
+            except json.JSONDecodeError:
+                return {}
+        return {}
+    
+    def set_quality_scores(self, quality):
+        """Set the quality gate scores of the frame from a dict"""
+        self.quality_scores = json.dumps(quality)
 
     @classmethod
     def get_ok_count(cls, start_date=None, end_date=None):
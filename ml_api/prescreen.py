@@ -0,0 +1,113 @@
+# ml_api/prescreen.py - Classical template-matching pre-screen for obviously-good parts
+
+"""
+Most parts are OK. NutPrescreen compares each registered nut region
+(ml_api.fixture_layout) with a template built from stored OK inspections,
+using CLAHE-normalised grayscale crops and normalised cross-correlation
+(cv2.matchTemplate). Four crops and four matches take a few milliseconds.
+
+If every region matches its template at or above the threshold, the part is
+"obviously good" and FlexibleNutDetectionService either skips the neural
+passes or runs only the primary pass (PRESCREEN_MODE). A sample of those
+parts is still run through the full pipeline as a shadow audit, so the
+pre-screen's agreement with YOLO is tracked over time. Build the templates
+with
+
+    python manage.py build_prescreen_templates
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MARGIN = 0.1  # Search window padding per side, fraction of the region size (part placement tolerance)
+
+
+def _normalise(gray):
+    """Local contrast normalisation shared by template building and matching"""
+    return cv2.createCLAHE(clipLimit=3.0, tileGridSize=(4, 4)).apply(gray)
+
+
+def region_crops(image, layout, margin=0.0):
+    """
+    Grayscale crops of the layout regions at the layout's reference scale
+
+    With ``margin`` > 0 each crop is padded (clipped to the frame) so the
+    template can be searched for around its registered position. Returns None
+    if the frame does not match the layout.
+    """
+    windows = layout.crop_windows(image.shape, margin)
+    if windows is None:
+        return None
+    scale = layout.frame_shape[1] / image.shape[1]  # Frame pixels -> reference pixels
+    crops = []
+    for x1, y1, x2, y2 in windows.tolist():
+        crop = image[y1:y2, x1:x2]
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        if scale != 1.0:
+            size = (max(int(round(crop.shape[1] * scale)), 1), max(int(round(crop.shape[0] * scale)), 1))
+            crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+        crops.append(_normalise(crop))
+    return crops
+
+
+class NutPrescreen:
+    """Per-region templates of a present nut and the match score that counts as certain"""
+
+    def __init__(self, templates, metadata=None):
+        self.templates = [np.asarray(template, dtype=np.uint8) for template in templates]
+        self.metadata = dict(metadata or {})
+
+    @classmethod
+    def build(cls, images, layout):
+        """Median region crop over reference images of OK parts (frames not matching the layout are skipped)"""
+        stacks = [[] for _ in range(len(layout))]
+        sizes = [(int(round(x2 - x1)), int(round(y2 - y1))) for x1, y1, x2, y2 in layout.regions.tolist()]
+        for image in images:
+            crops = region_crops(image, layout)
+            if crops is None:
+                continue
+            for stack, crop, size in zip(stacks, crops, sizes):
+                stack.append(cv2.resize(crop, size, interpolation=cv2.INTER_AREA))
+        if not stacks[0]:
+            raise ValueError("No reference image matches the fixture layout")
+        templates = [np.median(np.stack(stack), axis=0).astype(np.uint8) for stack in stacks]
+        return cls(templates, {'built_at': datetime.now().isoformat(), 'images': len(stacks[0])})
+
+    def scores(self, image, layout):
+        """Best normalised correlation per region (1.0 = identical), None if the frame does not match"""
+        crops = region_crops(image, layout, SEARCH_MARGIN)
+        if crops is None or len(crops) != len(self.templates):
+            return None
+        scores = np.zeros(len(self.templates), dtype=np.float32)
+        for index, (crop, template) in enumerate(zip(crops, self.templates)):
+            if crop.shape[0] < template.shape[0] or crop.shape[1] < template.shape[1]:
+                crop = cv2.resize(crop, (max(crop.shape[1], template.shape[1]), max(crop.shape[0], template.shape[0])))
+            scores[index] = cv2.matchTemplate(crop, template, cv2.TM_CCOEFF_NORMED).max()
+        return scores
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(f, metadata=json.dumps(self.metadata),
+                     **{f'template_{index}': template for index, template in enumerate(self.templates)})
+
+    @classmethod
+    def load(cls, path):
+        """Load saved templates; None if there are none (the pre-screen then stays off)"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                count = sum(1 for name in data.files if name.startswith('template_'))
+                return cls([data[f'template_{index}'] for index in range(count)], json.loads(str(data['metadata'])))
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Invalid pre-screen templates {path}: {e}")
+            return None
@@ -0,0 +1,79 @@
+# ml_api/quality_gate.py - Cheap image-quality checks in front of the detection cascade
+
+"""
+Blurred, badly exposed or empty-fixture frames rarely give four detections,
+so they used to pay for every fallback pass. assess_frame() scores a
+downscaled grayscale copy (longest side QUALITY_SIZE px) in about a
+millisecond:
+
+- sharpness: variance of the Laplacian (focus / motion blur)
+- exposure:  share of well-exposed pixels from the histogram, and the mean level
+- fixture:   Canny edge density in the registered nut regions (the whole
+             frame without a fixture layout); an empty fixture or a lens
+             cap gives almost no edges
+
+Thresholds are in the units of the downscaled copy, so they do not depend
+on the camera resolution.
+"""
+
+import cv2
+import numpy as np
+
+QUALITY_SIZE = 320
+DARK_LEVEL = 5      # Histogram bins at or below this count as crushed blacks
+BRIGHT_LEVEL = 250  # and at or above this as blown highlights
+
+SHARPNESS = 'sharpness'
+EXPOSURE = 'exposure'
+FIXTURE = 'fixture'
+
+
+def _downscaled_gray(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    scale = QUALITY_SIZE / max(gray.shape[:2])
+    if scale < 1:
+        gray = cv2.resize(gray, (max(int(gray.shape[1] * scale), 1), max(int(gray.shape[0] * scale), 1)),
+                          interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def assess_frame(image, config, layout=None):
+    """
+    Quality scores of a BGR frame and which checks failed
+
+    ``config`` is the detection service config snapshot (quality_* keys).
+    Returns a JSON-ready dict: the scores, 'failed' (list of check names) and
+    'passed'.
+    """
+    gray = _downscaled_gray(image)
+
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+    histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+    clipped = float(histogram[:DARK_LEVEL + 1].sum() + histogram[BRIGHT_LEVEL:].sum())
+    mean_level = float((histogram * np.arange(256)).sum())
+
+    edges = cv2.Canny(gray, 50, 150) > 0
+    if layout is not None:
+        windows = layout.crop_windows(gray.shape, margin=0.0)
+        if windows is not None:
+            edges = np.concatenate([edges[y1:y2, x1:x2].ravel() for x1, y1, x2, y2 in windows.tolist()])
+    edge_density = float(edges.mean()) if edges.size else 0.0
+
+    failed = []
+    if sharpness < config['quality_min_sharpness']:
+        failed.append(SHARPNESS)
+    if (clipped > config['quality_max_clipped'] or
+            not config['quality_min_mean'] <= mean_level <= config['quality_max_mean']):
+        failed.append(EXPOSURE)
+    if edge_density < config['quality_min_edge_density']:
+        failed.append(FIXTURE)
+
+    return {
+        'sharpness': round(sharpness, 2),
+        'exposure': round(1.0 - clipped, 4),
+        'mean_level': round(mean_level, 1),
+        'fixture_edge_density': round(edge_density, 4),
+        'failed': failed,
+        'passed': not failed
+    }
@@ -0,0 +1,177 @@
+# ml_api/result_cache.py - Content-hash cache of detection results for repeat inferences
+
+"""
+Operators re-upload the same image and retries resend the same frame; both
+used to re-run the whole detection cascade. ResultCache stores the final
+Detections of a frame under
+
+    blake2b(pixel buffer, shape, dtype) + fingerprint
+
+where the fingerprint covers everything that changes the result (config,
+model file, engine, fixture layout, verifier, pre-screen). A different
+fingerprint never matches, so confidence or model changes invalidate old
+entries automatically; update_confidence_levels also clears the cache.
+
+Entries are evicted least-recently-used beyond ``max_entries`` and when
+older than ``max_age``. With ``persist_dir`` each entry is also written as a
+small JSON file so results survive a restart.
+
+Hashing a 5 MP frame costs ~30 ms and live camera frames never repeat, so
+the service only looks up uploads and re-processed files; camera and
+trigger frames (process_frame(live=True)) skip the cache unless
+RESULT_CACHE_LIVE_FRAMES is set.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .detections import Detections
+
+logger = logging.getLogger(__name__)
+
+
+def frame_key(image, fingerprint):
+    """Hex key for a decoded frame (exact pixels) under a result fingerprint"""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{image.shape}|{image.dtype.str}|{fingerprint}'.encode('utf-8'))
+    digest.update(memoryview(image).cast('B'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Bounded, thread-safe LRU of Detections keyed by frame_key()"""
+
+    def __init__(self, max_entries=256, max_age=3600.0, persist_dir=None):
+        self.max_entries = max(1, int(max_entries))
+        self.max_age = max_age
+        self.persist_dir = persist_dir
+        self._entries = OrderedDict()  # key -> (stored_at, Detections)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+            self._prune_disk()
+
+    def _path(self, key):
+        return os.path.join(self.persist_dir, f'{key}.json')
+
+    def _expired(self, stored_at):
+        return self.max_age is not None and time.time() - stored_at > self.max_age
+
+    def get(self, key):
+        """Cached Detections (a copy) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None and self.persist_dir:
+                entry = self._read(key)
+                if entry is not None:
+                    self._store(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1][np.arange(len(entry[1]))]
+
+    def put(self, key, detections):
+        entry = (time.time(), detections[np.arange(len(detections))])
+        with self._lock:
+            self._store(key, entry)
+        if self.persist_dir:
+            self._write(key, entry)
+
+    def _store(self, key, entry):
+        """Insert and evict beyond max_entries (lock held)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            if self.persist_dir:
+                self._remove(evicted)
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Unreadable cached result {path}: {e}")
+            self._remove(key)
+            return None
+        if self._expired(data['stored_at']):
+            self._remove(key)
+            self.evictions += 1
+            return None
+        return data['stored_at'], Detections.from_dicts(data['detections'])
+
+    def _write(self, key, entry):
+        stored_at, detections = entry
+        path = self._path(key)
+        temporary_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(temporary_path, 'w') as f:
+                json.dump({'stored_at': stored_at, 'detections': detections.to_dicts(include_method=True)}, f)
+            os.replace(temporary_path, path)  # Readers never see a half-written entry
+        except OSError as e:
+            logger.error(f"Could not persist cached result {path}: {e}")
+
+    def _prune_disk(self):
+        """Apply age and size limits to entries persisted by a previous run"""
+        entries = []
+        for name in os.listdir(self.persist_dir):
+            if name.endswith('.json'):
+                path = os.path.join(self.persist_dir, name)
+                try:
+                    entries.append((os.path.getmtime(path), name[:-len('.json')]))
+                except OSError:
+                    continue
+        entries.sort(reverse=True)  # Newest first
+        for index, (modified_at, key) in enumerate(entries):
+            if index >= self.max_entries or self._expired(modified_at):
+                self._remove(key)
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Drop every entry (memory and disk)"""
+        with self._lock:
+            self._entries.clear()
+            if self.persist_dir:
+                for name in os.listdir(self.persist_dir):
+                    if name.endswith('.json'):
+                        self._remove(name[:-len('.json')])
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'max_age': self.max_age,
+                'persistent': bool(self.persist_dir),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions
+            }
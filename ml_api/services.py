@@ -3,22 +3,38 @@
 import os
 import cv2
 import numpy as np
-import base64
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, Optional
 from datetime import datetime
-import tempfile
 import logging
+import threading
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 from django.conf import settings
-from django.core.files.storage import default_storage
-import json
 
-try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
-except ImportError:
-    YOLO_AVAILABLE = False
-    print("WARNING: ultralytics not available. Please install: pip install ultralytics")
+from .detections import CLASS_MISSING, CLASS_PRESENT, Detections
+from .detection_merge import (
+    fuse_into_existing,
+    greedy_nms,
+    select_non_overlapping,
+    weighted_box_fusion,
+)
+from .inference_engines import DEFAULT_ENGINE, DEFAULT_IMGSZ, StubEngine, approved_int8_model, create_engine
+from .micro_batching import MicroBatchingEngine
+from .concurrency import ThreadLocalCounters
+from .fixture_layout import FixtureLayout
+from .crop_verifier import CropVerifier
+from .prescreen import NutPrescreen
+from .result_cache import ResultCache, frame_key
+from .cascade_policy import ALL_POSITIONS_FOUND, CONFIDENT_MISSING, CascadePolicy
+from .load_monitor import DEGRADED, LoadMonitor
+from .quality_gate import assess_frame
+from .enhancement import EnhancementEngine
+from .annotations import AnnotationStore, build_annotation, render_annotation
+from .image_writer import get_image_writer
+from .stage_timing import StageTimer, timed_stage
 
 logger = logging.getLogger(__name__)
 
@@ -30,28 +46,63 @@ class FlexibleNutDetectionService:
     - Any nut missing → RED boxes on all positions + report missing/present
     """
 
-    def __init__(self):
-        self.model = None
+    def __init__(self, engine=None):
+        self.engine = engine
+        self._load_lock = threading.Lock()
+        self.load_error = None
         self.model_path = getattr(settings, 'NUT_DETECTION_MODEL_PATH', 
                                  os.path.join(settings.BASE_DIR, 'models', 'industrial_nut_detection.pt'))
 
+        engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+
         # Configuration matching your ML model exactly
-        self.config = {
+        # Immutable snapshot: readers take self.config once, update_confidence_levels swaps it
+        self._config_lock = threading.Lock()
+        self.config = MappingProxyType({
             'confidence_threshold': 0.35,    # Primary confidence (configurable)
             'primary_confidence': 0.35,      # Same as above for backward compatibility
             'fallback_confidence': 0.25,     # Fallback detection confidence
             'minimum_confidence': 0.15,      # Minimum detection confidence
-            'ultra_low_confidence': [0.1, 0.05],  # Ultra low confidence levels
+            'ultra_low_confidence': (0.1, 0.05),  # Ultra low confidence levels
             'iou_threshold': 0.45,
-            'expected_classes': ['MISSING', 'PRESENT'],
+            'expected_classes': ('MISSING', 'PRESENT'),
             'target_size': (640, 640),
             'max_detections': 8,             # Allow more than 4 to filter later
             'overlap_threshold': 0.3,        # For removing duplicates
-            'multi_scales': [480, 640, 800, 1024],  # Multi-scale detection
-            'expected_nuts': 4
-        }
+            'rank_overlap_threshold': 0.5,   # Overlap used when ranking the final detections
+            'merge_mode': 'nms',             # 'nms' (greedy, keep first) or 'wbf' (weighted box fusion)
+            'multi_scales': (480, 640, 800, 1024),  # Multi-scale detection
+            'multi_scale_enabled': True,     # Run the multi-scale stage when detections are incomplete
+            'multi_scale_confidence': 0.25,  # Confidence used by (and to stop) the multi-scale stage
+            'expected_nuts': 4,
+            'single_pass_tiering': True,     # One inference at the lowest confidence, tiers by thresholding
+            'tiering_max_detections': 32,    # Candidate cap for the single tiered pass
+            'batched_enhancement': True,     # Run all enhancement variants in one batched call
+            'enhancement_workers': 3,        # Threads used to build enhancement variants
+            'enhancement_max_size': engine_config.get('ENHANCEMENT_MAX_SIZE'),  # Enhance a copy this size (None: full frame)
+            'roi_mode': engine_config.get('ROI_MODE', False),    # Detect on the registered nut regions only
+            'roi_margin': engine_config.get('ROI_MARGIN', 0.5),  # Crop padding, fraction of the region size
+            'roi_imgsz': engine_config.get('ROI_IMGSZ', 320),    # Inference size of the ROI crops
+            'crop_verifier_enabled': engine_config.get('CROP_VERIFIER_ENABLED', True),  # Replaces the ultra-low passes
+            'verifier_threshold': engine_config.get('CROP_VERIFIER_THRESHOLD', 0.8),    # Min P(class) to accept a crop
+            'prescreen_mode': engine_config.get('PRESCREEN_MODE', 'off'),              # 'off', 'primary_only' or 'skip'
+            'prescreen_threshold': engine_config.get('PRESCREEN_THRESHOLD', 0.9),      # Min template score, every region
+            'prescreen_audit_rate': engine_config.get('PRESCREEN_AUDIT_RATE', 0.05),   # Passed parts re-checked by YOLO
+            'early_termination': engine_config.get('EARLY_TERMINATION', False),        # Stop once a confident MISSING settles NG
+            'early_stop_missing_confidence': engine_config.get('EARLY_STOP_MISSING_CONFIDENCE', 0.5),  # Settles NG
+            'qos_degraded_passes': tuple(engine_config.get('QOS_DEGRADED_PASSES', ('fallback',))),  # Passes kept under load
+            'quality_gate': engine_config.get('QUALITY_GATE', 'record'),                # 'off', 'record' or 'enforce'
+            'quality_min_sharpness': engine_config.get('QUALITY_MIN_SHARPNESS', 20.0),  # Laplacian variance at 320 px
+            'quality_max_clipped': engine_config.get('QUALITY_MAX_CLIPPED', 0.3),       # Share of black/white pixels
+            'quality_min_mean': engine_config.get('QUALITY_MIN_MEAN', 25.0),
+            'quality_max_mean': engine_config.get('QUALITY_MAX_MEAN', 230.0),
+            'quality_min_edge_density': engine_config.get('QUALITY_MIN_EDGE_DENSITY', 0.01),  # Empty fixture check
+            'annotation_mode': engine_config.get('ANNOTATION_MODE', 'lazy'),            # 'lazy' or 'eager' (JPEG per part)
+            'result_cache_live_frames': engine_config.get('RESULT_CACHE_LIVE_FRAMES', False)  # Hash camera frames too
+        })
 
-        self.stats = {
+        # Per-thread counters merged on read (see the stats property)
+        self._counters = ThreadLocalCounters({
             'total_processed': 0,
             'successful_detections': 0,
             'failed_detections': 0,
@@ -60,26 +111,200 @@ class FlexibleNutDetectionService:
             'fallback_detection_count': 0,
             'enhancement_detection_count': 0,
             'multi_scale_detection_count': 0,
+            'multi_scale_stats': {},         # Per-scale runs / hits / detections
             'complete_detections': 0,
-            'incomplete_detections': 0
+            'incomplete_detections': 0,
+            'roi_detection_count': 0,
+            'roi_fallback_count': 0,
+            'verifier_crops': 0,
+            'verifier_detection_count': 0,
+            'prescreen_runs': 0,
+            'prescreen_passes': 0,           # Every region matched: obviously good
+            'prescreen_shortcuts': 0,        # Passes that skipped or shortened the neural passes
+            'prescreen_audits': 0,           # Passes re-checked by the full pipeline
+            'prescreen_audit_disagreements': 0,
+            'early_termination': {},         # Skipped passes per reason and pass
+            'qos_degraded_inspections': 0,   # Parts the degraded profile skipped a pass of (flagged for re-inspection)
+            'quality_checks': 0,
+            'quality_retakes': 0,            # Frames rejected before inference
+            'quality_failures': {}           # Failed checks per name (recorded in 'record' mode too)
+        })
+
+        # Registered fixture regions (python manage.py register_fixture_layout); None = full frame only
+        self.fixture_layout = FixtureLayout.load(engine_config.get('FIXTURE_LAYOUT_PATH'))
+        # Second-stage crop classifier (python manage.py train_crop_verifier); None = ultra-low passes
+        self.crop_verifier = CropVerifier.load(engine_config.get('CROP_VERIFIER_PATH'))
+        # Classical pre-screen templates (python manage.py build_prescreen_templates); None = off
+        self.prescreen = NutPrescreen.load(engine_config.get('PRESCREEN_PATH'))
+        # Load-aware QoS: degrade the cascade when the backlog exceeds the takt time; None = off
+        self.load_monitor = None
+        if engine_config.get('QOS_TAKT_TIME'):
+            self.load_monitor = LoadMonitor(
+                engine_config['QOS_TAKT_TIME'],
+                enter_pressure=engine_config.get('QOS_ENTER_PRESSURE', 1.0),
+                exit_pressure=engine_config.get('QOS_EXIT_PRESSURE', 0.7),
+                max_backlog=engine_config.get('QOS_MAX_BACKLOG'),
+                reinspection_log=engine_config.get('QOS_REINSPECTION_LOG')
+            )
+        # Annotation records, rendered to JPEG on request (bounded render cache)
+        self.annotations = AnnotationStore(
+            engine_config.get('ANNOTATION_DIR') or os.path.join(settings.MEDIA_ROOT, 'inspections', 'annotations'),
+            cache_entries=engine_config.get('ANNOTATION_RENDER_CACHE_SIZE', 64)
+        )
+        # Content-hash cache of final detections for re-uploads and retries; None = off
+        self.result_cache = None
+        if engine_config.get('RESULT_CACHE_ENABLED', True):
+            self.result_cache = ResultCache(
+                max_entries=engine_config.get('RESULT_CACHE_SIZE', 256),
+                max_age=engine_config.get('RESULT_CACHE_MAX_AGE', 3600.0),
+                persist_dir=engine_config.get('RESULT_CACHE_DIR')
+            )
+
+        # Enhancement variants are built concurrently (OpenCV releases the GIL) into per-thread buffers
+        self._enhancement_executor = ThreadPoolExecutor(
+            max_workers=self.config['enhancement_workers'],
+            thread_name_prefix='nut-enhance'
+        )
+        self.enhancer = EnhancementEngine(executor=self._enhancement_executor)
+        # Per-stage latency of every inspection (result['timings']) and rolling histograms (is_healthy)
+        self.stage_timer = StageTimer(window=engine_config.get('STAGE_TIMING_WINDOW', 300.0))
+
+        # Model loading is deferred to the first inspection or an explicit preload()
+        self.startup_stats = {
+            'created_at': datetime.now().isoformat(),
+            'loaded_at': None,
+            'load_time': None,               # Seconds spent loading the inference engine
+            'warmup_time': None,             # Seconds spent on warm-up inferences
+            'warmup_runs': 0,
+            'first_inference_latency': None  # Seconds for the first real inspection
         }
+        logger.info("Enhanced Industrial Nut Detection Service Initialized (model: {})".format(self.model_path))
+
+    @property
+    def stats(self):
+        """Statistics merged from every thread's counters"""
+        return self._counters.snapshot()
+
+    def ensure_loaded(self):
+        """Load the model on first use; safe to call from several threads"""
+        if self.engine is not None:
+            return True
+        with self._load_lock:
+            if self.engine is not None:
+                return True
+            start_time = time.perf_counter()
+            try:
+                self._load_model()
+            except Exception as e:
+                self.load_error = str(e)
+                return False
+            self.load_error = None
+            self.startup_stats['load_time'] = round(time.perf_counter() - start_time, 3)
+            self.startup_stats['loaded_at'] = datetime.now().isoformat()
+            logger.info("YOLOv8 model loaded: {}".format(self.model_path))
+            return True
+
+    def preload(self, warmup=True):
+        """Explicit preload hook (server startup): load the model and optionally warm it up"""
+        if not self.ensure_loaded():
+            return False
+        if warmup:
+            self.warm_up()
+        return True
+
+    def warm_up(self, sizes=None, runs=None, frame_shape=None):
+        """
+        Run dummy inferences at the input sizes the pipeline uses
 
-        # Load model
-        self._load_model()
-        logger.info("YOLOv8 model loaded: {}".format(self.model_path))
-        logger.info("Enhanced Industrial Nut Detection Service Initialized")
+        Kernel selection, memory pools and (for the exported engines) graph
+        initialization happen here instead of on the first real inspection.
+        """
+        if not self.ensure_loaded():
+            return False
+        
+        engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+        if sizes is None:
+            sizes = engine_config.get('WARMUP_SIZES') or sorted(
+                {max(self.config['target_size'])} | set(self.config['multi_scales']))
+        if runs is None:
+            runs = engine_config.get('WARMUP_RUNS', 1)
+        if frame_shape is None:
+            frame_shape = tuple(engine_config.get('WARMUP_FRAME_SHAPE', (1080, 1440)))
+        
+        dummy = np.full(tuple(frame_shape[:2]) + (3,), 114, dtype=np.uint8)
+        start_time = time.perf_counter()
+        try:
+            for _ in range(runs):
+                # Default size first (tiered / primary pass), then the enhancement batch and the other scales
+                self.engine.predict([dummy], conf=self.config['primary_confidence'],
+                                    iou=self.config['iou_threshold'])
+                self.engine.predict([dummy] * 3, conf=0.2, iou=self.config['iou_threshold'])
+                for size in sizes:
+                    self.engine.predict([dummy], conf=self.config['primary_confidence'],
+                                        iou=self.config['iou_threshold'], imgsz=size)
+                self.startup_stats['warmup_runs'] += 1
+        except Exception as e:
+            logger.error(f"Model warm-up failed: {e}")
+            return False
+        
+        self.startup_stats['warmup_time'] = round(time.perf_counter() - start_time, 3)
+        logger.info(f"Model warm-up done in {self.startup_stats['warmup_time']}s (sizes: {sizes})")
+        return True
 
     def _load_model(self):
-        """Load your trained YOLOv8 model"""
+        """
+        Load your trained YOLOv8 model through the configured inference engine
+
+        NUT_DETECTION_CONFIG['ENGINE'] selects 'pytorch' (Ultralytics), 'pytorch_lean',
+        'onnxruntime' or 'openvino'. The other engines fall back to
+        PyTorch if their runtime or the export step is unavailable.
+        With 'onnxruntime' and USE_INT8, the quantized model is used only
+        if its quantize_nut_model report passes the agreement gate.
+        """
+        engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+        engine_name = engine_config.get('ENGINE', DEFAULT_ENGINE)
+        engine_options = {
+            'threads': engine_config.get('ENGINE_THREADS'),
+            'imgsz': engine_config.get('EXPORT_IMGSZ', DEFAULT_IMGSZ)
+        }
+        
         try:
-            if not YOLO_AVAILABLE:
-                raise ImportError("ultralytics not available")
-            
-            if not os.path.exists(self.model_path):
+            if engine_name != StubEngine.name and not os.path.exists(self.model_path):
                 raise FileNotFoundError(f"Model not found: {self.model_path}")
             
-            self.model = YOLO(self.model_path)
-            logger.info(f"Model loaded: {self.model_path}")
+            if engine_name == 'onnxruntime' and engine_config.get('USE_INT8', False):
+                engine_options['artifact'] = approved_int8_model(
+                    self.model_path,
+                    engine_config.get('INT8_MIN_DECISION_AGREEMENT', 0.995),
+                    engine_config.get('INT8_MAX_FALSE_OK', 0)
+                )
+                if engine_options['artifact']:
+                    logger.info(f"Using INT8 model: {engine_options['artifact']}")
+            
+            try:
+                primary_engine = create_engine(engine_name, self.model_path, **engine_options)
+            except Exception as e:
+                if engine_name == DEFAULT_ENGINE or not engine_config.get('FALLBACK_TO_PYTORCH', True):
+                    raise
+                logger.error(f"Inference engine '{engine_name}' unavailable ({e}), falling back to {DEFAULT_ENGINE}")
+                engine_options.pop('artifact', None)
+                primary_engine = create_engine(DEFAULT_ENGINE, self.model_path, **engine_options)
+
+            # Every forward pass goes through one FIFO queue served by MODEL_REPLICAS engines,
+            # so overlapping triggers and manual captures never oversubscribe the CPU
+            replicas = [primary_engine] + [
+                create_engine(primary_engine.name, self.model_path, **engine_options)
+                for _ in range(max(1, engine_config.get('MODEL_REPLICAS', 1)) - 1)
+            ]
+            micro_batching = engine_config.get('MICRO_BATCHING', True)
+            # Published once, fully built: ensure_loaded's lock-free check must never see a bare replica
+            self.engine = MicroBatchingEngine(
+                replicas,
+                max_batch=engine_config.get('BATCH_MAX_SIZE', 8) if micro_batching else 1,
+                max_delay_ms=engine_config.get('BATCH_MAX_DELAY_MS', 5.0) if micro_batching else 0.0
+            )
+
+            logger.info(f"Model loaded: {self.model_path} (engine: {self.engine.name})")
             return True
 
         except Exception as e:
@@ -96,22 +321,32 @@ class FlexibleNutDetectionService:
             minimum: Minimum detection confidence (0.05-0.5)
             ultra_low: List of ultra low confidence levels
         """
-        if primary is not None:
-            self.config['confidence_threshold'] = primary
-            self.config['primary_confidence'] = primary
-            logger.info(f"Updated primary confidence to: {primary}")
-        
-        if fallback is not None:
-            self.config['fallback_confidence'] = fallback
-            logger.info(f"Updated fallback confidence to: {fallback}")
-        
-        if minimum is not None:
-            self.config['minimum_confidence'] = minimum
-            logger.info(f"Updated minimum confidence to: {minimum}")
+        with self._config_lock:
+            config = dict(self.config)
+            
+            if primary is not None:
+                config['confidence_threshold'] = primary
+                config['primary_confidence'] = primary
+                logger.info(f"Updated primary confidence to: {primary}")
+            
+            if fallback is not None:
+                config['fallback_confidence'] = fallback
+                logger.info(f"Updated fallback confidence to: {fallback}")
+            
+            if minimum is not None:
+                config['minimum_confidence'] = minimum
+                logger.info(f"Updated minimum confidence to: {minimum}")
+            
+            if ultra_low is not None:
+                config['ultra_low_confidence'] = tuple(ultra_low)
+                logger.info(f"Updated ultra low confidence levels to: {ultra_low}")
+            
+            # Readers holding the previous snapshot keep a consistent view of it
+            self.config = MappingProxyType(config)
         
-        if ultra_low is not None:
-            self.config['ultra_low_confidence'] = ultra_low
-            logger.info(f"Updated ultra low confidence levels to: {ultra_low}")
+        # Old entries can no longer match (the fingerprint changed); free them
+        if self.result_cache is not None:
+            self.result_cache.clear()
         
         logger.info("Confidence levels updated successfully")
 
@@ -124,273 +359,560 @@ class FlexibleNutDetectionService:
             'ultra_low_confidence': self.config['ultra_low_confidence']
         }
 
+    def get_statistics(self):
+        """Detection statistics (same as the stats property)"""
+        return self.stats
+
+    @timed_stage('enhancement_generation')
     def enhance_image_for_detection(self, image):
-        """Apply comprehensive image enhancement techniques"""
-        enhanced_versions = {}
-        
-        # Original
-        enhanced_versions['original'] = image.copy()
-        
+        """
+        Apply comprehensive image enhancement techniques
+
+        The variants (brightness, CLAHE, sharpening, combined) are built by
+        the EnhancementEngine into this thread's preallocated buffers, so they
+        are only valid until the thread's next call; 'original' is the input
+        frame itself, not a copy.
+        """
+        enhanced_versions = {'original': image}
         try:
-            # 1. Brightness normalization
-            brightness = np.mean(image)
-            if brightness < 100 or brightness > 140:
-                target_brightness = 120
-                factor = target_brightness / max(brightness, 1)
-                bright_enhanced = np.clip(image * factor, 0, 255).astype(np.uint8)
-                enhanced_versions['brightness'] = bright_enhanced
-            
-            # 2. CLAHE contrast enhancement
-            if len(image.shape) == 3:
-                lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-                clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-                lab[:, :, 0] = clahe.apply(lab[:, :, 0])
-                clahe_enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
-                enhanced_versions['clahe'] = clahe_enhanced
-            
-            # 3. Sharpening filter
-            kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-            sharpened = cv2.filter2D(image, -1, kernel)
-            enhanced_versions['sharpened'] = sharpened
-            
-            # 4. Combined enhancement
-            combined = enhanced_versions.get('brightness', image)
-            if 'clahe' in enhanced_versions:
-                combined = cv2.addWeighted(combined, 0.7, enhanced_versions['clahe'], 0.3, 0)
-            enhanced_versions['combined'] = combined
-            
+            enhanced_versions.update(self.enhancer.variants(image))
         except Exception as e:
             logger.error(f"Image enhancement error: {e}")
-        
         return enhanced_versions
 
-    def _extract_detection_info(self, box, method='unknown'):
-        """Extract detection information from YOLO box"""
-        try:
-            class_id = int(box.cls[0])
-            confidence = float(box.conf[0])
-            bbox = box.xyxy[0].tolist()  # [x1, y1, x2, y2]
-            
-            if class_id in [0, 1]:  # Only accept MISSING(0) or PRESENT(1)
-                return {
-                    'class_id': class_id,
-                    'class_name': self.config['expected_classes'][class_id],
-                    'confidence': confidence,
-                    'bbox': bbox,
-                    'detection_method': method
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Error extracting detection: {e}")
-            return None
-
-    def _calculate_iou(self, bbox1, bbox2):
-        """Calculate Intersection over Union (IoU) between two bounding boxes"""
-        try:
-            x1_max = max(bbox1[0], bbox2[0])
-            y1_max = max(bbox1[1], bbox2[1])
-            x2_min = min(bbox1[2], bbox2[2])
-            y2_min = min(bbox1[3], bbox2[3])
-            
-            if x2_min <= x1_max or y2_min <= y1_max:
-                return 0.0
-            
-            intersection = (x2_min - x1_max) * (y2_min - y1_max)
-            
-            area1 = (bbox1[2] - bbox1[0]) * (bbox1[3] - bbox1[1])
-            area2 = (bbox2[2] - bbox2[0]) * (bbox2[3] - bbox2[1])
-            
-            union = area1 + area2 - intersection
-            
-            return intersection / union if union > 0 else 0.0
-        except:
-            return 0.0
+    @timed_stage('merge')
+    def _merge_candidates(self, candidates, all_detections, overlap_threshold=None):
+        """
+        Merge one pass's candidates into the running detections
 
-    def _overlaps_with_existing(self, new_detection, existing_detections, overlap_threshold=None):
-        """Check if new detection overlaps significantly with existing ones"""
+        'nms' merge mode appends every candidate that does not overlap an
+        existing or previously accepted detection - the same result as checking
+        the candidates for overlap one at a time. 'wbf' mode averages the
+        coordinates of overlapping candidates into the detection they match
+        (class and confidence of the existing detection are kept).
+        Returns (merged Detections, number of detections appended).
+        """
         if overlap_threshold is None:
             overlap_threshold = self.config['overlap_threshold']
         
-        try:
-            new_bbox = new_detection['bbox']
-            
-            for existing in existing_detections:
-                existing_bbox = existing['bbox']
-                iou = self._calculate_iou(new_bbox, existing_bbox)
-                
-                if iou > overlap_threshold:
-                    return True
-            return False
-        except:
-            return False
+        if not len(candidates):
+            return all_detections, 0
+        
+        if self.config['merge_mode'] == 'wbf':
+            fused_boxes, fused_weights, assignment = fuse_into_existing(
+                all_detections.boxes, all_detections.fusion_weights(),
+                candidates.boxes, candidates.confidences, overlap_threshold)
+            appended = candidates.filter(assignment < 0)
+            merged = Detections.concat([all_detections, appended])
+            merged.boxes = fused_boxes.astype(np.float32)
+            merged.weights = fused_weights
+            return merged, len(appended)
+        
+        accepted = select_non_overlapping(candidates.boxes, all_detections.boxes, overlap_threshold)
+        added = candidates.filter(accepted)
+        return Detections.concat([all_detections, added]), len(added)
 
+    @timed_stage('merge')
     def _filter_and_rank_detections(self, detections):
         """Filter overlapping detections and rank by confidence"""
-        if not detections:
+        if not len(detections):
             return detections
         
-        # Sort by confidence (highest first)
-        sorted_detections = sorted(detections, key=lambda x: x['confidence'], reverse=True)
+        rank_threshold = self.config['rank_overlap_threshold']
         
-        # Remove overlapping detections (keep highest confidence)
-        filtered_detections = []
-        for detection in sorted_detections:
-            if not self._overlaps_with_existing(detection, filtered_detections, overlap_threshold=0.5):
-                filtered_detections.append(detection)
+        if self.config['merge_mode'] == 'wbf':
+            # Average each overlapping cluster, represented by its most confident member
+            fused_boxes, _, representatives = weighted_box_fusion(
+                detections.boxes, detections.confidences, rank_threshold)
+            filtered_detections = detections[representatives[:4]]
+            filtered_detections.boxes = fused_boxes[:4].astype(np.float32)
+            return filtered_detections
         
+        # Remove overlapping detections (keep highest confidence)
         # Take top 4 detections (our expected maximum)
-        return filtered_detections[:4]
+        keep = greedy_nms(detections.boxes, detections.confidences, rank_threshold, max_keep=4)
+        return detections[keep]
 
-    def _run_detection(self, image_path):
+    def _result_fingerprint(self, config):
+        """Everything besides the pixels that decides a frame's detections (result cache key)"""
+        model_file = getattr(self.engine, 'artifact_path', self.model_path)
+        try:
+            model_version = os.path.getmtime(model_file)
+        except OSError:
+            model_version = None
+        return repr((
+            sorted(config.items()),
+            self.engine.name, model_file, model_version,
+            self.fixture_layout.created if self.fixture_layout is not None else None,
+            self.crop_verifier.metadata.get('trained_at') if self.crop_verifier is not None else None,
+            self.prescreen.metadata.get('built_at') if self.prescreen is not None else None
+        ))
+
+    def _predict(self, image, method, **predict_kwargs):
+        """Run the inference engine on one frame and return its Detections"""
+        with self.stage_timer.stage('inference'):
+            results = self.engine.predict([image], method=method, **predict_kwargs)
+        if len(results) == 0:
+            return Detections.empty()
+        return results[0]
+
+    @timed_stage('tiered')
+    def _run_tiered_pass(self, image, config):
         """
-        ENHANCED: Comprehensive detection pipeline combining all methods
+        Run the detector ONCE at the lowest configured confidence level.
+
+        Greedy NMS only lets a box be suppressed by a higher-confidence box, so
+        thresholding this single result set at the primary / fallback / ultra-low
+        levels gives the same tiers as re-running the model at each level.
+        Returns candidates sorted by confidence (highest first).
         """
-        try:
-            # Load image
-            image = cv2.imread(image_path)
-            if image is None:
-                logger.error(f"Could not load image: {image_path}")
-                return []
+        lowest_conf = min([config['primary_confidence'],
+                           config['fallback_confidence']] + list(config['ultra_low_confidence']))
+        
+        candidates = self._predict(
+            image, 'tiered',
+            conf=lowest_conf,
+            iou=config['iou_threshold'],
+            max_det=config['tiering_max_detections']
+        ).sorted_by_confidence()
+        
+        logger.info(f"DEBUG - Tiered pass at conf {lowest_conf}: {len(candidates)} candidates")
+        return candidates
+
+    def _select_tier(self, candidates, min_confidence, method, limit=None):
+        """Take the candidates at or above a confidence level, tagged with the pass they stand in for"""
+        # candidates are sorted by confidence, so each tier is a prefix
+        tier_size = int(np.count_nonzero(candidates.confidences >= min_confidence))
+        if limit is not None:
+            tier_size = min(tier_size, limit)
+        return candidates[:tier_size].with_method(method)
+
+    def _count_confident_positions(self, detections, min_confidence):
+        """Count distinct (non-overlapping) nut positions detected at or above a confidence level"""
+        confident = detections.filter(detections.confidences >= min_confidence)
+        return len(self._filter_and_rank_detections(confident))
+
+    @timed_stage('multi_scale')
+    def _run_multi_scale_detection(self, image, all_detections, config, policy=None):
+        """
+        Multi-scale detection stage, smallest input size first.
+
+        Each scale is one inference; Ultralytics maps the boxes back to the
+        original frame, so results from every scale merge in original-image
+        coordinates. The stage stops as soon as enough confident, distinct
+        positions are found, so the 1024 px pass only runs when smaller sizes
+        could not complete the part, or when ``policy`` says the decision is
+        already settled.
+        Returns (merged Detections, number of detections added).
+        """
+        added_total = 0
+        scale_conf = config['multi_scale_confidence']
+        primary_size = max(config['target_size'])
+        
+        for scale in sorted(config['multi_scales']):
+            if scale == primary_size:
+                continue  # Already covered by the primary / tiered pass
+            if policy is not None and not self._continue_cascade(policy, all_detections, f'multi_scale_{scale}'):
+                continue  # Counted once per skipped scale
             
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            all_detections = []
+            candidates = self._predict(
+                image, f'multi_scale_{scale}',
+                conf=scale_conf,
+                iou=config['iou_threshold'],
+                max_det=config['max_detections'],
+                imgsz=scale
+            )
+            all_detections, scale_added = self._merge_candidates(candidates, all_detections)
             
-            logger.info(f"DEBUG - Processing: {Path(image_path).name}")
+            scale_key = ('multi_scale_stats', str(scale))
+            self._counters.add(scale_key + ('runs',))
+            self._counters.add(scale_key + ('hits',), 1 if scale_added else 0)
+            self._counters.add(scale_key + ('detections',), scale_added)
+            added_total += scale_added
             
-            # Method 1: Primary detection with normal confidence
+            logger.info(f"DEBUG - Multi-scale {scale}px: +{scale_added} detections")
+            
+            # Early exit once every expected position is confidently covered
+            if self._count_confident_positions(all_detections, scale_conf) >= config['expected_nuts']:
+                break
+        
+        return all_detections, added_total
+
+    def _continue_cascade(self, policy, all_detections, pass_name):
+        """True if ``pass_name`` can still change the decision; skips are counted per reason and pass"""
+        reason = policy.stop_reason(all_detections, pass_name)
+        if reason is None:
+            return True
+        self._counters.add(('early_termination', reason, pass_name))
+        policy.skipped.setdefault(reason, []).append(pass_name)
+        if reason != ALL_POSITIONS_FOUND:
+            logger.info(f"DEBUG - Skipping {pass_name}: {reason}")
+        return False
+
+    @timed_stage('prescreen')
+    def _run_prescreen(self, image, config):
+        """
+        Template-match the registered nut regions before any neural inference
+
+        When every region scores at least prescreen_threshold the part is
+        obviously good: 'skip' mode returns the regions as PRESENT detections
+        (the template score is the confidence), 'primary_only' runs just the
+        primary pass and keeps it if it confirms all nuts. A
+        prescreen_audit_rate sample of passed parts runs the full pipeline
+        instead so agreement with the detector is tracked.
+        Returns (Detections or None to run the normal pipeline, audit flag).
+        """
+        scores = self.prescreen.scores(image, self.fixture_layout)
+        if scores is None:
+            return None, False
+        self._counters.add('prescreen_runs', 1)
+        if scores.min() < config['prescreen_threshold']:
+            return None, False
+        
+        self._counters.add('prescreen_passes', 1)
+        if random.random() < config['prescreen_audit_rate']:
+            return None, True
+        
+        if config['prescreen_mode'] == 'skip':
+            logger.info(f"DEBUG - Pre-screen pass (scores {np.round(scores, 3).tolist()}), detector skipped")
+            self._counters.add('prescreen_shortcuts', 1)
+            return Detections(
+                self.fixture_layout.regions_for(image.shape),
+                scores,
+                np.full(len(scores), CLASS_PRESENT),
+                'prescreen'
+            ), False
+        
+        primary_detections = self._predict(
+            image, 'primary',
+            conf=config['primary_confidence'],
+            iou=config['iou_threshold'],
+            max_det=config['max_detections']
+        )
+        if (primary_detections.count(CLASS_MISSING) == 0 and
+                self._count_confident_positions(primary_detections, config['primary_confidence']) >= config['expected_nuts']):
+            logger.info("DEBUG - Pre-screen pass confirmed by the primary pass")
+            self._counters.add('prescreen_shortcuts', 1)
+            self._counters.add('primary_detection_count', len(primary_detections))
+            return primary_detections, False
+        return None, False
+
+    @timed_stage('crop_verifier')
+    def _run_crop_verification(self, image, all_detections, tiered_candidates, config):
+        """
+        Classify the crops where a nut is expected but was not confidently detected
+
+        Candidates are the sub-fallback boxes the detector already produced
+        (the tiered pass, or one pass at the lowest ultra-low confidence when
+        tiering is off) plus registered fixture regions nothing was found in.
+        Crops the verifier is sure about (P >= verifier_threshold either way)
+        are added with the verifier's class and probability; uncertain crops
+        are dropped, leaving the position unfilled.
+        Returns (merged Detections, number of detections appended).
+        """
+        lowest_conf = min(config['ultra_low_confidence'])
+        if tiered_candidates is None:
+            tiered_candidates = self._predict(image, 'verifier_candidates', conf=lowest_conf, iou=0.3)
+        low_candidates = tiered_candidates.filter(
+            (tiered_candidates.confidences < config['fallback_confidence']) &
+            (tiered_candidates.confidences >= lowest_conf))
+        low_candidates = low_candidates.filter(
+            select_non_overlapping(low_candidates.boxes, all_detections.boxes, config['overlap_threshold']))
+        
+        candidate_boxes = [low_candidates.boxes]
+        regions = self.fixture_layout.regions_for(image.shape) if self.fixture_layout is not None else None
+        if regions is not None:
+            known_boxes = np.concatenate([all_detections.boxes, low_candidates.boxes])
+            covered = self.fixture_layout.assign(known_boxes, image.shape)
+            empty_regions = [index for index in range(len(regions)) if index not in set(covered.tolist())]
+            candidate_boxes.append(regions[empty_regions].astype(np.float32))
+        candidate_boxes = np.concatenate(candidate_boxes).reshape(-1, 4)
+        if not len(candidate_boxes):
+            return all_detections, 0
+        
+        present_probability = self.crop_verifier.predict(image, candidate_boxes)
+        self._counters.add('verifier_crops', len(candidate_boxes))
+        confidences = np.maximum(present_probability, 1 - present_probability)
+        sure = confidences >= config['verifier_threshold']
+        verified = Detections(
+            candidate_boxes[sure],
+            confidences[sure],
+            np.where(present_probability[sure] >= 0.5, CLASS_PRESENT, CLASS_MISSING),
+            np.full(int(sure.sum()), 'crop_verifier', dtype=object)
+        ).sorted_by_confidence()
+        return self._merge_candidates(verified, all_detections)
+
+    @timed_stage('roi')
+    def _run_roi_detection(self, image, config):
+        """
+        Detect nuts in the registered fixture regions only
+
+        The padded crops around the four regions are run as one batch at
+        roi_imgsz, at the lowest configured confidence. Boxes are mapped back
+        to frame coordinates and each region keeps its most confident
+        detection. Returns None (full-frame fallback) when the frame does not
+        match the layout or any region has no detection of at least
+        fallback_confidence.
+        """
+        windows = self.fixture_layout.crop_windows(image.shape, config['roi_margin'])
+        if windows is None:
+            logger.warning(f"Frame {image.shape[:2]} does not match the fixture layout "
+                           f"{self.fixture_layout.frame_shape}, using full frame")
+            return None
+        
+        lowest_conf = min([config['primary_confidence'],
+                           config['fallback_confidence']] + list(config['ultra_low_confidence']))
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in windows.tolist()]
+        with self.stage_timer.stage('inference'):
+            results = self.engine.predict(
+                crops,
+                method='roi',
+                conf=lowest_conf,
+                iou=config['iou_threshold'],
+                max_det=config['max_detections'],
+                imgsz=config['roi_imgsz']
+            )
+        
+        region_detections = []
+        for index, (window, detections) in enumerate(zip(windows, results)):
+            # Crop coordinates -> frame coordinates
+            detections.boxes += window[[0, 1, 0, 1]].astype(np.float32)
+            # A padded crop can show part of a neighbouring nut: keep boxes centred in this region
+            assignment = self.fixture_layout.assign(detections.boxes, image.shape)
+            best = detections.filter(assignment == index).sorted_by_confidence()[:1]
+            # The crops run at the lowest tier only to see every candidate: a region is settled
+            # by a box the full-frame cascade would accept without its ultra-low passes
+            if not len(best) or best.confidences[0] < config['fallback_confidence']:
+                logger.info(f"DEBUG - ROI nut{index + 1} has no box >= {config['fallback_confidence']}, "
+                            f"falling back to full frame")
+                self._counters.add('roi_fallback_count', 1)
+                return None
+            region_detections.append(best.with_method(f'roi_nut{index + 1}'))
+        
+        self._counters.add('roi_detection_count', 1)
+        logger.info(f"DEBUG - ROI detection: {len(region_detections)} regions")
+        return Detections.concat(region_detections)
+
+    def _run_full_frame_detection(self, image, config, degraded=False, policy=None):
+        """Full-frame pipeline: tiered primary pass, enhancement, multi-scale, fallback and ultra-low passes"""
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        all_detections = Detections.empty()
+        if policy is None:
+            policy = CascadePolicy.from_config(config, degraded)  # Asked before every escalation pass
+        
+        # Single-pass tiering: one inference at the lowest confidence, tiers by thresholding
+        tiered_candidates = None
+        if config['single_pass_tiering']:
             try:
-                primary_results = self.model.predict(
-                    image_path,
-                    conf=self.config['primary_confidence'],
-                    iou=self.config['iou_threshold'],
-                    max_det=self.config['max_detections'],
-                    verbose=False
-                )
-                
-                primary_count = 0
-                if primary_results[0].boxes is not None:
-                    for box in primary_results[0].boxes:
-                        detection = self._extract_detection_info(box, 'primary')
-                        if detection:
-                            all_detections.append(detection)
-                            primary_count += 1
-                
+                tiered_candidates = self._run_tiered_pass(image, config)
+            except Exception as e:
+                logger.error(f"Tiered detection error, using per-threshold passes: {e}")
+        
+        # Method 1: Primary detection with normal confidence
+        with self.stage_timer.stage('primary'):
+            try:
+                if tiered_candidates is not None:
+                    primary_detections = self._select_tier(
+                        tiered_candidates, config['primary_confidence'], 'primary',
+                        limit=config['max_detections'])
+                else:
+                    primary_detections = self._predict(
+                        image, 'primary',
+                        conf=config['primary_confidence'],
+                        iou=config['iou_threshold'],
+                        max_det=config['max_detections']
+                    )
+            
+                all_detections = primary_detections
+                primary_count = len(primary_detections)
+            
                 logger.info(f"DEBUG - Primary detection: {primary_count} nuts found")
-                self.stats['primary_detection_count'] += primary_count
+                self._counters.add('primary_detection_count', primary_count)
             except Exception as e:
                 logger.error(f"Primary detection error: {e}")
-            
-            # Method 2: Enhanced image detection if we need more detections
-            if len(all_detections) < 4:
-                logger.info(f"DEBUG - Applying image enhancement methods...")
+        
+        # Method 2: Enhanced image detection if we need more detections
+        if self._continue_cascade(policy, all_detections, 'enhancement'):
+            logger.info("DEBUG - Applying image enhancement methods...")
+            with self.stage_timer.stage('enhancement'):
                 try:
-                    enhanced_versions = self.enhance_image_for_detection(image_rgb)
+                    # The detector letterboxes to the inference size anyway: enhance that copy, not the full frame
+                    working_image, scale = self.enhancer.working_copy(image_rgb, config['enhancement_max_size'])
+                    enhanced_versions = self.enhance_image_for_detection(working_image)
                     enhancement_count = 0
-                    
-                    for enhancement_type, enhanced_img in enhanced_versions.items():
-                        if enhancement_type == 'original':
-                            continue  # Skip original as we already processed it
-                        
-                        results = self.model(enhanced_img, conf=0.2, iou=self.config['iou_threshold'])
-                        if len(results) > 0 and len(results[0].boxes) > 0:
-                            for detection in results[0].boxes:
-                                detection_info = self._extract_detection_info(detection, f'enhanced_{enhancement_type}')
-                                if (detection_info and 
-                                    not self._overlaps_with_existing(detection_info, all_detections)):
-                                    all_detections.append(detection_info)
-                                    enhancement_count += 1
-                    
+                
+                    # Skip original as we already processed it
+                    variant_types = [name for name in enhanced_versions if name != 'original']
+                    variant_images = [enhanced_versions[name] for name in variant_types]
+                
+                    with self.stage_timer.stage('inference'):
+                        if config['batched_enhancement']:
+                            # One batched call for all variants instead of one predictor call each
+                            variant_results = self.engine.predict(variant_images, conf=0.2,
+                                                                  iou=config['iou_threshold'])
+                        else:
+                            variant_results = [self.engine.predict([img], conf=0.2, iou=config['iou_threshold'])[0]
+                                               for img in variant_images]
+                
+                    # Merge in variant order, exactly as the per-variant passes did
+                    for enhancement_type, result in zip(variant_types, variant_results):
+                        candidates = result.with_method(f'enhanced_{enhancement_type}')
+                        if scale != 1.0:
+                            candidates.boxes = candidates.boxes / np.float32(scale)
+                        all_detections, added = self._merge_candidates(candidates, all_detections)
+                        enhancement_count += added
+                
                     logger.info(f"DEBUG - Image enhancement: +{enhancement_count} detections")
-                    self.stats['enhancement_detection_count'] += enhancement_count
+                    self._counters.add('enhancement_detection_count', enhancement_count)
                 except Exception as e:
                     logger.error(f"Image enhancement error: {e}")
-            
-            # Method 3: Fallback detection with lower confidence
-            if len(all_detections) < 4:
-                logger.info(f"DEBUG - Applying fallback detection (need {4 - len(all_detections)} more)...")
+        
+        # Method 2b: Multi-scale detection (smallest first, stops once all positions are found)
+        if config['multi_scale_enabled'] and self._continue_cascade(policy, all_detections, 'multi_scale'):
+            logger.info("DEBUG - Applying multi-scale detection...")
+            try:
+                all_detections, multi_scale_count = self._run_multi_scale_detection(image, all_detections, config, policy)
+                self._counters.add('multi_scale_detection_count', multi_scale_count)
+            except Exception as e:
+                logger.error(f"Multi-scale detection error: {e}")
+        
+        # Method 3: Fallback detection with lower confidence
+        if self._continue_cascade(policy, all_detections, 'fallback'):
+            logger.info(f"DEBUG - Applying fallback detection (need {4 - len(all_detections)} more)...")
+            with self.stage_timer.stage('fallback'):
                 try:
-                    fallback_results = self.model.predict(
-                        image_path,
-                        conf=self.config['fallback_confidence'],
-                        iou=self.config['iou_threshold'],
-                        max_det=self.config['max_detections'],
-                        verbose=False
-                    )
-                    
-                    fallback_count = 0
-                    if fallback_results[0].boxes is not None:
-                        for box in fallback_results[0].boxes:
-                            detection = self._extract_detection_info(box, 'fallback_low_conf')
-                            if (detection and 
-                                not self._overlaps_with_existing(detection, all_detections)):
-                                all_detections.append(detection)
-                                fallback_count += 1
-                    
+                    if tiered_candidates is not None:
+                        fallback_candidates = self._select_tier(
+                            tiered_candidates, config['fallback_confidence'], 'fallback_low_conf',
+                            limit=config['max_detections'])
+                    else:
+                        fallback_candidates = self._predict(
+                            image, 'fallback_low_conf',
+                            conf=config['fallback_confidence'],
+                            iou=config['iou_threshold'],
+                            max_det=config['max_detections']
+                        )
+                
+                    all_detections, fallback_count = self._merge_candidates(fallback_candidates, all_detections)
+                
                     logger.info(f"DEBUG - Low confidence method: +{fallback_count} detections")
-                    self.stats['fallback_detection_count'] += fallback_count
+                    self._counters.add('fallback_detection_count', fallback_count)
                 except Exception as e:
                     logger.error(f"Fallback detection error: {e}")
-            
-            # Method 4: Ultra-low confidence detection
-            if len(all_detections) < 4:
+        
+        # Method 4: Verify the remaining candidate crops, or ultra-low confidence detection without a verifier
+        use_verifier = config['crop_verifier_enabled'] and self.crop_verifier is not None
+        if use_verifier and self._continue_cascade(policy, all_detections, 'crop_verifier'):
+            try:
+                all_detections, verified_count = self._run_crop_verification(
+                    image, all_detections, tiered_candidates, config)
+                logger.info(f"DEBUG - Crop verifier: +{verified_count} detections")
+                self._counters.add('verifier_detection_count', verified_count)
+            except Exception as e:
+                logger.error(f"Crop verification error: {e}")
+        elif not use_verifier and self._continue_cascade(policy, all_detections, 'ultra_low'):
+            with self.stage_timer.stage('ultra_low'):
                 try:
-                    for conf in self.config['ultra_low_confidence']:
-                        results = self.model(image_rgb, conf=conf, iou=0.3)
-                        if len(results) > 0 and len(results[0].boxes) > 0:
-                            for detection in results[0].boxes:
-                                detection_info = self._extract_detection_info(detection, f'ultra_low_{conf}')
-                                if (detection_info and 
-                                    not self._overlaps_with_existing(detection_info, all_detections)):
-                                    all_detections.append(detection_info)
+                    for conf in config['ultra_low_confidence']:
+                        if tiered_candidates is not None:
+                            ultra_low_candidates = self._select_tier(tiered_candidates, conf, f'ultra_low_{conf}')
+                        else:
+                            ultra_low_candidates = self._predict(image_rgb, f'ultra_low_{conf}', conf=conf, iou=0.3)
                     
-                    logger.info(f"DEBUG - Ultra-low confidence method: additional detections found")
+                        all_detections, _ = self._merge_candidates(ultra_low_candidates, all_detections)
+                
+                    logger.info("DEBUG - Ultra-low confidence method: additional detections found")
                 except Exception as e:
                     logger.error(f"Ultra-low confidence detection error: {e}")
+
+        return all_detections
+
+    def _run_detection(self, image, image_name='frame', degraded=False, config=None, policy=None):
+        """
+        ENHANCED: Comprehensive detection pipeline combining all methods
+
+        Args:
+            image: Decoded BGR frame (as returned by cv2.imread or the camera)
+            image_name: Name used in log messages only
+            degraded: Use the load-shedding profile (only qos_degraded_passes escalate)
+            config: Config snapshot of the inspection (default: the current one)
+            policy: CascadePolicy of the inspection; records the passes it skipped
+
+        Returns:
+            Detections (at most 4, highest confidence first)
+        """
+        try:
+            if image is None:
+                logger.error(f"No image data for: {image_name}")
+                return Detections.empty()
+            
+            if config is None:
+                config = self.config  # One immutable snapshot for the whole inspection
+            logger.info(f"DEBUG - Processing: {image_name}")
+            
+            # Classical pre-screen: obviously-good parts skip or shorten the neural passes
+            all_detections = None
+            prescreen_audit = False
+            if (config['prescreen_mode'] != 'off' and self.prescreen is not None
+                    and self.fixture_layout is not None):
+                try:
+                    all_detections, prescreen_audit = self._run_prescreen(image, config)
+                except Exception as e:
+                    logger.error(f"Pre-screen error, running the detector: {e}")
+            
+            # ROI mode: only padded crops around the registered nut regions go through the model
+            if all_detections is None and config['roi_mode'] and self.fixture_layout is not None:
+                try:
+                    all_detections = self._run_roi_detection(image, config)
+                except Exception as e:
+                    logger.error(f"ROI detection error, using full frame: {e}")
+            
+            if all_detections is None:
+                all_detections = self._run_full_frame_detection(image, config, degraded, policy)
             
             # Filter and rank final detections
             final_detections = self._filter_and_rank_detections(all_detections)
             
-            # Convert to expected format (remove detection_method for compatibility)
-            processed_detections = []
-            for detection in final_detections:
-                processed_detection = {
-                    'class_id': detection['class_id'],
-                    'class_name': detection['class_name'],
-                    'confidence': detection['confidence'],
-                    'bbox': detection['bbox']
-                }
-                processed_detections.append(processed_detection)
-            
-            # DEBUG: Log final processed detections
-            logger.info(f"DEBUG - Final detections: {len(processed_detections)}")
-            missing_count = sum(1 for d in processed_detections if d['class_name'] == 'MISSING')
-            present_count = sum(1 for d in processed_detections if d['class_name'] == 'PRESENT')
+            # DEBUG: Log final detections
+            logger.info(f"DEBUG - Final detections: {len(final_detections)}")
+            missing_count = final_detections.count(CLASS_MISSING)
+            present_count = final_detections.count(CLASS_PRESENT)
             logger.info(f"DEBUG - PRESENT: {present_count}, MISSING: {missing_count}")
             
+            if prescreen_audit:
+                self._counters.add('prescreen_audits', 1)
+                if present_count < config['expected_nuts'] or missing_count:
+                    logger.warning(f"Pre-screen audit disagreement for {image_name}: "
+                                   f"pre-screen passed, detector found {present_count} PRESENT, {missing_count} MISSING")
+                    self._counters.add('prescreen_audit_disagreements', 1)
+            
             # Update statistics
-            if len(processed_detections) >= 4:
-                self.stats['complete_detections'] += 1
+            if len(final_detections) >= 4:
+                self._counters.add('complete_detections', 1)
             else:
-                self.stats['incomplete_detections'] += 1
+                self._counters.add('incomplete_detections', 1)
             
-            return processed_detections
+            return final_detections
             
         except Exception as e:
-            logger.error(f"Detection error for {image_path}: {e}")
-            return []
+            logger.error(f"Detection error for {image_name}: {e}")
+            return Detections.empty()
 
-    def _apply_business_logic(self, detections, image_name):
+    def _apply_business_logic(self, detections, image_name, config=None):
         """
         Apply your exact business logic from test validator:
         - All 4 nuts present → GREEN boxes
         - Any nut missing → RED boxes + report
         """
-        missing_count = sum(1 for d in detections if d['class_name'] == 'MISSING')
-        present_count = sum(1 for d in detections if d['class_name'] == 'PRESENT')
+        detections = Detections.coerce(detections)
+        missing_count = detections.count(CLASS_MISSING)
+        present_count = detections.count(CLASS_PRESENT)
         total_detections = len(detections)
+        # A confident MISSING nut is a reject even when the cascade stopped before filling every position
+        settled_ng = CascadePolicy.from_config(config or self.config).stop_reason(detections) == CONFIDENT_MISSING
         
         # Conservative Industrial Logic - Enhanced
-        if total_detections < 4:
+        if total_detections < 4 and not settled_ng:
             # Conservative approach: If we can't detect all 4 positions, assume problem
             box_color = "RED"
             status = "INCOMPLETE_DETECTION"
@@ -444,61 +966,53 @@ class FlexibleNutDetectionService:
         Calculate center validation for detected nuts - From your ML code
         Validates that nut centers match bounding box centers within 10% tolerance
         """
+        detections = Detections.coerce(detections)
         height, width = image_shape[:2]
-        validation_results = []
         
-        for detection in detections:
-            bbox = detection['bbox']
-            x1, y1, x2, y2 = bbox
-            
-            # Calculate bounding box center
-            box_center_x = (x1 + x2) / 2
-            box_center_y = (y1 + y2) / 2
-            
-            # Calculate bounding box dimensions
-            box_width = x2 - x1
-            box_height = y2 - y1
-            
-            # Calculate 10% tolerance based on box dimensions
-            tolerance_x = box_width * 0.10  # 10% of box width
-            tolerance_y = box_height * 0.10  # 10% of box height
-            
-            # For now, we assume the nut center is the same as box center
-            nut_center_x = box_center_x  # Detected nut center
-            nut_center_y = box_center_y  # Detected nut center
-            
-            # Calculate deviation
-            deviation_x = abs(nut_center_x - box_center_x)
-            deviation_y = abs(nut_center_y - box_center_y)
-            
-            # Check if within tolerance
-            within_tolerance_x = deviation_x <= tolerance_x
-            within_tolerance_y = deviation_y <= tolerance_y
-            within_tolerance = within_tolerance_x and within_tolerance_y
-            
-            # Calculate percentage deviation
-            percent_deviation_x = (deviation_x / (box_width / 2)) * 100 if box_width > 0 else 0
-            percent_deviation_y = (deviation_y / (box_height / 2)) * 100 if box_height > 0 else 0
-            
-            validation_result = {
-                'class_name': detection['class_name'],
-                'confidence': detection['confidence'],
-                'box_center': (box_center_x, box_center_y),
-                'nut_center': (nut_center_x, nut_center_y),
-                'box_dimensions': (box_width, box_height),
-                'tolerance': (tolerance_x, tolerance_y),
-                'deviation': (deviation_x, deviation_y),
-                'percent_deviation': (percent_deviation_x, percent_deviation_y),
-                'within_tolerance': within_tolerance,
-                'within_tolerance_x': within_tolerance_x,
-                'within_tolerance_y': within_tolerance_y
-            }
-            
-            validation_results.append(validation_result)
+        # Bounding box centers and dimensions for all detections at once
+        boxes = detections.boxes.astype(np.float64)
+        box_centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        box_dims = boxes[:, 2:] - boxes[:, :2]
+        
+        # Calculate 10% tolerance based on box dimensions
+        tolerances = box_dims * 0.10
+        
+        # For now, we assume the nut center is the same as box center
+        nut_centers = box_centers
+        
+        # Calculate deviation and check if within tolerance
+        deviations = np.abs(nut_centers - box_centers)
+        within = deviations <= tolerances
+        within_both = within.all(axis=1)
+        
+        # Calculate percentage deviation
+        half_dims = box_dims / 2
+        percent_deviations = np.zeros_like(deviations)
+        np.divide(deviations * 100, half_dims, out=percent_deviations, where=box_dims > 0)
+        
+        # Materialize per-detection dicts for the JSON response
+        class_names = self.config['expected_classes']
+        confidences = detections.confidences.tolist()
+        class_ids = detections.class_ids.tolist()
+        validation_results = []
+        for i in range(len(detections)):
+            validation_results.append({
+                'class_name': class_names[class_ids[i]],
+                'confidence': confidences[i],
+                'box_center': tuple(box_centers[i].tolist()),
+                'nut_center': tuple(nut_centers[i].tolist()),
+                'box_dimensions': tuple(box_dims[i].tolist()),
+                'tolerance': tuple(tolerances[i].tolist()),
+                'deviation': tuple(deviations[i].tolist()),
+                'percent_deviation': tuple(percent_deviations[i].tolist()),
+                'within_tolerance': bool(within_both[i]),
+                'within_tolerance_x': bool(within[i, 0]),
+                'within_tolerance_y': bool(within[i, 1])
+            })
         
         # Calculate overall validation statistics
-        total_detections = len(validation_results)
-        valid_centers = sum(1 for r in validation_results if r['within_tolerance'])
+        total_detections = len(detections)
+        valid_centers = int(np.count_nonzero(within_both))
         center_accuracy = (valid_centers / total_detections * 100) if total_detections > 0 else 0
         
         return {
@@ -506,183 +1020,198 @@ class FlexibleNutDetectionService:
             'total_detections': total_detections,
             'valid_centers': valid_centers,
             'center_accuracy': center_accuracy,
-            'average_deviation_x': np.mean([r['percent_deviation'][0] for r in validation_results]) if validation_results else 0,
-            'average_deviation_y': np.mean([r['percent_deviation'][1] for r in validation_results]) if validation_results else 0
+            'average_deviation_x': float(percent_deviations[:, 0].mean()) if total_detections else 0,
+            'average_deviation_y': float(percent_deviations[:, 1].mean()) if total_detections else 0
         }
 
-    def _create_annotated_image(self, image_path, detections, decision, image_id):
-        """Create annotated image with individual nut position coloring"""
-        # Load image
-        image = cv2.imread(image_path)
-        if image is None:
-            logger.error(f"Could not load image: {image_path}")
-            return None
-            
-        annotated = image.copy()
-        
-        # 🆕 NEW: Individual nut position coloring logic
-        for detection in detections:
-            bbox = detection['bbox']
-            x1, y1, x2, y2 = map(int, bbox)
-            
-            # 🎯 INDIVIDUAL COLORING: Each nut gets its own color based on detection
-            if detection['class_name'] == 'PRESENT':
-                box_color = (0, 255, 0)      # GREEN for present nut
-                text_color = (0, 200, 0)     # Dark green
-                bg_color = (0, 100, 0)       # Background green
-            else:  # MISSING
-                box_color = (0, 0, 255)      # RED for missing nut
-                text_color = (0, 0, 200)     # Dark red
-                bg_color = (0, 0, 100)       # Background red
-            
-            # Draw thick bounding box with individual nut color
-            cv2.rectangle(annotated, (x1, y1), (x2, y2), box_color, 4)
-            
-            # Add class and confidence labels
-            label = f"{detection['class_name']}"
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 0.6
-            thickness = 2
-            
-            # Get text size for background
-            (text_width, text_height), baseline = cv2.getTextSize(label, font, font_scale, thickness)
-            
-            # Draw background for text (match individual box color)
-            cv2.rectangle(annotated, 
-                        (x1, y1 - text_height - 10), 
-                        (x1 + text_width, y1), 
-                        bg_color, -1)
-            
-            # Draw text
-            cv2.putText(annotated, label, (x1, y1 - 5), 
-                    font, font_scale, (255, 255, 255), thickness)
-        
-        # Keep original business overlay (use overall decision colors for overlay)
-        if decision['box_color'] == 'GREEN':
-            overlay_box_color = (0, 255, 0)
-            overlay_text_color = (0, 200, 0)
-            overlay_bg_color = (0, 100, 0)
-        else:
-            overlay_box_color = (0, 0, 255)
-            overlay_text_color = (0, 0, 200)
-            overlay_bg_color = (0, 0, 100)
-        
-        # Add business status overlay
-        self._add_business_overlay(annotated, decision)
-        
-        return annotated
-
-    def _add_business_overlay(self, image, decision):
-        """Add business status overlay to image - Updated for individual coloring"""
-    # Use overall decision color for overlay
-        if decision['box_color'] == 'GREEN':
-            overlay_box_color = (0, 255, 0)
-            overlay_text_color = (0, 200, 0)
-            overlay_bg_color = (0, 100, 0)
-        else:
-            overlay_box_color = (0, 0, 255)
-            overlay_text_color = (0, 0, 200)
-            overlay_bg_color = (0, 0, 100)
-    
-    # Status texts based on your business logic
-        status_text = f"STATUS: {decision['status']}"
-        action_text = f"ACTION: {decision['action']}"
-        scenario_text = f"SCENARIO: {decision['scenario']}"
-        nuts_text = f"NUTS: {decision['present_count']} PRESENT, {decision['missing_count']} MISSING"
-    
-        texts = [status_text, action_text, scenario_text, nuts_text]
-    
-    # Calculate overlay size
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.7
-        thickness = 2
-    
-        max_width = 0
-        total_height = 20
-    
-        for text in texts:
-            (text_width, text_height), _ = cv2.getTextSize(text, font, font_scale, thickness)
-            max_width = max(max_width, text_width)
-            total_height += text_height + 8
-    
-    # Draw overlay background
-        overlay_width = max_width + 20
-        overlay_height = total_height + 10
-    
-        cv2.rectangle(image, (10, 10), (10 + overlay_width, 10 + overlay_height), overlay_bg_color, -1)
-        cv2.rectangle(image, (10, 10), (10 + overlay_width, 10 + overlay_height), overlay_box_color, 3)
-    
-    # Draw texts
-        y_offset = 35
-        for text in texts:
-            cv2.putText(image, text, (20, y_offset), font, font_scale, (255, 255, 255), thickness)
-            y_offset += 30
+    def _annotate(self, image, detections, decision, image_id, source_path=None):
+        """
+        Store the inspection's annotation record; returns (annotated JPEG path or None, record path)
 
-    def process_image_with_id(self, image_path: str, image_id: str, user_id: Optional[int] = None) -> Dict:
+        In 'lazy' mode the JPEG is only rendered when requested (render_annotated_image).
+        Frames without a source file on disk are rendered eagerly and the record
+        points at that JPEG instead.
+        """
+        annotated_image = None
+        with self.stage_timer.stage('annotation'):
+            annotation = build_annotation(image_id, detections, decision, image.shape,
+                                          self.config['expected_classes'], source_path)
+            if self.config['annotation_mode'] != 'lazy' or not source_path:
+                annotated_image = render_annotation(image, annotation)
+        annotated_path = None
+        if annotated_image is not None:
+            annotated_path = self._save_annotated_image(annotated_image, image_id)
+            annotation['annotated_path'] = annotated_path
+        with self.stage_timer.stage('save'):
+            return annotated_path, self.annotations.save(annotation)
+
+    def render_annotated_image(self, image_id, max_size=None):
+        """JPEG bytes of the newest inspection of ``image_id`` with its annotations, or None"""
+        return self.annotations.render_jpeg(image_id, max_size)
+
+    def process_image_with_id(self, image_path: str, image_id: str, user_id: Optional[int] = None,
+                              ephemeral_source: bool = False) -> Dict:
         """
         Process image by path with your YOLOv8 model - Integrated from your ML code
+
+        Thin wrapper around process_frame(): the file is decoded exactly once here
+        and the decoded buffer is shared by every detection stage. Pass
+        ``ephemeral_source`` for temporary uploads the caller deletes afterwards:
+        lazy annotations cannot render from them, so the JPEG is rendered now.
         """
         start_time = datetime.now()
         
-        try:
-            if not self.model:
+        # Verify image exists
+        if not os.path.exists(image_path):
+            return {
+                'success': False,
+                'error': f'Image file not found: {image_path}',
+                'timestamp': start_time.isoformat()
+            }
+
+        # Decoding is timed in the same inspection record as the stages process_frame times
+        with self.stage_timer.inspection():
+            # Load and validate image
+            with self.stage_timer.stage('decode'):
+                image = cv2.imread(image_path)
+            if image is None:
                 return {
                     'success': False,
-                    'error': 'Model not loaded',
+                    'error': 'Could not load image file',
                     'timestamp': start_time.isoformat()
                 }
 
-            # Verify image exists
-            if not os.path.exists(image_path):
+            logger.info(f"Processing image: {image_path}")
+            return self.process_frame(image, image_id, user_id=user_id, image_name=Path(image_path).name,
+                                      start_time=start_time, source_path=None if ephemeral_source else image_path)
+
+    def process_frame(self, image: np.ndarray, image_id: str, user_id: Optional[int] = None,
+                      image_name: Optional[str] = None, start_time: Optional[datetime] = None,
+                      source_path: Optional[str] = None, live: bool = False) -> Dict:
+        """
+        Process an already-decoded BGR frame (camera buffer or cv2.imread output)
+
+        The same buffer is passed to detection, validation and annotation, so the
+        image is never re-read from disk during an inspection. ``source_path``
+        is the file the frame was read from; lazy annotations render from it.
+        ``live`` marks a frame straight from the camera: such frames never
+        repeat, so they skip the result cache (and its full-frame hash) unless
+        RESULT_CACHE_LIVE_FRAMES is set.
+        The result's 'timings' breaks the inspection down per stage (ms).
+        """
+        with self.stage_timer.inspection() as timings:
+            with self.stage_timer.stage('inspection'):
+                result = self._process_frame(image, image_id, user_id, image_name, start_time, source_path, live)
+            result['timings'] = self.stage_timer.as_ms(timings)
+        return result
+
+    def _process_frame(self, image, image_id, user_id, image_name, start_time, source_path, live):
+        if start_time is None:
+            start_time = datetime.now()
+        if image_name is None:
+            image_name = image_id
+        # One config snapshot for the whole part: gate, cache key, cascade and decision agree even
+        # when update_confidence_levels swaps the config meanwhile
+        config = self.config
+        # Profile chosen from backlog and recent latency when the part arrives
+        load_token = self.load_monitor.begin() if self.load_monitor is not None else None
+        degraded = load_token is not None and load_token[1] == DEGRADED
+        
+        try:
+            if not self.ensure_loaded():
                 return {
                     'success': False,
-                    'error': f'Image file not found: {image_path}',
+                    'error': f'Model not loaded: {self.load_error}',
                     'timestamp': start_time.isoformat()
                 }
 
-            # Load and validate image
-            image = cv2.imread(image_path)
-            if image is None:
+            if image is None or not isinstance(image, np.ndarray) or image.size == 0:
                 return {
                     'success': False,
-                    'error': 'Could not load image file',
+                    'error': 'Invalid image data',
                     'timestamp': start_time.isoformat()
                 }
 
-            logger.info(f"Processing image: {image_path}")
             logger.info(f"Image shape: {image.shape}")
 
+            # Quality gate: unusable frames get RETAKE instead of the worst-case cascade
+            quality = None
+            if config['quality_gate'] != 'off':
+                with self.stage_timer.stage('quality_gate'):
+                    quality = assess_frame(image, config, self.fixture_layout)
+                self._counters.add('quality_checks', 1)
+                for check in quality['failed']:
+                    self._counters.add(('quality_failures', check))
+                if not quality['passed'] and config['quality_gate'] == 'enforce':
+                    return self._retake_result(image_id, start_time, quality)
+
             # Run detection with your YOLOv8 model
-            detections = self._run_detection(image_path)
+            # Re-uploads and retries of the same frame reuse the stored detections
+            cache_key = None
+            detections = None
+            if self.result_cache is not None and (not live or config['result_cache_live_frames']):
+                with self.stage_timer.stage('cache_lookup'):
+                    # Same snapshot as the cascade below, so a result is stored under the config it was computed with
+                    cache_key = frame_key(image, self._result_fingerprint(config))
+                    detections = self.result_cache.get(cache_key)
+            cached = detections is not None
+            policy = CascadePolicy.from_config(config, degraded)
+            
+            if cached:
+                logger.info(f"Detections for {image_name} served from the result cache")
+            else:
+                detection_start = time.perf_counter()
+                with self.engine.session(), self.stage_timer.stage('detection'):
+                    detections = self._run_detection(image, image_name, degraded, config, policy)
+                if self.startup_stats['first_inference_latency'] is None:
+                    self.startup_stats['first_inference_latency'] = round(time.perf_counter() - detection_start, 3)
+                # Empty and incomplete (degraded) results are not cached: a retry must get a full inspection
+                if cache_key is not None and len(detections) and not policy.degraded_skips:
+                    self.result_cache.put(cache_key, detections)
             logger.info(f"Detections found: {len(detections)}")
             
             # Print detection details
-            if detections:
+            if len(detections):
                 logger.info("Detection Details:")
-                for i, det in enumerate(detections, 1):
-                    logger.info(f"   {i}. {det['class_name']}: {det['confidence']:.3f}")
+                for i, (class_id, confidence) in enumerate(zip(detections.class_ids.tolist(),
+                                                               detections.confidences.tolist()), 1):
+                    logger.info(f"   {i}. {config['expected_classes'][class_id]}: {confidence:.3f}")
 
-            # Calculate center validation
-            center_validation = self._calculate_center_validation(detections, image.shape)
-            
-            # Apply business logic
-            decision = self._apply_business_logic(detections, Path(image_path).name)
-            
-            # Create annotated image
-            annotated_image = self._create_annotated_image(image_path, detections, decision, image_id)
-            
-            # Save annotated image
-            annotated_path = self._save_annotated_image(annotated_image, image_id)
+            with self.stage_timer.stage('business_logic'):
+                # Calculate center validation
+                center_validation = self._calculate_center_validation(detections, image.shape)
+                
+                # Apply business logic
+                decision = self._apply_business_logic(detections, image_name, config)
+                
+                # Prepare nut results in expected format
+                nut_results = self._prepare_nut_results(detections, decision, image.shape)
             
-            # Prepare nut results in expected format
-            nut_results = self._prepare_nut_results(detections, decision)
+            # Annotation record (the JPEG only in 'eager' mode or without a source file)
+            annotated_path, annotation_path = self._annotate(image, detections, decision, image_id, source_path)
             
             # Calculate processing time
             processing_time = (datetime.now() - start_time).total_seconds()
             
+            # Parts whose cascade the degraded profile cut short are reported as usual and queued
+            # for re-inspection, never dropped; a degraded part that needed no skipped pass is complete
+            reinspection_required = bool(policy.degraded_skips)
+            if reinspection_required:
+                self._counters.add('qos_degraded_inspections', 1)
+                logger.warning(f"Part {image_id} inspected with the degraded QoS profile, flagged for re-inspection")
+                self.load_monitor.record_reinspection({
+                    'image_id': image_id,
+                    'image_name': image_name,
+                    'user_id': user_id,
+                    'timestamp': start_time.isoformat(),
+                    'status': decision['status'],
+                    'skipped_passes': policy.degraded_skips,
+                    'annotated_image_path': annotated_path
+                })
+            
             # Update statistics
-            self.stats['total_processed'] += 1
-            self.stats['successful_detections'] += 1
+            self._counters.add('total_processed', 1)
+            self._counters.add('successful_detections', 1)
             
             # Log results
             status_icon = "GREEN" if decision['box_color'] == 'GREEN' else "RED"
@@ -701,15 +1230,20 @@ class FlexibleNutDetectionService:
                 'center_validation': center_validation,
                 'detection_summary': {
                     'total_detections': len(detections),
-                    'detections': detections
+                    'detections': detections.to_dicts(config['expected_classes'])
                 },
-                'annotated_image_path': annotated_path
+                'annotated_image_path': annotated_path,
+                'annotation_path': annotation_path,
+                'cached': cached,
+                'quality': quality,
+                'qos_profile': DEGRADED if reinspection_required else 'full',
+                'reinspection_required': reinspection_required
             }
 
         except Exception as e:
             logger.error(f"Processing error for image {image_id}: {str(e)}")
-            self.stats['total_processed'] += 1
-            self.stats['failed_detections'] += 1
+            self._counters.add('total_processed', 1)
+            self._counters.add('failed_detections', 1)
             
             return {
                 'success': False,
@@ -717,9 +1251,42 @@ class FlexibleNutDetectionService:
                 'image_id': image_id,
                 'timestamp': start_time.isoformat()
             }
+        finally:
+            if load_token is not None:
+                self.load_monitor.finish(load_token)
+
+    def _retake_result(self, image_id, start_time, quality):
+        """Outcome for a frame the quality gate rejected: not an inspection result, the part must be re-imaged"""
+        failed = ', '.join(quality['failed'])
+        logger.warning(f"Frame for {image_id} failed the quality gate ({failed}): {quality}")
+        self._counters.add('quality_retakes', 1)
+        return {
+            'success': False,
+            'retake': True,
+            'error': f'Image quality check failed ({failed}) - retake the image',
+            'image_id': image_id,
+            'processing_time': (datetime.now() - start_time).total_seconds(),
+            'timestamp': start_time.isoformat(),
+            'decision': {
+                'box_color': 'RED',
+                'status': 'RETAKE',
+                'action': 'RETAKE_IMAGE',
+                'missing_count': 0,
+                'present_count': 0,
+                'total_detections': 0,
+                'scenario': 'RETAKE'
+            },
+            'quality': quality
+        }
 
-    def _prepare_nut_results(self, detections, decision):
-        """Prepare nut results in expected format - FIXED VERSION"""
+    def _prepare_nut_results(self, detections, decision, frame_shape=None):
+        """
+        Prepare nut results in expected format - FIXED VERSION
+
+        With a registered fixture layout nutN is the nut found in region N, so
+        positions stay stable when a nut is missing; otherwise PRESENT nuts are
+        numbered top-left to bottom-right.
+        """
         # Initialize all nuts as missing
         nut_results = {
             'nut1': {'status': 'MISSING', 'confidence': 0.0, 'bounding_box': None},
@@ -729,16 +1296,35 @@ class FlexibleNutDetectionService:
         }
         
         # Sort detections by position (top-left to bottom-right)
-        present_detections = [d for d in detections if d['class_name'] == 'PRESENT']
-        present_detections.sort(key=lambda x: (x['bbox'][1], x['bbox'][0]))  # Sort by y, then x
+        detections = Detections.coerce(detections)
+        present_detections = detections.filter(detections.class_ids == CLASS_PRESENT)
+        present_detections = present_detections[present_detections.position_order()]  # Sort by y, then x
+        
+        # Registered layout: region index decides the position, the highest confidence wins a region
+        positions = [None] * len(present_detections)
+        assignment = None
+        if self.fixture_layout is not None and frame_shape is not None and len(present_detections):
+            assignment = self.fixture_layout.assign(present_detections.boxes, frame_shape)
+        if assignment is not None:
+            for i in np.argsort(-present_detections.confidences, kind='stable').tolist():
+                region = int(assignment[i])
+                if 0 <= region < 4 and region not in positions:
+                    positions[i] = region
+        # Anything not placed by the layout fills the free positions in reading order
+        free_positions = [position for position in range(4) if position not in positions]
+        for i in range(len(positions)):
+            if positions[i] is None and free_positions:
+                positions[i] = free_positions.pop(0)
         
         # Assign present nuts to positions
-        for i, detection in enumerate(present_detections[:4]):  # Max 4 nuts
-            nut_key = f'nut{i+1}'
-            bbox = detection['bbox']
+        for position, bbox, confidence in zip(positions, present_detections.boxes.tolist(),
+                                              present_detections.confidences.tolist()):
+            if position is None:  # Max 4 nuts
+                continue
+            nut_key = f'nut{position+1}'
             nut_results[nut_key] = {
                 'status': 'PRESENT',
-                'confidence': detection['confidence'],
+                'confidence': confidence,
                 'bounding_box': {
                     'x1': bbox[0],
                     'y1': bbox[1],
@@ -752,8 +1338,14 @@ class FlexibleNutDetectionService:
         
         return nut_results
 
+    @timed_stage('save')
     def _save_annotated_image(self, annotated_image, image_id):
-        """Save annotated image to results directory"""
+        """
+        Queue the annotated image for writing to the results directory; returns its path
+
+        The file is encoded and written by the background image writer; callers
+        that need it on disk use get_image_writer().wait(path).
+        """
         try:
             if annotated_image is None:
                 return None
@@ -767,10 +1359,8 @@ class FlexibleNutDetectionService:
             filename = f"{image_id}_{timestamp}_result.jpg"
             file_path = os.path.join(results_dir, filename)
             
-            # Save image
-            cv2.imwrite(file_path, annotated_image)
-            
-            return file_path
+            # Encode and write off the inspection path (format from IMAGE_FORMATS['result'])
+            return get_image_writer().submit(annotated_image, file_path, 'result').path
             
         except Exception as e:
             logger.error(f"Error saving annotated image: {e}")
@@ -779,12 +1369,44 @@ class FlexibleNutDetectionService:
     def is_healthy(self):
         """Check if service is healthy and ready"""
         return {
-            'service_available': self.model is not None,
-            'model_loaded': self.model is not None,
+            'service_available': self.load_error is None,
+            'model_loaded': self.engine is not None,
             'model_path': self.model_path,
-            'config': self.config,
+            'inference_engine': self.engine.describe() if self.engine is not None else None,
+            'load_error': self.load_error,
+            'startup': self.startup_stats,
+            'result_cache': self.result_cache.metrics() if self.result_cache is not None else None,
+            'qos': self.load_monitor.metrics() if self.load_monitor is not None else None,
+            'annotations': self.annotations.metrics(),
+            'image_writer': get_image_writer().metrics(),
+            'stage_latency': self.stage_timer.metrics(),
+            'config': dict(self.config),
             'statistics': self.stats
         }
 
-# Create global service instance
-enhanced_nut_detection_service = FlexibleNutDetectionService()
\ No newline at end of file
+# Create global service instance (cheap: the model loads on first use or through preload())
+enhanced_nut_detection_service = FlexibleNutDetectionService()
+
+_remote_service = None
+
+
+def get_detection_service():
+    """
+    Service used by the inspection workflows
+
+    With NUT_DETECTION_CONFIG['DAEMON_ENABLED'] frames go to the standalone
+    inference daemon (python manage.py run_inference_daemon), so web workers
+    never load the model; otherwise the in-process service is used.
+    """
+    global _remote_service
+    engine_config = getattr(settings, 'NUT_DETECTION_CONFIG', {})
+    if not engine_config.get('DAEMON_ENABLED', False):
+        return enhanced_nut_detection_service
+    
+    if _remote_service is None:
+        from .inference_daemon import InferenceClient, RemoteNutDetectionService, daemon_address
+        client = InferenceClient(daemon_address(engine_config), timeout=engine_config.get('DAEMON_TIMEOUT', 30.0))
+        fallback = enhanced_nut_detection_service if engine_config.get('DAEMON_FALLBACK_TO_LOCAL', True) else None
+        _remote_service = RemoteNutDetectionService(client, fallback=fallback,
+                                                    annotations=enhanced_nut_detection_service.annotations)
+    return _remote_service
\ No newline at end of file
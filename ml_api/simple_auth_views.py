@@ -5,6 +5,7 @@ import glob
 from django.conf import settings
 
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
@@ -572,7 +573,8 @@ def camera_capture_and_process(request):
             os.makedirs(original_dir, exist_ok=True)
             
             # Use manual override capture to handle trigger mode properly
-            success, capture_result = camera_manager.capture_manual_override(original_dir)
+            # (returns once the frame exists; the file is written in the background)
+            success, capture_result = camera_manager.capture_manual_override(original_dir, wait=False)
             
             if not success:
                 return JsonResponse({
@@ -586,17 +588,27 @@ def camera_capture_and_process(request):
             
             # Rename file to include image_id (EXISTING CODE - UNCHANGED)
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            new_filename = f"{image_id}_{timestamp}_camera.jpg"
+            new_filename = f"{image_id}_{timestamp}_camera{os.path.splitext(captured_filename)[1]}"
             new_filepath = os.path.join(original_dir, new_filename)
             
-            # Move/rename the captured file (EXISTING CODE - UNCHANGED)
+            # Process the in-memory frame with the ML model while the capture is being written
+            processing_result = _process_with_yolov8_model(new_filepath, image_id, frame=capture_result['frame'])
+            
+            # Move/rename the captured file once it is on disk
             import shutil
+            try:
+                capture_result['write'].result()
+            except Exception as e:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Camera capture could not be saved: {e}'
+                })
             shutil.move(captured_filepath, new_filepath)
             
             print(f"Camera captured: {new_filepath}")
             
-            # Process with ML model (EXISTING CODE - UNCHANGED)
-            processing_result = _process_with_yolov8_model(new_filepath, image_id)
+            if processing_result.get('retake'):
+                return JsonResponse(_retake_response(image_id, processing_result))
             
             if not processing_result['success']:
                 return JsonResponse({
@@ -661,6 +673,12 @@ def camera_capture_and_process(request):
                     timestamp_new = datetime.now().strftime('%Y%m%d_%H%M%S')
                     annotated_filename = f"{image_id}_{timestamp_new}_result.jpg"
                     annotated_image_path = os.path.join(results_dir, annotated_filename)
+
+            # Lazy annotations: no JPEG on disk, the annotated-image endpoint renders the result
+            annotated_url = f"/media/inspections/results/{annotated_filename}"
+            if (not os.path.exists(os.path.join(settings.MEDIA_ROOT, 'inspections', 'results', annotated_filename))
+                    and detection_data.get('annotated_image_url')):
+                annotated_url = detection_data['annotated_image_url']
             
             # ============================================================================
             # 🆕 ENHANCED FUNCTIONALITY - OK/NG STORAGE (NEW CODE ADDED)
@@ -688,7 +706,10 @@ def camera_capture_and_process(request):
                     nuts_present=present_count,
                     nuts_absent=missing_count,
                     confidence_scores=confidence_scores,
-                    processing_time=detection_data.get('processing_time', 0.0)
+                    processing_time=detection_data.get('processing_time', 0.0),
+                    qos_profile=detection_data.get('qos_profile', 'full'),
+                    reinspection_required=detection_data.get('reinspection_required', False),
+                    quality=detection_data.get('quality')
                 )
 
                 if enhanced_inspection.test_status == 'OK':
@@ -753,7 +774,9 @@ def camera_capture_and_process(request):
                     'method': 'camera',
                     'filename': new_filename,
                     'total_detections': detection_data.get('total_detections', 0),
-                    'confidence_threshold': detection_data.get('confidence_threshold', 0.5)
+                    'confidence_threshold': detection_data.get('confidence_threshold', 0.5),
+                    'qos_profile': detection_data.get('qos_profile', 'full'),
+                    'reinspection_required': detection_data.get('reinspection_required', False)
                 },
                 'detection_details': {
                     'detections': detection_data.get('detections', []),
@@ -762,7 +785,7 @@ def camera_capture_and_process(request):
                 },
                 'image_paths': {
                     'original': f"/media/inspections/original/{new_filename}",
-                    'annotated': f"/media/inspections/results/{annotated_filename}",
+                    'annotated': annotated_url,
                 },
                 'inspection_id': str(inspection.id),
                 'timestamp': datetime.now().isoformat(),
@@ -858,6 +881,9 @@ def simple_process_image(request):
             # Process image with actual YOLOv8 model
             processing_result = _process_with_yolov8_model(image_path, image_id)
             
+            if processing_result.get('retake'):
+                return JsonResponse(_retake_response(image_id, processing_result))
+            
             if not processing_result['success']:
                 return JsonResponse({
                     'success': False,
@@ -938,6 +964,12 @@ def simple_process_image(request):
                     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                     annotated_filename = f"{image_id}_{timestamp}_result.jpg"
                     print(f"DEBUG: Using fallback filename: {annotated_filename}")
+
+            # Lazy annotations: no JPEG on disk, the annotated-image endpoint renders the result
+            annotated_url = f"/media/inspections/results/{annotated_filename}"
+            if (not os.path.exists(os.path.join(settings.MEDIA_ROOT, 'inspections', 'results', annotated_filename))
+                    and detection_data.get('annotated_image_url')):
+                annotated_url = detection_data['annotated_image_url']
             
             # Return results using the CORRECT counts from ML
             # ADD THIS LINE RIGHT HERE:
@@ -964,7 +996,9 @@ def simple_process_image(request):
                     'method': image_source,
                     'filename': filename,
                     'total_detections': detection_data.get('total_detections', 0),
-                    'confidence_threshold': detection_data.get('confidence_threshold', 0.5)
+                    'confidence_threshold': detection_data.get('confidence_threshold', 0.5),
+                    'qos_profile': detection_data.get('qos_profile', 'full'),
+                    'reinspection_required': detection_data.get('reinspection_required', False)
                 },
                 'detection_details': {
                     'detections': detection_data.get('detections', []),
@@ -973,7 +1007,7 @@ def simple_process_image(request):
                 },
                 'image_paths': {
                     'original': f"/media/inspections/original/{filename}",
-                    'annotated': f"/media/inspections/results/{annotated_filename}",
+                    'annotated': annotated_url,
                 },
                 'inspection_id': str(inspection.id),
                 'timestamp': datetime.now().isoformat()
@@ -1058,6 +1092,9 @@ def results_display_view(request):
     annotated_path = os.path.join(settings.MEDIA_ROOT, 'inspections', 'results', annotated_filename)
     file_exists = os.path.exists(annotated_path)
     print(f"DEBUG: Annotated file exists at {annotated_path}: {file_exists}")
+    # Lazy annotations have no JPEG on disk: the annotated-image endpoint renders them
+    annotated_url = (f"/media/inspections/results/{annotated_filename}" if file_exists
+                     else reverse('ml_api:annotated_image', args=[image_id]))
     
     context = {
         'image_id': image_id,
@@ -1066,6 +1103,7 @@ def results_display_view(request):
         'nuts_missing': nuts_missing,
         'quality_score': int(quality_score),
         'annotated_filename': annotated_filename,
+        'annotated_url': annotated_url,
         'file_exists': file_exists,  # Pass this for debugging
     }
     
@@ -1097,9 +1135,27 @@ def _save_uploaded_image(uploaded_file, image_id):
     
     return file_path, filename
 
-def _process_with_yolov8_model(image_path, image_id):
+def _retake_response(image_id, processing_result):
+    """JSON body for a frame the quality gate rejected: the operator re-images the part, nothing is stored"""
+    return {
+        'success': False,
+        'retake': True,
+        'image_id': image_id,
+        'overall_result': 'RETAKE',
+        'error': processing_result['error'],
+        'business_decision': processing_result.get('decision'),
+        'quality': processing_result.get('quality'),
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def _process_with_yolov8_model(image_path, image_id, frame=None):
     """
     Process image with actual YOLOv8 model (using your exact ML logic)
+    
+    If the caller already holds the decoded frame (e.g. straight from the camera)
+    pass it as ``frame`` so the image is not decoded again from disk. Such
+    live frames are not hashed for the result cache.
     """
     try:
         import cv2
@@ -1108,43 +1164,57 @@ def _process_with_yolov8_model(image_path, image_id):
         from django.conf import settings
         import os
         
-        # Import YOLOv8 model from your services
-        from .services import enhanced_nut_detection_service
+        # Import YOLOv8 model from your services (in-process or the inference daemon)
+        from .services import get_detection_service
+        from .image_writer import get_image_writer
         
-        # Verify image exists
-        if not os.path.exists(image_path):
-            return {
-                'success': False,
-                'error': f'Image file not found: {image_path}'
-            }
-        
-        # Load and validate image
-        image = cv2.imread(image_path)
-        if image is None:
-            return {
-                'success': False,
-                'error': 'Could not load image file'
-            }
+        live = frame is not None
+        if frame is None:
+            # Verify image exists
+            if not os.path.exists(image_path):
+                return {
+                    'success': False,
+                    'error': f'Image file not found: {image_path}'
+                }
+            
+            # Load and validate image (decoded once, reused by every detection stage)
+            frame = cv2.imread(image_path)
+            if frame is None:
+                return {
+                    'success': False,
+                    'error': 'Could not load image file'
+                }
         
         print(f"Processing image: {image_path}")
-        print(f"Image shape: {image.shape}")
+        print(f"Image shape: {frame.shape}")
         
         # Use your enhanced nut detection service with your ML logic
         start_time = datetime.now()
         
         # Process with your YOLOv8 model using your exact business logic
-        result = enhanced_nut_detection_service.process_image_with_id(
-            image_path=image_path,
-            image_id=image_id,
-            user_id=None
+        result = get_detection_service().process_frame(
+            frame,
+            image_id,
+            user_id=None,
+            image_name=Path(image_path).name,
+            source_path=image_path,
+            live=live
         )
         
-        processing_time = (datetime.now() - start_time).total_seconds()
+        # Wall time seen by the view (includes the daemon round trip); processing_time is the service's own
+        end_to_end_time = (datetime.now() - start_time).total_seconds()
+        
+        # Eager annotated images are written in the background; callers read them right away
+        get_image_writer().wait(result.get('annotated_image_path'))
         
         if not result['success']:
+            # A frame rejected by the quality gate is a RETAKE outcome, not a processing error
             return {
                 'success': False,
-                'error': result.get('error', 'YOLOv8 processing failed')
+                'retake': result.get('retake', False),
+                'error': result.get('error', 'YOLOv8 processing failed'),
+                'decision': result.get('decision'),
+                'quality': result.get('quality')
             }
         
         # Extract results using your business logic
@@ -1160,10 +1230,18 @@ def _process_with_yolov8_model(image_path, image_id):
                 'decision': decision,
                 'detections': detections,
                 'center_validation': center_validation,
-                'processing_time': processing_time,
+                'processing_time': result.get('processing_time', end_to_end_time),
+                'end_to_end_time': end_to_end_time,
+                'timings': result.get('timings'),
                 'total_detections': len(detections),
                 'confidence_threshold': 0.5,
-                'annotated_image_path': result.get('annotated_image_path')
+                'annotated_image_path': result.get('annotated_image_path'),
+                'annotated_image_url': (reverse('ml_api:annotated_image', args=[image_id])
+                                        if result.get('annotation_path') else None),
+                # Load-aware QoS: a shortened cascade is reported and stored, the part is inspected again
+                'qos_profile': result.get('qos_profile', 'full'),
+                'reinspection_required': result.get('reinspection_required', False),
+                'quality': result.get('quality')
             }
         }
         
@@ -17,7 +17,7 @@ from PIL import Image
 import uuid
 
 from .models import InspectionRecord, NutResult, CameraCaptureSession, ProcessingJob
-from .services import enhanced_nut_detection_service
+from .services import get_detection_service
 
 logger = logging.getLogger(__name__)
 
@@ -93,10 +93,11 @@ class SingleImageProcessingView(View):
             # Process with enhanced service
             logger.info(f"Processing image: {image_id}")
             
-            result = enhanced_nut_detection_service.process_image_with_id(
+            result = get_detection_service().process_image_with_id(
                 image_path=processing_image_path,
                 image_id=image_id,
-                user_id=request.user.id
+                user_id=request.user.id,
+                ephemeral_source=not image_path  # Uploads are deleted below
             )
             
             if not result['success']:
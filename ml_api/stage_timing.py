@@ -0,0 +1,180 @@
+# ml_api/stage_timing.py - Per-stage latency of each inspection and rolling histograms per stage
+
+"""
+process_frame used to report one processing_time, so a slow part could not
+be attributed to decoding, the cascade or disk I/O. StageTimer times the
+stages of every inspection:
+
+    with self.stage_timer.inspection() as timings:   # per-thread record
+        with self.stage_timer.stage('quality_gate'):
+            ...
+
+    @timed_stage('merge')                             # methods of a service with .stage_timer
+    def _merge_candidates(self, ...):
+
+Repeated stages add up within an inspection (every merge counts towards
+'merge'), and stages nest, so they do not sum to the total. The detection
+service records:
+
+    decode                      cv2.imread (process_image_with_id only)
+    inspection                  all of process_frame
+      quality_gate, cache_lookup
+      detection                 the whole cascade, containing
+        prescreen, roi, tiered, primary, enhancement, multi_scale,
+        fallback, crop_verifier, ultra_low      one per pass that ran
+        enhancement_generation  building the variants
+        inference               every engine.predict call
+        merge                   merging and ranking detections
+      business_logic            decision, center validation, nut results
+      annotation                annotation record (+ eager rendering)
+      save                      queueing the JPEG, writing the record
+
+'save' is the time the inspection thread spends; encoding and writing run
+on the image writer (see its metrics). Outside an inspection stage() costs
+one attribute lookup.
+
+When the outermost inspection() exits its stage times go into one
+LatencyHistogram per stage: HDR-style log buckets with fixed relative
+precision over a rolling window, so p50 / p99 need no stored samples.
+"""
+
+import math
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """
+    Latency histogram with ``precision`` relative bucket width over the last ``window`` seconds
+
+    Two bucket arrays are rotated every window / 2, so a summary covers
+    between half and all of the window.
+    """
+
+    def __init__(self, window=300.0, precision=0.02, lowest=1e-6, highest=3600.0):
+        self.window = window
+        self.lowest = lowest
+        self._growth = math.log1p(precision)
+        self._size = int(math.ceil(math.log(highest / lowest) / self._growth)) + 1
+        self._current = np.zeros(self._size, dtype=np.int64)
+        self._previous = np.zeros(self._size, dtype=np.int64)
+        self._rotated_at = time.monotonic()
+        self.total_count = 0
+        self.total_seconds = 0.0
+
+    def _index(self, seconds):
+        if seconds <= self.lowest:
+            return 0
+        return min(int(math.log(seconds / self.lowest) / self._growth), self._size - 1)
+
+    def _value(self, index):
+        """Representative value of a bucket (its geometric middle)"""
+        return self.lowest * math.exp((index + 0.5) * self._growth)
+
+    def _rotate(self, now):
+        elapsed = now - self._rotated_at
+        if elapsed >= self.window / 2:
+            # After a full window without a rotation the previous half is stale too
+            self._previous = self._current if elapsed < self.window else np.zeros_like(self._current)
+            self._current = np.zeros_like(self._current)
+            self._rotated_at = now
+
+    def record(self, seconds):
+        self._rotate(time.monotonic())
+        self._current[self._index(seconds)] += 1
+        self.total_count += 1
+        self.total_seconds += seconds
+
+    def summary(self, percentiles=(50, 90, 95, 99)):
+        """Window count and percentiles / max in milliseconds (None without samples)"""
+        self._rotate(time.monotonic())
+        counts = self._current + self._previous
+        count = int(counts.sum())
+        summary = {'count': count, 'total_count': self.total_count}
+        if not count:
+            summary.update({f'p{p}': None for p in percentiles})
+            summary['max'] = None
+            return summary
+        cumulative = np.cumsum(counts)
+        for p in percentiles:
+            index = int(np.searchsorted(cumulative, math.ceil(count * p / 100)))
+            summary[f'p{p}'] = round(self._value(index) * 1000, 3)
+        summary['max'] = round(self._value(int(np.flatnonzero(counts)[-1])) * 1000, 3)
+        summary['mean_all_time'] = round(self.total_seconds / self.total_count * 1000, 3)
+        return summary
+
+
+class StageTimer:
+    """Per-thread stage timings of the current inspection, folded into per-stage histograms"""
+
+    def __init__(self, window=300.0, precision=0.02):
+        self.window = window
+        self.precision = precision
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    @contextmanager
+    def inspection(self):
+        """Open the calling thread's record (nested calls share the outermost one); yields {stage: seconds}"""
+        timings = getattr(self._local, 'timings', None)
+        if timings is not None:
+            yield timings
+            return
+        timings = self._local.timings = {}
+        try:
+            yield timings
+        finally:
+            self._local.timings = None
+            self._record(timings)
+
+    @contextmanager
+    def stage(self, name):
+        timings = getattr(self._local, 'timings', None)
+        if timings is None:
+            yield
+            return
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started_at
+
+    def _record(self, timings):
+        with self._lock:
+            for name, seconds in timings.items():
+                histogram = self._histograms.get(name)
+                if histogram is None:
+                    histogram = self._histograms[name] = LatencyHistogram(self.window, self.precision)
+                histogram.record(seconds)
+
+    @staticmethod
+    def as_ms(timings):
+        """{stage: milliseconds} of an inspection record, for results"""
+        return {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'window_seconds': self.window,
+                'stages': {name: histogram.summary() for name, histogram in sorted(self._histograms.items())}
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+
+def timed_stage(name):
+    """Decorator timing a method of an object with a ``stage_timer`` as stage ``name``"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.stage_timer.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -5,6 +5,7 @@ import shutil
 from datetime import datetime
 from pathlib import Path
 from django.conf import settings
+from django.urls import reverse
 from .models import InspectionRecord
 import logging
 
@@ -76,9 +77,15 @@ class EnhancedStorageService:
     
     def save_inspection_with_images(self, user, image_id, original_image_path, 
                                    annotated_image_path, nuts_present, nuts_absent, 
-                                   confidence_scores=None, processing_time=0.0):
+                                   confidence_scores=None, processing_time=0.0,
+                                   qos_profile='full', reinspection_required=False, quality=None):
         """
         Save inspection record with QR-code-based image organization
+
+        qos_profile / reinspection_required come from the detection result:
+        parts whose cascade the degraded QoS profile shortened stay queryable
+        for re-inspection. ``quality`` is the quality gate's assessment of the
+        frame, kept with the record.
         """
         try:
             # Determine test status
@@ -88,8 +95,11 @@ class EnhancedStorageService:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             
             # Generate filenames
-            original_filename = self.generate_filename(image_id, timestamp, 'original')
-            annotated_filename = self.generate_filename(image_id, timestamp, 'annotated')
+            # Keep the source extensions (IMAGE_FORMATS may store PNG / WebP originals)
+            original_filename = self.generate_filename(
+                image_id, timestamp, 'original', Path(original_image_path).suffix.lstrip('.') or 'jpg')
+            annotated_filename = self.generate_filename(
+                image_id, timestamp, 'annotated', Path(annotated_image_path or '').suffix.lstrip('.') or 'jpg')
             
             # Create QR-code specific folder structure
             folders = self.create_qr_folder_structure(image_id, test_status)
@@ -106,11 +116,12 @@ class EnhancedStorageService:
                 logger.warning(f"⚠️ Original image not found: {original_image_path}")
                 return None
             
-            if os.path.exists(annotated_image_path):
+            if annotated_image_path and os.path.exists(annotated_image_path):
                 shutil.copy2(annotated_image_path, target_annotated_path)
                 logger.info(f"Copied annotated image to: {target_annotated_path}")
             else:
-                logger.warning(f"Annotated image not found: {annotated_image_path}")
+                # Lazy annotations (ANNOTATION_MODE) have no JPEG: served by the annotated-image endpoint
+                logger.info(f"No annotated image file for {image_id}, rendered on request")
             
             # Create database record
             inspection = InspectionRecord.objects.create(
@@ -119,7 +130,9 @@ class EnhancedStorageService:
                 nuts_present=nuts_present,
                 nuts_absent=nuts_absent,
                 test_status=test_status,
-                processing_time=processing_time
+                processing_time=processing_time,
+                qos_profile=qos_profile,
+                reinspection_required=reinspection_required
             )
             
             # Set appropriate image paths based on status (relative to MEDIA_ROOT)
@@ -141,6 +154,8 @@ class EnhancedStorageService:
             # Save confidence scores if provided
             if confidence_scores:
                 inspection.set_confidence_scores_list(confidence_scores)
+            if quality:
+                inspection.set_quality_scores(quality)
             
             inspection.save()
             
@@ -224,6 +239,15 @@ class EnhancedStorageService:
         logger.info(f"🧹 Cleaned {cleaned_count} temporary files")
         return cleaned_count
     
+    def _annotated_image_url(self, inspection):
+        """Stored annotated JPEG, else the on-demand render of the inspection's annotation record"""
+        if inspection.annotated_image_path:
+            return f"/media/{inspection.annotated_image_path}"
+        from .services import get_detection_service
+        if get_detection_service().annotations.latest(inspection.image_id) is None:
+            return None
+        return reverse('ml_api:annotated_image', args=[inspection.image_id])
+    
     def get_recent_inspections(self, status=None, limit=10):
         """Get recent inspections with proper QR-code-based image paths"""
         queryset = InspectionRecord.objects.all()
@@ -243,7 +267,7 @@ class EnhancedStorageService:
                 'nuts_present': inspection.nuts_present,
                 'nuts_absent': inspection.nuts_absent,
                 'original_image_url': f"/media/{inspection.original_image_path}" if inspection.original_image_path else None,
-                'annotated_image_url': f"/media/{inspection.annotated_image_path}" if inspection.annotated_image_path else None,
+                'annotated_image_url': self._annotated_image_url(inspection),
                 'confidence_scores': inspection.get_confidence_scores_list(),
                 'processing_time': inspection.processing_time
             }
@@ -1,3 +1,1111 @@
-from django.test import TestCase
+import os
+import json
+import socket
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+import cv2
+import numpy as np
+
+from .detection_merge import (
+    box_iou_matrix,
+    fuse_into_existing,
+    greedy_nms,
+    select_non_overlapping,
+    weighted_box_fusion,
+)
+from .detections import CLASS_MISSING, CLASS_PRESENT, Detections
+from .inference_daemon import (
+    UNIX_SOCKETS_AVAILABLE,
+    InferenceClient,
+    InferenceDaemon,
+    RemoteNutDetectionService,
+    recv_message,
+    send_message,
+)
+from .micro_batching import MicroBatchingEngine
+from .concurrency import ThreadLocalCounters
+from .fixture_layout import FixtureLayout
+from .crop_verifier import CropVerifier, crop_features
+from .prescreen import NutPrescreen
+from .result_cache import ResultCache, frame_key
+from .cascade_policy import ALL_POSITIONS_FOUND, CONFIDENT_MISSING, DEGRADED_PROFILE, CascadePolicy
+from .load_monitor import DEGRADED, FULL, LoadMonitor
+from .quality_gate import EXPOSURE, FIXTURE, SHARPNESS, assess_frame
+from .enhancement import EnhancementEngine, brightness_lut
+from .annotations import AnnotationStore, build_annotation, render_annotation
+from .image_writer import ImageWriter, get_image_writer
+from .stage_timing import LatencyHistogram, StageTimer, timed_stage
+from .inference_engines import (
+    STUB_NUT_POSITIONS,
+    ExportedYoloEngine,
+    StubEngine,
+    approved_int8_model,
+    decode_yolo_output,
+    letterbox,
+    quantization_report_path,
+    quantized_model_path,
+)
+
+
+# Reference implementations: the pure-Python merge logic from FlexibleNutDetectionService
+def _reference_iou(bbox1, bbox2):
+    x1_max = max(bbox1[0], bbox2[0])
+    y1_max = max(bbox1[1], bbox2[1])
+    x2_min = min(bbox1[2], bbox2[2])
+    y2_min = min(bbox1[3], bbox2[3])
+    if x2_min <= x1_max or y2_min <= y1_max:
+        return 0.0
+    intersection = (x2_min - x1_max) * (y2_min - y1_max)
+    area1 = (bbox1[2] - bbox1[0]) * (bbox1[3] - bbox1[1])
+    area2 = (bbox2[2] - bbox2[0]) * (bbox2[3] - bbox2[1])
+    union = area1 + area2 - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def _reference_overlaps(new_detection, existing_detections, overlap_threshold):
+    return any(_reference_iou(new_detection['bbox'], existing['bbox']) > overlap_threshold
+               for existing in existing_detections)
+
+
+def _reference_filter_and_rank(detections):
+    sorted_detections = sorted(detections, key=lambda x: x['confidence'], reverse=True)
+    filtered_detections = []
+    for detection in sorted_detections:
+        if not _reference_overlaps(detection, filtered_detections, 0.5):
+            filtered_detections.append(detection)
+    return filtered_detections[:4]
+
+
+def _reference_merge(candidates, existing, overlap_threshold):
+    merged = list(existing)
+    for candidate in candidates:
+        if not _reference_overlaps(candidate, merged, overlap_threshold):
+            merged.append(candidate)
+    return merged
+
+
+def _random_detections(rng, count, image_size=1000, box_size=(30, 150), clustered=True):
+    """Random boxes; clustered around four nut positions so plenty of them overlap"""
+    centers = rng.uniform(100, image_size - 100, size=(4, 2))
+    detections = []
+    for _ in range(count):
+        if clustered:
+            cx, cy = centers[rng.integers(4)] + rng.normal(0, 25, size=2)
+        else:
+            cx, cy = rng.uniform(0, image_size, size=2)
+        w, h = rng.uniform(*box_size, size=2)
+        detections.append({
+            'bbox': [float(cx - w / 2), float(cy - h / 2), float(cx + w / 2), float(cy + h / 2)],
+            'confidence': float(rng.uniform(0.05, 0.95)),
+        })
+    return detections
+
+
+class BoxIouMatrixTests(SimpleTestCase):
+    def test_matches_pairwise_reference(self):
+        rng = np.random.default_rng(0)
+        a = _random_detections(rng, 25)
+        b = _random_detections(rng, 17)
+        matrix = box_iou_matrix([d['bbox'] for d in a], [d['bbox'] for d in b])
+
+        self.assertEqual(matrix.shape, (25, 17))
+        for i, da in enumerate(a):
+            for j, db in enumerate(b):
+                self.assertAlmostEqual(matrix[i, j], _reference_iou(da['bbox'], db['bbox']), places=12)
+
+    def test_touching_and_degenerate_boxes_give_zero(self):
+        matrix = box_iou_matrix([[0, 0, 10, 10], [5, 5, 5, 5]], [[10, 0, 20, 10], [5, 5, 5, 5]])
+        np.testing.assert_array_equal(matrix, np.zeros((2, 2)))
+
+    def test_empty_inputs(self):
+        self.assertEqual(box_iou_matrix([], [[0, 0, 1, 1]]).shape, (0, 1))
+        self.assertEqual(box_iou_matrix([[0, 0, 1, 1]], []).shape, (1, 0))
+
+
+class GreedyNmsTests(SimpleTestCase):
+    def test_matches_filter_and_rank_reference(self):
+        rng = np.random.default_rng(1)
+        for trial in range(50):
+            detections = _random_detections(rng, int(rng.integers(0, 60)))
+            expected = _reference_filter_and_rank(detections)
+
+            keep = greedy_nms([d['bbox'] for d in detections],
+                              [d['confidence'] for d in detections], 0.5, max_keep=4)
+            self.assertEqual([detections[i] for i in keep], expected, f"trial {trial}")
+
+    def test_ties_keep_input_order(self):
+        boxes = [[0, 0, 10, 10], [100, 100, 110, 110], [1, 1, 11, 11]]
+        keep = greedy_nms(boxes, [0.5, 0.5, 0.5], 0.5)
+        self.assertEqual(keep.tolist(), [0, 1])
+
+
+class SelectNonOverlappingTests(SimpleTestCase):
+    def test_matches_sequential_overlap_reference(self):
+        rng = np.random.default_rng(2)
+        for trial in range(50):
+            existing = _random_detections(rng, int(rng.integers(0, 5)))
+            candidates = _random_detections(rng, int(rng.integers(0, 40)))
+            expected = _reference_merge(candidates, existing, 0.3)
+
+            mask = select_non_overlapping([d['bbox'] for d in candidates],
+                                          [d['bbox'] for d in existing], 0.3)
+            merged = existing + [c for c, keep in zip(candidates, mask) if keep]
+            self.assertEqual(merged, expected, f"trial {trial}")
+
+    def test_candidates_suppress_later_candidates(self):
+        mask = select_non_overlapping([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]], [], 0.3)
+        self.assertEqual(mask.tolist(), [True, False, True])
+
+
+class WeightedBoxFusionTests(SimpleTestCase):
+    def test_overlapping_boxes_are_averaged_by_score(self):
+        boxes = [[0, 0, 10, 10], [2, 2, 12, 12], [100, 100, 110, 110]]
+        fused, scores, representatives = weighted_box_fusion(boxes, [0.6, 0.2, 0.4], 0.3)
+
+        self.assertEqual(representatives.tolist(), [0, 2])
+        np.testing.assert_allclose(scores, [0.6, 0.4])
+        np.testing.assert_allclose(fused[0], [0.5, 0.5, 10.5, 10.5])
+        np.testing.assert_allclose(fused[1], [100, 100, 110, 110])
+
+    def test_keeps_same_clusters_as_nms_for_separated_positions(self):
+        rng = np.random.default_rng(3)
+        detections = _random_detections(rng, 40, box_size=(60, 80))
+        boxes = [d['bbox'] for d in detections]
+        scores = [d['confidence'] for d in detections]
+
+        _, _, representatives = weighted_box_fusion(boxes, scores, 0.5)
+        keep = greedy_nms(boxes, scores, 0.5)
+        self.assertEqual(representatives[0], keep[0])
+
+    def test_fuse_into_existing(self):
+        boxes, weights, assignment = fuse_into_existing(
+            [[0, 0, 10, 10]], [0.5],
+            [[2, 2, 12, 12], [50, 50, 60, 60], [51, 51, 61, 61]], [0.5, 0.3, 0.3], 0.3)
+
+        self.assertEqual(assignment.tolist(), [0, -1, 1])
+        np.testing.assert_allclose(boxes[0], [1, 1, 11, 11])
+        np.testing.assert_allclose(boxes[1], [50.5, 50.5, 60.5, 60.5])
+        np.testing.assert_allclose(weights, [1.0, 0.6])
+
+
+class _FakeBoxes:
+    """Minimal stand-in for ultralytics Boxes: only the (N, 6) data array is read"""
+    def __init__(self, rows):
+        self.data = np.asarray(rows, dtype=np.float32).reshape(-1, 6)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class _FakeResult:
+    def __init__(self, rows):
+        self.boxes = _FakeBoxes(rows)
+
+
+class DetectionsTests(SimpleTestCase):
+    def test_from_ultralytics_drops_unknown_classes(self):
+        detections = Detections.from_ultralytics(_FakeResult([
+            [0, 0, 10, 10, 0.9, 1],
+            [20, 20, 30, 30, 0.4, 0],
+            [40, 40, 50, 50, 0.7, 5],
+        ]), 'primary')
+
+        self.assertEqual(len(detections), 2)
+        self.assertEqual(detections.count(CLASS_PRESENT), 1)
+        self.assertEqual(detections.count(CLASS_MISSING), 1)
+        self.assertEqual(detections.methods.tolist(), ['primary', 'primary'])
+
+    def test_dict_round_trip(self):
+        dicts = [
+            {'class_id': 1, 'class_name': 'PRESENT', 'confidence': 0.5, 'bbox': [1.0, 2.0, 3.0, 4.0]},
+            {'class_id': 0, 'class_name': 'MISSING', 'confidence': 0.25, 'bbox': [5.0, 6.0, 7.0, 8.0]},
+        ]
+        self.assertEqual(Detections.from_dicts(dicts).to_dicts(), dicts)
+
+    def test_position_order_is_top_left_to_bottom_right(self):
+        detections = Detections([[400, 400, 500, 500], [400, 100, 500, 200], [100, 400, 200, 500],
+                                 [100, 100, 200, 200]], [0.5] * 4, [1] * 4)
+        ordered = detections[detections.position_order()]
+        self.assertEqual(ordered.boxes[:, :2].tolist(), [[100, 100], [400, 100], [100, 400], [400, 400]])
+
+
+class _BoxEchoEngine(ExportedYoloEngine):
+    """Exported-engine stand-in whose network 'detects' fixed original-image boxes"""
+    name = 'echo'
+
+    def __init__(self, boxes, scores, class_ids):
+        super().__init__('unused.pt')
+        self.boxes, self.scores, self.class_ids = boxes, scores, class_ids
+
+    def _forward(self, batch):
+        height, width = self.original_shape
+        gain = min(batch.shape[2] / height, batch.shape[3] / width)
+        pad_x = round((batch.shape[3] - width * gain) / 2 - 0.1)
+        pad_y = round((batch.shape[2] - height * gain) / 2 - 0.1)
+        output = np.zeros((len(batch), 6, len(self.boxes)), dtype=np.float32)
+        for i, ((x1, y1, x2, y2), score, class_id) in enumerate(zip(self.boxes, self.scores, self.class_ids)):
+            x1, x2 = x1 * gain + pad_x, x2 * gain + pad_x
+            y1, y2 = y1 * gain + pad_y, y2 * gain + pad_y
+            output[:, :4, i] = [(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1]
+            output[:, 4 + class_id, i] = score
+        return output
+
+
+class ExportedEngineTests(SimpleTestCase):
+    def test_letterbox_keeps_aspect_ratio_and_pads_to_stride(self):
+        padded, gain, pad = letterbox(np.zeros((1080, 1440, 3), np.uint8), 640)
+        self.assertEqual(padded.shape, (480, 640, 3))
+        self.assertAlmostEqual(gain, 640 / 1440)
+        self.assertEqual(pad, (0, 0))
+
+        padded, _, pad = letterbox(np.zeros((1080, 1440, 3), np.uint8), 640, auto=False)
+        self.assertEqual(padded.shape, (640, 640, 3))
+        self.assertEqual(pad, (0, 80))
+
+    def test_letterbox_matches_copy_make_border(self):
+        image = np.random.default_rng(4).integers(0, 255, size=(1080, 1440, 3), dtype=np.uint8)
+        for auto in (True, False):
+            padded, gain, (left, top) = letterbox(image, 640, auto=auto)
+            resized = cv2.resize(image, (640, 480), interpolation=cv2.INTER_LINEAR)
+            bottom = padded.shape[0] - top - 480
+            right = padded.shape[1] - left - 640
+            expected = cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                                          value=(114, 114, 114))
+            np.testing.assert_array_equal(padded, expected)
+
+    def test_decode_is_class_aware(self):
+        # Two heavily overlapping boxes of different classes both survive; the same-class duplicate does not
+        output = np.zeros((6, 3), dtype=np.float32)
+        output[:4] = np.array([[50, 50, 20, 20], [51, 51, 20, 20], [50, 50, 20, 20]], dtype=np.float32).T
+        output[5, 0], output[4, 1], output[5, 2] = 0.9, 0.8, 0.7
+
+        boxes, confidences, class_ids = decode_yolo_output(output, conf=0.25, iou=0.45)
+        self.assertEqual(class_ids.tolist(), [CLASS_PRESENT, CLASS_MISSING])
+        np.testing.assert_allclose(confidences, [0.9, 0.8])
+        np.testing.assert_allclose(boxes[0], [40, 40, 60, 60])
+
+    def test_predict_maps_boxes_back_to_original_frame(self):
+        engine = _BoxEchoEngine([[100, 100, 200, 200], [900, 700, 1000, 800]], [0.9, 0.1], [1, 0])
+        frame = np.zeros((1080, 1440, 3), np.uint8)
+        engine.original_shape = frame.shape[:2]
+
+        detections = engine.predict([frame, frame], conf=0.05, iou=0.45, method='primary')
+        self.assertEqual(len(detections), 2)
+        for result in detections:
+            np.testing.assert_allclose(result.boxes, [[100, 100, 200, 200], [900, 700, 1000, 800]], atol=0.01)
+            self.assertEqual(result.class_ids.tolist(), [CLASS_PRESENT, CLASS_MISSING])
+            self.assertEqual(result.methods.tolist(), ['primary', 'primary'])
+
+    def test_input_buffers_are_reused_per_shape(self):
+        engine = _BoxEchoEngine([[100, 100, 200, 200]], [0.9], [1])
+        frame = np.zeros((1080, 1440, 3), np.uint8)
+        engine.original_shape = frame.shape[:2]
+
+        first = engine.predict([frame], conf=0.25, iou=0.45)[0]
+        buffers = engine._input_buffers(1, (480, 640))
+        second = engine.predict([frame], conf=0.25, iou=0.45)[0]
+        self.assertIs(engine._input_buffers(1, (480, 640))[1], buffers[1])
+        np.testing.assert_array_equal(first.boxes, second.boxes)
+
+
+class Int8GateTests(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmpdir.name, 'model.pt')
+        open(self.model_path, 'w').close()
+        open(quantized_model_path(self.model_path), 'w').close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write_report(self, **report):
+        with open(quantization_report_path(self.model_path), 'w') as f:
+            json.dump(report, f)
+
+    def test_missing_report_keeps_fp32(self):
+        self.assertIsNone(approved_int8_model(self.model_path, 0.99))
+
+    def test_agreement_and_false_ok_gate(self):
+        self._write_report(decision_agreement=0.998, false_ok=0)
+        self.assertEqual(approved_int8_model(self.model_path, 0.995), quantized_model_path(self.model_path))
+        self.assertIsNone(approved_int8_model(self.model_path, 0.999))
+
+        self._write_report(decision_agreement=0.998, false_ok=1)
+        self.assertIsNone(approved_int8_model(self.model_path, 0.995))
+
+    def test_stale_int8_model_is_ignored(self):
+        self._write_report(decision_agreement=1.0, false_ok=0)
+        os.utime(quantized_model_path(self.model_path), (0, 0))
+        self.assertIsNone(approved_int8_model(self.model_path, 0.995))
+
+
+class InferenceDaemonProtocolTests(SimpleTestCase):
+    def test_frame_round_trip(self):
+        frame = np.random.default_rng(5).integers(0, 255, size=(48, 64, 3), dtype=np.uint8)
+        left, right = socket.socketpair()
+        with left, right:
+            send_message(left, {'op': 'process_frame', 'shape': list(frame.shape), 'dtype': frame.dtype.str},
+                         memoryview(frame).cast('B'))
+            header, payload = recv_message(right)
+
+        self.assertEqual(header['op'], 'process_frame')
+        received = np.frombuffer(payload, dtype=header['dtype']).reshape(header['shape'])
+        np.testing.assert_array_equal(received, frame)
+
+    def _remote(self, error):
+        client = InferenceClient('/nonexistent/daemon.sock')
+        client.process_frame = mock.Mock(side_effect=error)
+        fallback = mock.Mock()
+        fallback.process_frame.return_value = {'success': True}
+        return RemoteNutDetectionService(client, fallback=fallback), fallback
+
+    def test_unreachable_daemon_falls_back_to_local(self):
+        frame = np.zeros((8, 8, 3), np.uint8)
+        for error in (FileNotFoundError(), ConnectionRefusedError()):
+            remote, fallback = self._remote(error)
+            self.assertEqual(remote.process_frame(frame, 'P1'), {'success': True})
+            fallback.process_frame.assert_called_once()
+
+    @skipUnless(UNIX_SOCKETS_AVAILABLE, 'needs Unix-domain sockets')
+    def test_confidence_change_and_statistics_reach_the_daemon(self):
+        with tempfile.TemporaryDirectory() as directory:
+            service = stub_service()
+            daemon = InferenceDaemon(service, os.path.join(directory, 'daemon.sock'))
+            thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+            thread.start()
+            deadline = time.monotonic() + 5
+            while daemon.server is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            try:
+                remote = RemoteNutDetectionService(InferenceClient(daemon.address, timeout=5))
+                remote.update_confidence_levels(primary=0.45, ultra_low=[0.12, 0.06])
+                self.assertEqual(service.config['primary_confidence'], 0.45)
+                self.assertEqual(service.config['ultra_low_confidence'], (0.12, 0.06))
+                self.assertIn('total_processed', remote.get_statistics())
+            finally:
+                daemon.shutdown()
+                thread.join(5)
+
+    def test_confidence_change_without_daemon_is_rejected(self):
+        remote = RemoteNutDetectionService(InferenceClient('/nonexistent/daemon.sock'))
+        with self.assertRaises(RuntimeError):
+            remote.update_confidence_levels(primary=0.45)
+
+    def test_timeout_is_a_failure_not_a_local_rerun(self):
+        remote, fallback = self._remote(socket.timeout('timed out'))
+        result = remote.process_frame(np.zeros((8, 8, 3), np.uint8), 'P1')
+        self.assertFalse(result['success'])
+        self.assertIn('timed out', result['error'])
+        fallback.process_frame.assert_not_called()
+
+
+class _RecordingEngine:
+    """Returns one detection per frame whose confidence is the frame's fill value"""
+    name = 'recording'
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, images, **kwargs):
+        self.batch_sizes.append(len(images))
+        return [Detections([[0, 0, 10, 10]], [float(image[0, 0, 0]) / 255], [CLASS_PRESENT]) for image in images]
+
+
+class MicroBatchingTests(SimpleTestCase):
+    def test_concurrent_requests_share_a_batch_and_get_their_own_results(self):
+        engine = _RecordingEngine()
+        batcher = MicroBatchingEngine(engine, max_batch=8, max_delay_ms=200)
+        results = {}
+        barrier = threading.Barrier(4)
+
+        def inspect(value):
+            barrier.wait()
+            frame = np.full((8, 8, 3), value, dtype=np.uint8)
+            results[value] = batcher.predict([frame], conf=0.25, method=f'part_{value}')[0]
+
+        threads = [threading.Thread(target=inspect, args=(value,)) for value in (10, 20, 30, 40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(len(engine.batch_sizes), 4)
+        self.assertEqual(sum(engine.batch_sizes), 4)
+        for value, detections in results.items():
+            self.assertAlmostEqual(float(detections.confidences[0]), value / 255, places=5)
+            self.assertEqual(detections.methods.tolist(), [f'part_{value}'])
+        self.assertEqual(batcher.metrics()['images'], 4)
+
+    def test_lone_inspection_is_not_delayed(self):
+        batcher = MicroBatchingEngine(_RecordingEngine(), max_batch=8, max_delay_ms=500)
+        with batcher.session():
+            batcher.predict([np.zeros((8, 8, 3), np.uint8)], conf=0.25)
+        self.assertLess(batcher.metrics()['queue_delay_ms']['max'], 250)
+
+
+class ThreadLocalCountersTests(SimpleTestCase):
+    def test_concurrent_increments_are_not_lost(self):
+        counters = ThreadLocalCounters({'total_processed': 0, 'multi_scale_stats': {}})
+
+        def work():
+            for _ in range(1000):
+                counters.add('total_processed')
+                counters.add(('multi_scale_stats', '480', 'runs'))
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = counters.snapshot()
+        self.assertEqual(stats['total_processed'], 8000)
+        self.assertEqual(stats['multi_scale_stats'], {'480': {'runs': 8000}})
+
+    def test_finished_threads_are_retired(self):
+        counters = ThreadLocalCounters()
+        for _ in range(ThreadLocalCounters.RETIRE_THRESHOLD * 2):
+            thread = threading.Thread(target=counters.add, args=('triggers',))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(counters.snapshot()['triggers'], ThreadLocalCounters.RETIRE_THRESHOLD * 2)
+        self.assertLessEqual(len(counters._registered), 1)
+
+
+class FixtureLayoutTests(SimpleTestCase):
+    def setUp(self):
+        # Registered in scrambled order on a 1440x1080 frame
+        self.layout = FixtureLayout.from_boxes(
+            [[900, 700, 1000, 800], [200, 100, 300, 200], [200, 700, 300, 800], [900, 100, 1000, 200]],
+            (1080, 1440, 3))
+
+    def test_regions_are_ordered_like_nut_positions(self):
+        np.testing.assert_array_equal(self.layout.regions[:, :2],
+                                      [[200, 100], [900, 100], [200, 700], [900, 700]])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'layout.json')
+            self.assertIsNone(FixtureLayout.load(path))
+            self.layout.save(path)
+            loaded = FixtureLayout.load(path)
+        np.testing.assert_array_equal(loaded.regions, self.layout.regions)
+        self.assertEqual(loaded.frame_shape, (1080, 1440))
+
+    def test_crop_windows_scale_with_the_frame_and_are_clipped(self):
+        windows = self.layout.crop_windows((540, 720), margin=0.5)
+        np.testing.assert_array_equal(windows[0], [75, 25, 175, 125])
+        self.assertIsNone(self.layout.crop_windows((1080, 1080), margin=0.5))  # Different aspect ratio
+        np.testing.assert_array_equal(self.layout.crop_windows((1080, 1440), margin=5.0)[3], [400, 200, 1440, 1080])
+
+    def test_assign_by_box_centre(self):
+        boxes = [[910, 710, 1010, 810], [210, 90, 290, 190], [550, 450, 650, 550]]
+        np.testing.assert_array_equal(self.layout.assign(boxes, (1080, 1440)), [3, 0, -1])
+
+
+def _nut_frame(rng, present):
+    """Noisy 100x100 tile with a bright ring (nut) or a dark hole in the centre"""
+    frame = rng.integers(90, 130, size=(100, 100, 3), dtype=np.uint8)
+    if present:
+        cv2.circle(frame, (50, 50), 30, (230, 230, 230), -1)
+        cv2.circle(frame, (50, 50), 12, (60, 60, 60), -1)
+    else:
+        cv2.circle(frame, (50, 50), 22, (15, 15, 15), -1)
+    return frame
+
+
+class CropVerifierTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        box = [[15, 15, 85, 85]]
+        self.frames = [(_nut_frame(rng, i % 2 == 0), i % 2 == 0) for i in range(40)]
+        features = np.concatenate([crop_features(frame, box) for frame, _ in self.frames])
+        labels = [1 if present else 0 for _, present in self.frames]
+        self.verifier = CropVerifier.train(features[:30], labels[:30], epochs=200)
+        self.box = box
+
+    def test_separates_present_and_missing_crops(self):
+        for frame, present in self.frames[30:]:
+            probability = float(self.verifier.predict(frame, self.box)[0])
+            self.assertEqual(probability >= 0.5, present)
+
+    def test_needs_both_classes(self):
+        with self.assertRaises(ValueError):
+            CropVerifier.train(np.zeros((4, 8)), [1, 1, 1, 1])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'verifier.npz')
+            self.verifier.save(path)
+            loaded = CropVerifier.load(path)
+        frame = self.frames[31][0]
+        np.testing.assert_allclose(loaded.predict(frame, self.box), self.verifier.predict(frame, self.box), rtol=1e-5)
+        self.assertEqual(loaded.metadata['samples'], 30)
+
+
+class NutPrescreenTests(SimpleTestCase):
+    def setUp(self):
+        self.layout = FixtureLayout.from_boxes(
+            [[50, 50, 150, 150], [250, 50, 350, 150], [50, 250, 150, 350], [250, 250, 350, 350]], (400, 400))
+        rng = np.random.default_rng(1)
+        self.prescreen = NutPrescreen.build([self._part(rng) for _ in range(5)], self.layout)
+        self.rng = rng
+
+    def _part(self, rng, missing=(), shift=0):
+        frame = rng.integers(90, 130, size=(400, 400, 3), dtype=np.uint8)
+        for index, (x1, y1, x2, y2) in enumerate(self.layout.regions.astype(int).tolist()):
+            if index in missing:
+                cv2.circle(frame, ((x1 + x2) // 2 + shift, (y1 + y2) // 2), 22, (15, 15, 15), -1)
+            else:
+                cv2.circle(frame, ((x1 + x2) // 2 + shift, (y1 + y2) // 2), 35, (230, 230, 230), -1)
+                cv2.circle(frame, ((x1 + x2) // 2 + shift, (y1 + y2) // 2), 14, (60, 60, 60), -1)
+        return frame
+
+    def test_good_part_matches_every_region_even_when_shifted(self):
+        scores = self.prescreen.scores(self._part(self.rng, shift=6), self.layout)
+        self.assertGreater(scores.min(), 0.9)
+
+    def test_missing_nut_fails_its_region(self):
+        scores = self.prescreen.scores(self._part(self.rng, missing=(2,)), self.layout)
+        self.assertLess(scores[2], 0.5)
+        self.assertGreater(np.delete(scores, 2).min(), 0.9)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'prescreen.npz')
+            self.prescreen.save(path)
+            loaded = NutPrescreen.load(path)
+        frame = self._part(self.rng)
+        np.testing.assert_allclose(loaded.scores(frame, self.layout), self.prescreen.scores(frame, self.layout))
+
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.detections = Detections([[1, 2, 3, 4]], [0.9], [CLASS_PRESENT], 'primary')
+
+    def test_key_depends_on_pixels_and_fingerprint(self):
+        frame = np.zeros((8, 8, 3), dtype=np.uint8)
+        key = frame_key(frame, 'a')
+        self.assertEqual(key, frame_key(frame.copy(), 'a'))
+        self.assertNotEqual(key, frame_key(frame, 'b'))
+        frame[0, 0, 0] = 1
+        self.assertNotEqual(key, frame_key(frame, 'a'))
+
+    def test_lru_eviction_and_counters(self):
+        cache = ResultCache(max_entries=2)
+        cache.put('a', self.detections)
+        cache.put('b', self.detections)
+        self.assertIsNotNone(cache.get('a'))  # 'b' is now least recently used
+        cache.put('c', self.detections)
+        self.assertIsNone(cache.get('b'))
+        metrics = cache.metrics()
+        self.assertEqual((metrics['entries'], metrics['hits'], metrics['misses'], metrics['evictions']), (2, 1, 1, 1))
+
+    def test_expired_entries_miss(self):
+        cache = ResultCache(max_age=0.0)
+        cache.put('a', self.detections)
+        self.assertIsNone(cache.get('a'))
+
+    def test_cached_detections_are_copies(self):
+        cache = ResultCache()
+        cache.put('a', self.detections)
+        cache.get('a').boxes += 10
+        np.testing.assert_array_equal(cache.get('a').boxes, [[1, 2, 3, 4]])
+
+    def test_persisted_entries_survive_a_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ResultCache(persist_dir=directory).put('a', self.detections)
+            restored = ResultCache(persist_dir=directory).get('a')
+        np.testing.assert_array_equal(restored.boxes, self.detections.boxes)
+        self.assertEqual(restored.methods.tolist(), ['primary'])
+
+
+class CascadePolicyTests(SimpleTestCase):
+    def _detections(self, classes, confidences):
+        boxes = [[i * 100, 0, i * 100 + 50, 50] for i in range(len(classes))]
+        return Detections(boxes, confidences, classes)
+
+    def test_confident_missing_settles_ng(self):
+        policy = CascadePolicy(missing_confidence=0.5)
+        detections = self._detections([CLASS_PRESENT, CLASS_MISSING], [0.9, 0.7])
+        self.assertEqual(policy.stop_reason(detections), CONFIDENT_MISSING)
+
+    def test_uncertain_parts_keep_escalating(self):
+        policy = CascadePolicy(missing_confidence=0.5)
+        self.assertIsNone(policy.stop_reason(self._detections([CLASS_PRESENT, CLASS_MISSING], [0.9, 0.3])))
+        self.assertIsNone(policy.stop_reason(Detections.empty()))
+
+    def test_all_positions_found_applies_even_when_disabled(self):
+        policy = CascadePolicy(early_termination=False)
+        self.assertEqual(policy.stop_reason(self._detections([CLASS_PRESENT] * 4, [0.9] * 4)), ALL_POSITIONS_FOUND)
+        self.assertIsNone(policy.stop_reason(self._detections([CLASS_MISSING], [0.99])))
+
+    def test_degraded_profile_skips_other_passes(self):
+        policy = CascadePolicy(allowed_passes=('fallback',))
+        detections = self._detections([CLASS_PRESENT], [0.9])
+        self.assertIsNone(policy.stop_reason(detections, 'fallback'))
+        self.assertEqual(policy.stop_reason(detections, 'enhancement'), DEGRADED_PROFILE)
+        self.assertEqual(policy.stop_reason(detections, 'multi_scale_800'), DEGRADED_PROFILE)
+
+
+class LoadMonitorTests(SimpleTestCase):
+    def _inspect(self, monitor, latency):
+        started_at, profile = monitor.begin()
+        monitor.finish((started_at - latency, profile))
+        return profile
+
+    def test_degrades_when_latency_exceeds_takt_and_recovers_with_hysteresis(self):
+        monitor = LoadMonitor(takt_time=1.0, enter_pressure=1.0, exit_pressure=0.7, window=2)
+        self.assertEqual(self._inspect(monitor, 1.5), FULL)      # No latency history yet
+        self.assertEqual(self._inspect(monitor, 0.8), DEGRADED)  # Average 1.5 s > 1 takt
+        self.assertEqual(self._inspect(monitor, 0.9), DEGRADED)  # 1.15 s
+        self.assertEqual(self._inspect(monitor, 0.3), DEGRADED)  # 0.85 s: below 1 takt, above the exit level
+        self.assertEqual(self._inspect(monitor, 0.3), FULL)      # 0.6 s
+        self.assertEqual(monitor.metrics()['switches'], 2)
+
+    def test_backlog_limit(self):
+        monitor = LoadMonitor(takt_time=10.0, max_backlog=1)
+        first = monitor.begin()
+        second = monitor.begin()
+        self.assertEqual((first[1], second[1]), (FULL, DEGRADED))
+
+    def test_reinspection_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'reinspection.jsonl')
+            monitor = LoadMonitor(takt_time=1.0, reinspection_log=path)
+            monitor.record_reinspection({'image_id': 'A1'})
+            monitor.record_reinspection({'image_id': 'A2'})
+            with open(path) as f:
+                self.assertEqual([json.loads(line)['image_id'] for line in f], ['A1', 'A2'])
+
+
+class QualityGateTests(SimpleTestCase):
+    config = {
+        'quality_min_sharpness': 20.0,
+        'quality_max_clipped': 0.3,
+        'quality_min_mean': 25.0,
+        'quality_max_mean': 230.0,
+        'quality_min_edge_density': 0.01
+    }
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.frame = rng.integers(60, 160, size=(480, 640, 3), dtype=np.uint8)
+        for x in range(80, 640, 160):
+            cv2.circle(self.frame, (x, 240), 40, (230, 230, 230), 3)
+
+    def test_good_frame_passes(self):
+        quality = assess_frame(self.frame, self.config)
+        self.assertTrue(quality['passed'], quality)
+
+    def test_blurred_frame_fails_sharpness(self):
+        quality = assess_frame(cv2.GaussianBlur(self.frame, (0, 0), 8), self.config)
+        self.assertIn(SHARPNESS, quality['failed'])
+
+    def test_overexposed_frame_fails_exposure(self):
+        quality = assess_frame(cv2.add(self.frame, np.full_like(self.frame, 150)), self.config)
+        self.assertIn(EXPOSURE, quality['failed'])
+
+    def test_empty_frame_fails_fixture_check(self):
+        quality = assess_frame(np.full((480, 640, 3), 120, dtype=np.uint8), self.config)
+        self.assertIn(FIXTURE, quality['failed'])
+
+
+
+class EnhancementEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.frame = np.random.default_rng(3).integers(0, 160, size=(120, 160, 3), dtype=np.uint8)
+        self.enhancer = EnhancementEngine()
+
+    def test_brightness_lut_matches_float_scaling(self):
+        for factor in (0.4, 1.0, 1.7, 3.2):
+            expected = np.clip(self.frame * factor, 0, 255).astype(np.uint8)
+            np.testing.assert_array_equal(cv2.LUT(self.frame, brightness_lut(factor)), expected)
+
+    def test_variants_match_unbuffered_implementation(self):
+        variants = self.enhancer.variants(self.frame)
+        lab = cv2.cvtColor(self.frame, cv2.COLOR_BGR2LAB)
+        lab[:, :, 0] = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(lab[:, :, 0])
+        clahe = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+        np.testing.assert_array_equal(variants['clahe'], clahe)
+        brightness = np.clip(self.frame * (120 / np.mean(self.frame)), 0, 255).astype(np.uint8)
+        np.testing.assert_array_equal(variants['brightness'], brightness)
+        np.testing.assert_array_equal(variants['combined'], cv2.addWeighted(brightness, 0.7, clahe, 0.3, 0))
+
+    def test_buffers_are_reused_per_frame_size(self):
+        first = self.enhancer.variants(self.frame)['sharpened']
+        second = self.enhancer.variants(self.frame[::-1].copy())['sharpened']
+        self.assertIs(first.base if first.base is not None else first,
+                      second.base if second.base is not None else second)
+
+    def test_working_copy_scale(self):
+        working, scale = self.enhancer.working_copy(self.frame, 80)
+        self.assertEqual(working.shape, (60, 80, 3))
+        self.assertEqual(scale, 0.5)
+        self.assertIs(self.enhancer.working_copy(self.frame, 640)[0], self.frame)
+
+
+class AnnotationStoreTests(SimpleTestCase):
+    decision = {'status': 'NUTS_MISSING', 'action': 'REJECT', 'scenario': 'ONE_MISSING', 'box_color': 'RED',
+                'present_count': 1, 'missing_count': 1}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.frame = np.zeros((300, 400, 3), dtype=np.uint8)
+        self.frame[:] = np.linspace(40, 200, 400, dtype=np.uint8)[None, :, None]
+        self.source_path = os.path.join(self.directory, 'frame.png')
+        cv2.imwrite(self.source_path, self.frame)
+        self.detections = Detections([[50, 60, 120, 140], [200, 100, 280, 190]], [0.9, 0.6], [1, 0])
+        self.store = AnnotationStore(os.path.join(self.directory, 'annotations'), cache_entries=2, jpeg_quality=100)
+
+    def _annotation(self, image_id):
+        return build_annotation(image_id, self.detections, self.decision, self.frame.shape,
+                                ('MISSING', 'PRESENT'), self.source_path)
+
+    def test_record_is_json_data(self):
+        path = self.store.save(self._annotation('A1'))
+        with open(path) as f:
+            record = json.load(f)
+        self.assertEqual(record['frame_shape'], [300, 400])
+        self.assertEqual([d['class_name'] for d in record['detections']], ['PRESENT', 'MISSING'])
+        self.assertEqual(record['decision']['status'], 'NUTS_MISSING')
+
+    def test_render_on_demand_and_thumbnail(self):
+        self.store.save(self._annotation('A1'))
+        full = cv2.imdecode(np.frombuffer(self.store.render_jpeg('A1'), np.uint8), cv2.IMREAD_COLOR)
+        expected = render_annotation(self.frame, self._annotation('A1'))
+        self.assertEqual(full.shape, self.frame.shape)
+        self.assertLess(np.abs(full.astype(int) - expected).mean(), 2)
+        thumbnail = cv2.imdecode(np.frombuffer(self.store.render_jpeg('A1', 100), np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(thumbnail.shape, (75, 100, 3))
+
+    def test_render_cache_is_bounded(self):
+        self.store.save(self._annotation('A1'))
+        for size in (None, 100, 200):
+            self.store.render_jpeg('A1', size)
+        self.store.render_jpeg('A1', 200)
+        metrics = self.store.metrics()
+        self.assertEqual((metrics['cached_renders'], metrics['renders'], metrics['hits']), (2, 3, 1))
+
+    def test_latest_ignores_ids_with_the_same_prefix(self):
+        self.store.save(self._annotation('A1_B'))
+        self.assertIsNone(self.store.latest('A1'))
+        self.assertIsNone(self.store.render_jpeg('A1'))
+        self.assertIsNotNone(self.store.latest('A1_B'))
+
+    def test_source_pending_while_the_frame_is_written(self):
+        self.store.save(self._annotation('A1'))
+        writer = mock.Mock()
+        writer.pending.return_value = True
+        with mock.patch('ml_api.annotations.get_image_writer', return_value=writer):
+            self.assertTrue(self.store.source_pending('A1'))
+            writer.pending.assert_called_once_with(self.source_path)
+            self.assertFalse(self.store.source_pending('A2'))  # No record at all: 404, not 409
+        self.assertFalse(self.store.source_pending('A1'))
+
+
+class ImageWriterTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.frame = np.random.default_rng(5).integers(0, 255, size=(60, 80, 3), dtype=np.uint8)
+
+    def test_formats_per_artifact(self):
+        writer = ImageWriter(artifact_formats={'original': {'format': 'png'}})
+        original = writer.submit(self.frame, os.path.join(self.directory, 'part_camera.jpg'), 'original')
+        result = writer.submit(self.frame, os.path.join(self.directory, 'part_result.jpg'), 'result')
+        self.assertTrue(original.path.endswith('part_camera.png'))
+        self.assertEqual(original.result(), original.path)
+        np.testing.assert_array_equal(cv2.imread(original.path), self.frame)  # Lossless
+        self.assertTrue(result.result().endswith('.jpg'))
+        metrics = writer.metrics()
+        self.assertEqual((metrics['written'], metrics['queue_depth'], metrics['failed']), (2, 0, 0))
+
+    def test_wait_for_pending_path(self):
+        writer = ImageWriter()
+        handle = writer.submit(self.frame, os.path.join(self.directory, 'nested', 'a.jpg'), 'capture')
+        self.assertTrue(writer.wait(handle.path))
+        self.assertFalse(writer.wait(os.path.join(self.directory, 'missing.jpg')))
+        self.assertFalse(writer.wait(None))
+
+    def test_queue_is_bounded(self):
+        writer = ImageWriter(workers=1, max_queue=2)
+        handles = [writer.submit(self.frame, os.path.join(self.directory, f'{i}.jpg')) for i in range(6)]
+        writer.flush()
+        self.assertTrue(all(os.path.exists(handle.path) for handle in handles))
+        self.assertLessEqual(writer.metrics()['queue_depth'], 2)
+
+    def test_failed_write_is_reported(self):
+        writer = ImageWriter()
+        handle = writer.submit(np.zeros((0, 0, 3), dtype=np.uint8), os.path.join(self.directory, 'empty.jpg'))
+        with self.assertRaises(Exception):
+            handle.result()
+        self.assertEqual(writer.metrics()['failed'], 1)
+
+
+class LatencyHistogramTests(SimpleTestCase):
+    def test_percentiles_within_precision(self):
+        histogram = LatencyHistogram(precision=0.02)
+        samples = np.random.default_rng(6).lognormal(np.log(0.05), 0.5, size=5000)
+        for seconds in samples:
+            histogram.record(seconds)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 5000)
+        for p in (50, 90, 99):
+            exact = np.percentile(samples, p) * 1000
+            self.assertAlmostEqual(summary[f'p{p}'] / exact, 1.0, delta=0.03)
+
+    def test_window_rotation(self):
+        histogram = LatencyHistogram(window=10.0)
+        histogram.record(0.01)
+        histogram._rotate(histogram._rotated_at + 5)   # Half a window: still counted
+        self.assertEqual(histogram.summary()['count'], 1)
+        histogram._rotate(histogram._rotated_at + 10)  # A full window later: gone
+        summary = histogram.summary()
+        self.assertEqual((summary['count'], summary['total_count'], summary['p50']), (0, 1, None))
+
+
+class StageTimerTests(SimpleTestCase):
+    def test_nested_inspections_share_one_record(self):
+        timer = StageTimer()
+
+        class Service:
+            stage_timer = timer
+
+            @timed_stage('merge')
+            def merge(self):
+                return 'merged'
+
+        with timer.inspection() as outer:
+            with timer.stage('decode'):
+                pass
+            with timer.inspection() as inner:
+                self.assertIs(inner, outer)
+                self.assertEqual(Service().merge(), 'merged')
+                Service().merge()
+            self.assertEqual(timer.metrics()['stages'], {})  # Recorded when the outermost one exits
+        stages = timer.metrics()['stages']
+        self.assertEqual(sorted(stages), ['decode', 'merge'])
+        self.assertEqual(stages['merge']['count'], 1)  # Both merges add up to one inspection's stage
+
+    def test_stage_outside_inspection_is_not_recorded(self):
+        timer = StageTimer()
+        with timer.stage('decode'):
+            pass
+        self.assertEqual(timer.metrics()['stages'], {})
+        self.assertEqual(StageTimer.as_ms({'decode': 0.0123456}), {'decode': 12.346})
+
+
+class StubEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.frame = np.random.default_rng(7).integers(0, 255, size=(480, 640, 3), dtype=np.uint8)
+
+    def test_deterministic_per_frame(self):
+        engine = StubEngine(call_ms=0, image_ms=0, missing_rate=0.5)
+        first, second = engine.predict([self.frame, self.frame.copy()], conf=0.0)
+        np.testing.assert_array_equal(first.boxes, second.boxes)
+        np.testing.assert_array_equal(first.class_ids, second.class_ids)
+        other = engine.predict([255 - self.frame], conf=0.0)[0]
+        self.assertFalse(np.array_equal(first.confidences, other.confidences))
+
+        # One box per nut position plus the clutter, filtered and capped like a real engine
+        self.assertEqual(len(first), len(STUB_NUT_POSITIONS) + engine.clutter)
+        filtered = engine.predict([self.frame], conf=0.5, max_det=2)[0]
+        self.assertLessEqual(len(filtered), 2)
+        self.assertTrue((filtered.confidences >= 0.5).all())
+        self.assertTrue((np.diff(filtered.confidences) <= 0).all())
+
+    def test_boxes_around_nut_positions(self):
+        detections = StubEngine(call_ms=0, image_ms=0, clutter=0).predict([self.frame], conf=0.0)[0]
+        centers = detections.centers() / (640, 480)
+        distances = np.abs(centers[:, None, :] - np.asarray(STUB_NUT_POSITIONS)[None]).max(axis=2)
+        self.assertTrue((distances.min(axis=1) < 0.02).all())
+
+    def test_latency_scales_with_input_size(self):
+        engine = StubEngine(call_ms=0, image_ms=20)
+        start_time = time.perf_counter()
+        engine.predict([self.frame], imgsz=320)
+        small = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        engine.predict([self.frame, self.frame])
+        self.assertGreaterEqual(time.perf_counter() - start_time, 0.04)
+        self.assertLess(small, 0.04)
+
+
+class _PassLogEngine(StubEngine):
+    """Zero-latency StubEngine that records the method of every predict call"""
+
+    def __init__(self, **kwargs):
+        super().__init__(call_ms=0, image_ms=0, clutter=0, missing_rate=0.0, **kwargs)
+        self.calls = []
+
+    def predict(self, images, conf=0.25, iou=0.45, max_det=300, imgsz=None, method='unknown'):
+        self.calls.append(method)
+        return super().predict(images, conf=conf, iou=iou, max_det=max_det, imgsz=imgsz, method=method)
+
+
+def stub_service(engine=None, **config):
+    """Detection service on a zero-latency StubEngine with config overrides; annotations are not stored"""
+    from .services import FlexibleNutDetectionService
+    service = FlexibleNutDetectionService(engine=engine or StubEngine(call_ms=0, image_ms=0, clutter=0))
+    service.config = MappingProxyType({**service.config, **config})
+    service._annotate = lambda *args, **kwargs: (None, None)
+    return service
+
+
+class ProcessWithModelTests(SimpleTestCase):
+    def test_rejected_frame_is_retake_not_error(self):
+        from .simple_auth_views import _process_with_yolov8_model
+        service = stub_service(quality_gate='enforce')
+        blank = np.full((480, 640, 3), 128, dtype=np.uint8)  # No edges, no sharpness
+        with mock.patch('ml_api.services.get_detection_service', return_value=service):
+            result = _process_with_yolov8_model('blank.jpg', 'RETAKE1', frame=blank)
+        self.assertFalse(result['success'])
+        self.assertTrue(result['retake'])
+        self.assertEqual(result['decision']['status'], 'RETAKE')
+        self.assertIn(SHARPNESS, result['quality']['failed'])
+
+
+class _CentredBoxEngine:
+    """One PRESENT box in the middle of every crop, with the given confidence per crop"""
+    name = 'centred'
+
+    def __init__(self, confidences):
+        self.confidences = confidences
+
+    def predict(self, images, **kwargs):
+        return [Detections([[image.shape[1] * 0.4, image.shape[0] * 0.4, image.shape[1] * 0.6, image.shape[0] * 0.6]],
+                           [confidence], [CLASS_PRESENT])
+                for image, confidence in zip(images, self.confidences)]
+
+
+class RoiDetectionTests(SimpleTestCase):
+    def setUp(self):
+        self.frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def _service(self, confidences):
+        service = stub_service(roi_mode=True, fallback_confidence=0.25)
+        service.engine = _CentredBoxEngine(confidences)
+        service.fixture_layout = FixtureLayout.from_boxes(
+            [[150, 100, 230, 180], [410, 100, 490, 180], [150, 300, 230, 380], [410, 300, 490, 380]], self.frame.shape)
+        return service
+
+    def test_confident_regions_skip_the_full_frame(self):
+        service = self._service([0.9, 0.8, 0.3, 0.7])
+        detections = service._run_roi_detection(self.frame, service.config)
+        self.assertEqual(detections.methods.tolist(), ['roi_nut1', 'roi_nut2', 'roi_nut3', 'roi_nut4'])
+        self.assertEqual(service.stats['roi_detection_count'], 1)
+
+    def test_region_below_fallback_confidence_uses_the_full_frame(self):
+        service = self._service([0.9, 0.8, 0.1, 0.7])  # Only an ultra-low box in region 3
+        self.assertIsNone(service._run_roi_detection(self.frame, service.config))
+        self.assertEqual(service.stats['roi_fallback_count'], 1)
+
+
+class DetectionServiceTests(SimpleTestCase):
+    """process_frame end to end on the StubEngine"""
+
+    def setUp(self):
+        self.frame = np.random.default_rng(3).integers(0, 255, size=(480, 640, 3), dtype=np.uint8)
+
+    def test_incomplete_frame_escalates_in_cascade_order(self):
+        engine = _PassLogEngine(confidence_range=(0.15, 0.2))  # Below the primary and fallback tiers
+        result = stub_service(engine, quality_gate='off', roi_mode=False).process_frame(self.frame, 'P1')
+        self.assertTrue(result['success'])
+        # Tiered pass, the batched enhancement variants, then every multi-scale size
+        self.assertEqual(engine.calls, ['tiered', 'unknown', 'multi_scale_480', 'multi_scale_800', 'multi_scale_1024'])
+
+    def test_complete_primary_pass_ends_the_cascade(self):
+        engine = _PassLogEngine(confidence_range=(0.6, 0.95))
+        service = stub_service(engine, quality_gate='off', roi_mode=False)
+        result = service.process_frame(self.frame, 'P1')
+        self.assertEqual(engine.calls, ['tiered'])
+        self.assertEqual(result['decision']['status'], 'ALL_NUTS_PRESENT')
+        self.assertIn('enhancement', service.stats['early_termination'][ALL_POSITIONS_FOUND])
+
+    def test_default_config_keeps_the_incomplete_status(self):
+        # Two positions filled, one of them a confident MISSING nut
+        detections = Detections([[0, 0, 10, 10], [50, 50, 60, 60]], [0.9, 0.8], [CLASS_MISSING, CLASS_PRESENT])
+        service = stub_service()
+        self.assertFalse(service.config['early_termination'])
+        self.assertEqual(service._apply_business_logic(detections, 'P1')['status'], 'INCOMPLETE_DETECTION')
+        opted_in = stub_service(early_termination=True)
+        self.assertEqual(opted_in._apply_business_logic(detections, 'P1')['status'], 'NUTS_MISSING')
+
+    def test_degraded_profile_flags_only_skipped_passes(self):
+        service = stub_service(_PassLogEngine(confidence_range=(0.15, 0.2)), qos_degraded_passes=('fallback',))
+        policy = CascadePolicy.from_config(service.config, degraded=True)
+        service._run_detection(self.frame, 'P1', True, service.config, policy)
+        self.assertEqual(policy.degraded_skips, ['enhancement', 'multi_scale', 'ultra_low'])
+
+        service = stub_service(_PassLogEngine(confidence_range=(0.6, 0.95)))
+        policy = CascadePolicy.from_config(service.config, degraded=True)
+        service._run_detection(self.frame, 'P1', True, service.config, policy)
+        self.assertEqual(policy.degraded_skips, [])
+
+    def _roi_service(self, engine):
+        service = stub_service(engine, quality_gate='off', roi_mode=True)
+        # Regions around the stub's nut positions on a 640x480 frame
+        service.fixture_layout = FixtureLayout.from_boxes(
+            [[163, 115, 221, 173], [419, 115, 477, 173], [163, 307, 221, 365], [419, 307, 477, 365]],
+            self.frame.shape)
+        return service
+
+    def test_roi_mode_settles_confident_regions(self):
+        engine = _PassLogEngine(confidence_range=(0.6, 0.95))
+        service = self._roi_service(engine)
+        result = service.process_frame(self.frame, 'P1')
+        self.assertEqual(engine.calls, ['roi'])
+        self.assertEqual(result['detection_summary']['total_detections'], 4)
+        self.assertEqual(service.stats['roi_detection_count'], 1)
+
+    def test_roi_mode_falls_back_to_the_full_frame(self):
+        engine = _PassLogEngine(confidence_range=(0.15, 0.2))
+        service = self._roi_service(engine)
+        service.process_frame(self.frame, 'P1')
+        self.assertEqual(engine.calls[:2], ['roi', 'tiered'])
+        self.assertEqual(service.stats['roi_fallback_count'], 1)
+
+    def test_cache_hit_and_threshold_change_invalidates_it(self):
+        engine = _PassLogEngine(confidence_range=(0.6, 0.95))
+        service = stub_service(engine, quality_gate='off', roi_mode=False)
+        self.assertFalse(service.process_frame(self.frame, 'P1')['cached'])
+        self.assertTrue(service.process_frame(self.frame.copy(), 'P1')['cached'])
+        self.assertEqual(len(engine.calls), 1)
+
+        service.update_confidence_levels(primary=0.4)
+        self.assertFalse(service.process_frame(self.frame, 'P1')['cached'])
+        self.assertEqual(len(engine.calls), 2)
+
+    def test_rejected_frame_is_retake_without_inference(self):
+        engine = _PassLogEngine()
+        service = stub_service(engine, quality_gate='enforce')
+        result = service.process_frame(np.full((480, 640, 3), 128, dtype=np.uint8), 'P1')
+        self.assertFalse(result['success'])
+        self.assertTrue(result['retake'])
+        self.assertEqual(result['decision']['status'], 'RETAKE')
+        self.assertEqual(engine.calls, [])
+        self.assertEqual(service.stats['quality_retakes'], 1)
+
+    def test_deleted_upload_still_has_an_annotated_image(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(MEDIA_ROOT=directory):
+            service = stub_service(quality_gate='off', roi_mode=False, annotation_mode='lazy')
+            del service._annotate  # Store annotations for real, in the temporary directory
+            service.annotations = AnnotationStore(os.path.join(directory, 'annotations'))
+            upload_path = os.path.join(directory, 'upload.jpg')
+            cv2.imwrite(upload_path, self.frame)
+
+            result = service.process_image_with_id(upload_path, 'U1', ephemeral_source=True)
+            os.unlink(upload_path)  # As the upload views do
+
+            self.assertIsNotNone(result['annotated_image_path'])
+            jpeg = service.render_annotated_image('U1')
+            get_image_writer().flush()
+        self.assertIsNotNone(jpeg)
+        self.assertEqual(cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR).shape, self.frame.shape)
@@ -49,7 +49,9 @@ from .views import (
     disable_trigger_mode,
     get_trigger_status,
     test_trigger_workflow,
-    get_recent_trigger_results
+    get_recent_trigger_results,
+    # Annotated result images rendered on demand
+    annotated_image
 )
 
 app_name = 'ml_api'
@@ -119,5 +121,8 @@ urlpatterns = [
     path('camera/trigger/test/', test_trigger_workflow, name='test_trigger_workflow'),
     path('trigger/recent-results/', get_recent_trigger_results, name='get_recent_trigger_results'),
 
+    # 🖼️ ANNOTATED RESULTS (rendered on demand, ?size=<px> for thumbnails)
+    path('annotated/<str:image_id>/', annotated_image, name='annotated_image'),
+
     
 ]
\ No newline at end of file
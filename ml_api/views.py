@@ -15,7 +15,7 @@ logger = logging.getLogger(__name__)
 
 # Import the nut detection service
 try:
-    from .services import enhanced_nut_detection_service
+    from .services import get_detection_service
     SERVICE_AVAILABLE = True
 except ImportError as e:
     logger.error(f"Failed to import nut detection service: {e}")
@@ -37,7 +37,8 @@ class NutDetectionView(APIView):
         # Initialize detection service once
         if SERVICE_AVAILABLE:
             try:
-                self.detection_service = enhanced_nut_detection_service  # Fixed: removed ()
+                # In-process service, or the inference daemon client with DAEMON_ENABLED
+                self.detection_service = get_detection_service()
                 logger.info("Nut detection service initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize nut detection service: {e}")
@@ -93,7 +94,8 @@ class NutDetectionView(APIView):
                     result = self.detection_service.process_image_with_id(
                         image_path=temp_file.name,
                         image_id=f"upload_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                        user_id=getattr(request.user, 'id', None) if hasattr(request, 'user') else None
+                        user_id=getattr(request.user, 'id', None) if hasattr(request, 'user') else None,
+                        ephemeral_source=True  # The temp file is deleted below
                     )
                     
                     # Add text analysis if provided
@@ -157,23 +159,39 @@ class NutDetectionView(APIView):
             # Check if service is available
             service_available = self.detection_service is not None
             model_loaded = False
+            service_health = {}
             
             if service_available:
-                # Check if model is actually loaded
-                model_loaded = (
-                    hasattr(self.detection_service, 'model') and 
-                    self.detection_service.model is not None
-                )
+                # Check if model is actually loaded (does not trigger loading)
+                service_health = self.detection_service.is_healthy()
+                model_loaded = service_health['model_loaded']
+                service_available = service_health['service_available']
+            
+            if model_loaded:
+                health_state = 'healthy'
+            elif service_available:
+                health_state = 'starting'  # Model not loaded yet (preload running or first inspection pending)
+            else:
+                health_state = 'unhealthy'
             
             health_status = {
                 'success': True,
                 'service': 'Industrial Nut Detection API',
-                'status': 'healthy' if model_loaded else 'unhealthy',
+                'status': health_state,
                 'service_available': service_available,
                 'model_loaded': model_loaded,
                 'timestamp': datetime.now().isoformat()
             }
             
+            # Startup time, warm-up and first-inference latency
+            if 'startup' in service_health:
+                health_status['startup'] = service_health['startup']
+                health_status['inference_engine'] = service_health['inference_engine']
+            
+            # Standalone inference daemon (when web workers do not hold the model)
+            if 'daemon' in service_health:
+                health_status['inference_daemon'] = service_health['daemon']
+            
             if service_available and hasattr(self.detection_service, 'model_path'):
                 health_status['model_path'] = self.detection_service.model_path
                 
@@ -187,10 +205,12 @@ class NutDetectionView(APIView):
                     logger.warning(f"Could not get statistics: {e}")
             
             if not model_loaded:
-                if not service_available:
+                if self.detection_service is None:
                     health_status['error'] = 'Service not available - check imports and dependencies'
+                elif not service_available:
+                    health_status['error'] = f"Model failed to load - {service_health.get('load_error')}"
                 else:
-                    health_status['error'] = 'Model not loaded - check model file path and format'
+                    health_status['error'] = 'Model not loaded yet - it loads on startup preload or first inspection'
             
             return Response(health_status, status=status.HTTP_200_OK)
             
@@ -229,7 +249,7 @@ class NutDetectionBase64View(APIView):
         super().__init__(**kwargs)
         if SERVICE_AVAILABLE:
             try:
-                self.detection_service = enhanced_nut_detection_service()
+                self.detection_service = get_detection_service()
             except Exception as e:
                 logger.error(f"Failed to initialize nut detection service: {e}")
                 self.detection_service = None
@@ -259,8 +279,13 @@ class NutDetectionBase64View(APIView):
                 image_data = base64.b64decode(image_base64)
                 image = Image.open(io.BytesIO(image_data))
                 
-                # Process with nut detection
-                result = self.detection_service.process_image_from_pil(image, "base64_image")
+                # Process with nut detection (decoded in memory, so the annotated image is rendered eagerly)
+                frame = cv2.cvtColor(np.asarray(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+                result = self.detection_service.process_frame(
+                    frame,
+                    f"base64_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                    image_name="base64_image"
+                )
                 
                 # Add text analysis if provided
                 if text_input:
@@ -330,11 +355,14 @@ import time
 import json
 import ctypes
 import tempfile
-from django.http import JsonResponse, StreamingHttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.contrib.auth.decorators import login_required
 from django.conf import settings
 
+from .image_writer import get_image_writer
+
 # In your ml_api/views.py file, replace the camera import section with this SIMPLE version:
 
 # Add camera drivers to path
@@ -716,42 +744,42 @@ class HikrobotCameraManager:
             return None
     
     def _save_and_process_triggered_image(self, frame):
-        """Save triggered image and initiate the SAME processing workflow as 'Capture & Process' button"""
+        """
+        Save triggered image and initiate the SAME processing workflow as 'Capture & Process' button
+
+        The frame is handed to the processing thread at once; the original is
+        encoded and written by the background image writer in parallel.
+        """
         try:
             # Save the triggered image to the same location as manual captures
             original_dir = os.path.join(settings.MEDIA_ROOT, 'inspections', 'original')
-            os.makedirs(original_dir, exist_ok=True)
             
             # Generate filename with trigger count
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             trigger_image_id = f"TRIGGER_{self.trigger_count:04d}_{timestamp}"
             filename = f"{trigger_image_id}_camera.jpg"
-            filepath = os.path.join(original_dir, filename)
             
-            # Save image
-            success = cv2.imwrite(filepath, frame)
+            # Queue the image (format from IMAGE_FORMATS['original']); inference does not wait for it
+            write_handle = get_image_writer().submit(frame, os.path.join(original_dir, filename), 'original')
+            filepath = write_handle.path
+            filename = os.path.basename(filepath)
+            logger.info(f"💾 Triggered image queued for writing: {filename}")
+            
+            # Process using the EXACT SAME workflow as the manual "Capture & Process" button
+            processing_thread = threading.Thread(
+                target=self._execute_full_capture_and_process_workflow,
+                args=(filepath, filename, trigger_image_id, frame, write_handle),
+                daemon=True
+            )
+            processing_thread.start()
             
-            if success:
-                logger.info(f"💾 Triggered image saved: {filename}")
-                
-                # Process using the EXACT SAME workflow as the manual "Capture & Process" button
-                processing_thread = threading.Thread(
-                    target=self._execute_full_capture_and_process_workflow,
-                    args=(filepath, filename, trigger_image_id),
-                    daemon=True
-                )
-                processing_thread.start()
-                
-                return filepath
-            else:
-                logger.error(f"❌ Failed to save triggered image: {filename}")
-                return None
+            return filepath
                 
         except Exception as e:
             logger.error(f"Error saving triggered image: {e}")
             return None
     
-    def _execute_full_capture_and_process_workflow(self, image_path, filename, image_id):
+    def _execute_full_capture_and_process_workflow(self, image_path, filename, image_id, frame=None, write_handle=None):
         """Execute the EXACT SAME workflow as the manual 'Capture & Process' button"""
         try:
             logger.info(f"🔄 Starting FULL triggered workflow for: {image_id}")
@@ -760,7 +788,22 @@ class HikrobotCameraManager:
             from .simple_auth_views import _process_with_yolov8_model
             
             # Process with YOLOv8 model (SAME AS MANUAL CAPTURE)
-            processing_result = _process_with_yolov8_model(image_path, image_id)
+            # The in-memory frame is reused so the saved JPEG is not decoded again
+            processing_result = _process_with_yolov8_model(image_path, image_id, frame=frame)
+            
+            if processing_result.get('retake'):
+                # Quality gate rejected the frame: no inspection is stored, the part must be re-imaged
+                logger.warning(f"🔁 Triggered frame for {image_id} needs a retake: {processing_result['error']}")
+                self._write_trigger_summary({
+                    'trigger_count': self.trigger_count,
+                    'image_id': image_id,
+                    'overall_result': 'RETAKE',
+                    'retake': True,
+                    'error': processing_result['error'],
+                    'quality': processing_result.get('quality'),
+                    'processed_at': datetime.now().isoformat()
+                })
+                return
             
             if not processing_result['success']:
                 logger.error(f"❌ YOLOv8 processing failed: {processing_result.get('error', 'Unknown error')}")
@@ -848,6 +891,13 @@ class HikrobotCameraManager:
                     annotated_filename = f"{image_id}_{timestamp_new}_result.jpg"
                     annotated_image_path = os.path.join(results_dir, annotated_filename)
             
+            # The storage service copies the original from disk: wait for the background write
+            if write_handle is not None:
+                try:
+                    write_handle.result()
+                except Exception as e:
+                    logger.error(f"❌ Failed to save triggered image {filename}: {e}")
+            
             # ============================================================================
             # 🆕 ENHANCED FUNCTIONALITY - OK/NG STORAGE (SAME AS MANUAL CAPTURE)
             # ============================================================================
@@ -874,7 +924,10 @@ class HikrobotCameraManager:
                     nuts_present=present_count,
                     nuts_absent=missing_count,
                     confidence_scores=confidence_scores,
-                    processing_time=detection_data.get('processing_time', 0.0)
+                    processing_time=detection_data.get('processing_time', 0.0),
+                    qos_profile=detection_data.get('qos_profile', 'full'),
+                    reinspection_required=detection_data.get('reinspection_required', False),
+                    quality=detection_data.get('quality')
                 )
 
                 if enhanced_inspection and enhanced_inspection.test_status == 'OK':
@@ -925,6 +978,8 @@ class HikrobotCameraManager:
             logger.info(f"🎯 Enhanced Storage: {enhanced_storage_success}")
             logger.info(f"🎯 Storage Folder: {enhanced_folder}")
             logger.info(f"🎯 Database ID: {inspection.id}")
+            if detection_data.get('reinspection_required'):
+                logger.warning(f"🎯 Inspected with the degraded QoS profile - re-inspect {image_id}")
             
             # Save summary result for potential UI integration
             trigger_summary = {
@@ -936,27 +991,34 @@ class HikrobotCameraManager:
                 'enhanced_storage': enhanced_storage_success,
                 'storage_folder': enhanced_folder,
                 'database_id': str(inspection.id),
+                'qos_profile': detection_data.get('qos_profile', 'full'),
+                'reinspection_required': detection_data.get('reinspection_required', False),
+                'quality': detection_data.get('quality'),
                 'processed_at': datetime.now().isoformat(),
                 'file_transfer_attempted': enhanced_inspection and enhanced_inspection.test_status == 'OK' if enhanced_inspection else False
             }
             
             # Save trigger summary
-            summary_path = os.path.join(settings.MEDIA_ROOT, 'camera_captures', 'trigger_summaries')
-            os.makedirs(summary_path, exist_ok=True)
-            
-            summary_filename = f"trigger_summary_{self.trigger_count:04d}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            summary_filepath = os.path.join(summary_path, summary_filename)
-            
-            with open(summary_filepath, 'w') as f:
-                json.dump(trigger_summary, f, indent=2, default=str)
-            
-            logger.info(f"📋 Triggered workflow summary saved: {summary_filename}")
+            self._write_trigger_summary(trigger_summary)
                 
         except Exception as e:
             logger.error(f"❌ Error in triggered workflow execution: {e}")
             import traceback
             logger.error(f"❌ Full traceback: {traceback.format_exc()}")
     
+    def _write_trigger_summary(self, trigger_summary):
+        """Save a triggered workflow summary for potential UI integration"""
+        summary_path = os.path.join(settings.MEDIA_ROOT, 'camera_captures', 'trigger_summaries')
+        os.makedirs(summary_path, exist_ok=True)
+        
+        summary_filename = f"trigger_summary_{self.trigger_count:04d}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        summary_filepath = os.path.join(summary_path, summary_filename)
+        
+        with open(summary_filepath, 'w') as f:
+            json.dump(trigger_summary, f, indent=2, default=str)
+        
+        logger.info(f"📋 Triggered workflow summary saved: {summary_filename}")
+    
     def get_trigger_status(self):
         """Get current trigger mode status with recent processing info"""
         status = {
@@ -986,8 +1048,8 @@ class HikrobotCameraManager:
         
         return status
     
-    def capture_manual_override(self, save_path=None):
-        """Force manual capture even in trigger mode by temporarily switching modes"""
+    def capture_manual_override(self, save_path=None, wait=True):
+        """Force manual capture even in trigger mode by temporarily switching modes (``wait`` as in capture_image)"""
         try:
             logger.info("🎯 Manual capture override requested...")
             
@@ -1031,7 +1093,7 @@ class HikrobotCameraManager:
                 time.sleep(0.5)
             
             # Capture the image
-            result = self.capture_image(save_path)
+            result = self.capture_image(save_path, wait=wait)
             
             # If we were in trigger mode, switch back
             if was_trigger_mode:
@@ -1205,8 +1267,14 @@ class HikrobotCameraManager:
             logger.error(f"❌ Frame capture error: {e}")
             return None
     
-    def capture_image(self, save_path=None):
-        """Capture and save a single image"""
+    def capture_image(self, save_path=None, wait=True):
+        """
+        Capture and save a single image
+
+        The image is written by the background image writer. With wait=False
+        the call returns as soon as the frame exists: the result also carries
+        'frame' and the 'write' handle, and 'size' is None until written.
+        """
         try:
             logger.info("📸 Starting image capture...")
             
@@ -1231,30 +1299,41 @@ class HikrobotCameraManager:
             if save_path is None:
                 save_path = os.path.join(settings.MEDIA_ROOT, 'captures')
             
-            # Create save directory if it doesn't exist
-            os.makedirs(save_path, exist_ok=True)
             logger.info(f"📁 Save path: {save_path}")
             
             # Generate filename
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]  # milliseconds
             filename = f"hikrobot_capture_{timestamp}.jpg"
-            filepath = os.path.join(save_path, filename)
             
-            # Save image
-            success = cv2.imwrite(filepath, frame)
+            # Queue the image (format from IMAGE_FORMATS['capture'])
+            write_handle = get_image_writer().submit(frame, os.path.join(save_path, filename), 'capture')
+            filepath = write_handle.path
+            filename = os.path.basename(filepath)
             
-            if success:
-                file_size = os.path.getsize(filepath)
-                logger.info(f"💾 Image saved successfully: {filename} ({file_size} bytes)")
+            if not wait:
                 return True, {
                     'filename': filename,
                     'filepath': filepath,
-                    'size': file_size,
-                    'timestamp': timestamp
+                    'size': None,
+                    'timestamp': timestamp,
+                    'frame': frame,
+                    'write': write_handle
                 }
-            else:
+            
+            try:
+                write_handle.result()
+            except Exception:
                 logger.error("❌ Failed to save image")
                 return False, "Failed to save image"
+            
+            file_size = os.path.getsize(filepath)
+            logger.info(f"💾 Image saved successfully: {filename} ({file_size} bytes)")
+            return True, {
+                'filename': filename,
+                'filepath': filepath,
+                'size': file_size,
+                'timestamp': timestamp
+            }
                 
         except Exception as e:
             logger.error(f"❌ Capture error: {str(e)}")
@@ -1587,6 +1666,39 @@ def get_recent_trigger_results(request):
         })
 
 
+@login_required
+@require_http_methods(["GET"])
+def annotated_image(request, image_id):
+    """
+    Annotated result image of the newest inspection of ``image_id``, rendered on demand
+
+    ?size=<px> returns a thumbnail with that longest side. Renders are kept in
+    the service's bounded render cache. While the part's source frame is still
+    being written the response is 409 (retry shortly).
+    """
+    if not SERVICE_AVAILABLE:
+        return JsonResponse({'success': False, 'error': 'Detection service not available'}, status=503)
+    try:
+        max_size = int(request.GET['size']) if request.GET.get('size') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'size must be an integer'}, status=400)
+    if max_size is not None and max_size < 16:
+        return JsonResponse({'success': False, 'error': 'size must be at least 16'}, status=400)
+
+    detection_service = get_detection_service()
+    if detection_service.annotations is not None and detection_service.annotations.source_pending(image_id):
+        response = JsonResponse({'success': False, 'error': f'Image for {image_id} is still being saved'},
+                                status=409)
+        response['Retry-After'] = '1'
+        return response
+    jpeg = detection_service.render_annotated_image(image_id, max_size)
+    if jpeg is None:
+        return JsonResponse({'success': False, 'error': f'No annotated image for {image_id}'}, status=404)
+    response = HttpResponse(jpeg, content_type='image/jpeg')
+    response['Cache-Control'] = 'private, max-age=300'
+    return response
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def test_trigger_workflow(request):
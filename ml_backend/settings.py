@@ -195,6 +195,109 @@ QR_SCANNER_CONFIG = {
 # YOLOv8 Model Configuration
 NUT_DETECTION_MODEL_PATH = os.path.join(BASE_DIR, 'models', 'industrial_nut_detection.pt')
 
+# Inference engine for the nut detector
+NUT_DETECTION_CONFIG = {
+    'ENGINE': 'pytorch',           # 'pytorch' (Ultralytics), 'pytorch_lean', 'onnxruntime', 'openvino' (CPU) or 'stub' (no model)
+    'ENGINE_THREADS': None,        # CPU threads for the runtime (None = runtime default)
+    'EXPORT_IMGSZ': 640,           # Input size used when exporting the .pt model
+    'FALLBACK_TO_PYTORCH': True,   # Use the .pt model if the selected runtime cannot load
+
+    # INT8 model from "python manage.py quantize_nut_model" (onnxruntime engine only)
+    'USE_INT8': True,                      # Use it when its report passes the gate below
+    'INT8_MIN_DECISION_AGREEMENT': 0.995,  # Minimum OK/NG agreement with the FP32 model
+    'INT8_MAX_FALSE_OK': 0,                # Parts INT8 passed but FP32 rejected
+
+    # Startup: the model loads lazily; server processes preload and warm it up in the background
+    'PRELOAD_ON_STARTUP': True,            # runserver / gunicorn / uvicorn only (not manage.py commands)
+    'WARMUP_ENABLED': True,
+    'WARMUP_RUNS': 1,
+    'WARMUP_SIZES': None,                  # None = target size + multi-scale sizes
+    'WARMUP_FRAME_SHAPE': (1080, 1440),    # Dummy frame (height, width) - match the camera resolution
+
+    # Concurrency: all forward passes go through one FIFO queue served by MODEL_REPLICAS engines
+    'MODEL_REPLICAS': 1,                   # Model copies (RAM x N); keep ENGINE_THREADS x N <= CPU cores
+
+    # Micro-batching: concurrent inspections share forward passes with identical parameters
+    'MICRO_BATCHING': True,
+    'BATCH_MAX_SIZE': 8,                   # Images per batched forward pass
+    'BATCH_MAX_DELAY_MS': 5.0,             # Longest wait for other requests (skipped when only one part is in flight)
+
+    # Standalone inference daemon ("python manage.py run_inference_daemon") shared by all web workers
+    'DAEMON_ENABLED': False,
+    'DAEMON_SOCKET': '/tmp/nut_inference.sock',  # Unix-domain socket (Linux)
+    'DAEMON_USE_TCP': False,               # Force localhost TCP (automatic on Windows)
+    'DAEMON_HOST': '127.0.0.1',
+    'DAEMON_PORT': 8765,
+    'DAEMON_TIMEOUT': 30.0,                # Seconds per request
+    'DAEMON_FALLBACK_TO_LOCAL': True,      # Process in-process if the daemon is unreachable
+
+    # Fixture-registered ROI inference ("python manage.py register_fixture_layout --image <reference>")
+    'FIXTURE_LAYOUT_PATH': os.path.join(BASE_DIR, 'models', 'fixture_layout.json'),
+    'ROI_MODE': False,                     # Detect on padded crops of the four nut regions (full frame if one has no box >= fallback)
+    'ROI_MARGIN': 0.5,                     # Crop padding per side, fraction of the region size
+    'ROI_IMGSZ': 320,                      # Inference size of the crops
+
+    # Second-stage crop verifier ("python manage.py train_crop_verifier"); replaces the ultra-low passes
+    'CROP_VERIFIER_PATH': os.path.join(BASE_DIR, 'models', 'crop_verifier.npz'),
+    'CROP_VERIFIER_ENABLED': True,         # Used when the verifier file exists
+    'CROP_VERIFIER_THRESHOLD': 0.8,        # Min P(PRESENT) or P(MISSING) to accept a crop; unsure crops stay unfilled
+
+    # Classical pre-screen ("python manage.py build_prescreen_templates"); needs the fixture layout
+    'PRESCREEN_PATH': os.path.join(BASE_DIR, 'models', 'prescreen_templates.npz'),
+    'PRESCREEN_MODE': 'off',               # 'off', 'primary_only' (confirm with the primary pass) or 'skip' (no YOLO)
+    'PRESCREEN_THRESHOLD': 0.9,            # Min template correlation, every nut region
+    'PRESCREEN_AUDIT_RATE': 0.05,          # Share of passed parts still run through the full pipeline
+
+    # Content-hash result cache: re-uploads and retries of identical frames skip detection
+    'RESULT_CACHE_ENABLED': True,
+    'RESULT_CACHE_SIZE': 256,              # Entries (LRU)
+    'RESULT_CACHE_MAX_AGE': 3600.0,        # Seconds
+    'RESULT_CACHE_DIR': None,              # Directory to persist entries across restarts (None = memory only)
+    'RESULT_CACHE_LIVE_FRAMES': False,     # Also hash camera/trigger frames (~30 ms per 5 MP frame, they never repeat)
+
+    # Early termination: stop escalating once further passes cannot change the OK/NG decision.
+    # Opt-in: a part with unfilled positions and a confident MISSING nut is then reported as
+    # NUTS_MISSING instead of INCOMPLETE_DETECTION (the cascade still stops once all four are found)
+    'EARLY_TERMINATION': False,
+    'EARLY_STOP_MISSING_CONFIDENCE': 0.5,  # One MISSING nut at or above this settles the part as NG
+
+    # Load-aware QoS: under backlog new parts get a cheaper cascade and are flagged for re-inspection
+    'QOS_TAKT_TIME': None,                 # Line takt time in seconds per part (None = QoS off)
+    'QOS_ENTER_PRESSURE': 1.0,             # Degrade when in-flight parts x average latency exceeds this many takts
+    'QOS_EXIT_PRESSURE': 0.7,              # Back to the full cascade below this
+    'QOS_MAX_BACKLOG': 3,                  # Also degrade with more parts than this in flight
+    'QOS_DEGRADED_PASSES': ('fallback',),  # Escalation passes kept under load (primary always runs)
+    'QOS_REINSPECTION_LOG': os.path.join(MEDIA_ROOT, 'inspections', 'reinspection_queue.jsonl'),
+
+    # Image-quality gate before inference (scores measured on a 320 px grayscale copy)
+    'QUALITY_GATE': 'record',              # 'off', 'record' (score every frame) or 'enforce' (RETAKE failing frames)
+    'QUALITY_MIN_SHARPNESS': 20.0,         # Laplacian variance
+    'QUALITY_MAX_CLIPPED': 0.3,            # Share of crushed-black / blown-white pixels
+    'QUALITY_MIN_MEAN': 25.0,              # Mean gray level range
+    'QUALITY_MAX_MEAN': 230.0,
+    'QUALITY_MIN_EDGE_DENSITY': 0.01,      # Edge pixels in the nut regions (whole frame without a layout)
+
+    # Enhancement pass ("python manage.py benchmark_enhancement" compares the settings)
+    'ENHANCEMENT_MAX_SIZE': None,          # Build the variants on a copy this size (e.g. 640, the inference size); None = full frame
+
+    # Annotations are stored as JSON records (boxes, classes, decision) and rendered by /api/ml/annotated/<image_id>/
+    'ANNOTATION_MODE': 'lazy',             # 'lazy' (render on request) or 'eager' (write a result JPEG per part)
+    'ANNOTATION_DIR': os.path.join(MEDIA_ROOT, 'inspections', 'annotations'),
+    'ANNOTATION_RENDER_CACHE_SIZE': 64,    # Rendered JPEGs kept in memory (per image and size)
+
+    # Background image writer: originals, captures and result images are encoded off the inspection path
+    'IMAGE_WRITER_WORKERS': 2,             # Encoding threads
+    'IMAGE_WRITER_QUEUE': 32,              # Pending images; producers wait beyond this
+    'IMAGE_FORMATS': {                     # Per artifact: jpeg (quality), png (compression) or webp (quality, 101 = lossless)
+        'original': {'format': 'jpeg', 'quality': 95},
+        'capture': {'format': 'jpeg', 'quality': 95},
+        'result': {'format': 'jpeg', 'quality': 95},
+    },
+
+    # Per-stage latency: result['timings'] per inspection, p50/p90/p99 per stage in the health check
+    'STAGE_TIMING_WINDOW': 300.0,          # Seconds of inspections the percentiles cover
+}
+
 # Media files configuration for image storage
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')